@@ -3,15 +3,23 @@ from functools import lru_cache
 from libs.common.rds_service import RdsDataService
 from libs.common.riot_rate_limit_api import RiotRateLimitAPI
 from services.power_level_service import PowerLevelService
-import boto3, os
+import boto3, os, time
 from botocore.config import Config
 
+# seconds the Riot calls of one request may take, rate limit waits and retries included: under the API Gateway
+# integration timeout (29s) so a Riot incident ends in a 503 instead of a gateway timeout
+RIOT_REQUEST_BUDGET = float(os.getenv("RIOT_REQUEST_BUDGET") or 20)
+
 def get_rds(request: Request) -> RdsDataService:
     return request.app.state.rds
 
 def get_http_service(request: Request) -> RiotRateLimitAPI:
     return request.app.state.http_service
 
+def get_riot_deadline() -> float:
+    """Deadline (time.monotonic() value) shared by the Riot calls of the current request"""
+    return time.monotonic() + RIOT_REQUEST_BUDGET
+
 def get_power_level_service(request: Request) -> PowerLevelService:
     return request.app.state.power_level_service
 
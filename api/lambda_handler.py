@@ -1,7 +1,7 @@
 from mangum import Mangum
 from fastapi import Request
 from fastapi.responses import JSONResponse
-from api.main import app
+from api.main import app, flush_metrics
 import logging, uuid, json
 
 log = logging.getLogger()
@@ -29,4 +29,8 @@ def handler(event, context):
         log.info("EVENT %s", json.dumps(event)[:2000])
     except Exception:
         pass
-    return _handler(event, context)
\ No newline at end of file
+    try:
+        return _handler(event, context)
+    finally:
+        # (without the lifespan shutdown the Riot client outlives the invocation, its metrics still go out now)
+        flush_metrics()
\ No newline at end of file
@@ -1,6 +1,8 @@
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from libs.common.rds_service import RdsDataService
 from libs.common.riot_rate_limit_api import RiotRateLimitAPI
+from libs.common.riot_errors import RiotAPIError, RiotCircuitOpen
 from services.power_level_service import PowerLevelService
 from api.power_levels.metrics.routers import router as power_level_metrics_router
 from api.power_levels.routers import router as power_level_router
@@ -10,6 +12,11 @@ import logging, os
 
 log = logging.getLogger(__name__)
 
+def flush_metrics():
+    """Writes the Riot client's buffered EMF metrics (stdout), before the Lambda invocation is frozen"""
+    if (http_service := getattr(app.state, "http_service", None)) is not None:
+        http_service.metrics.flush()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     required = ["DB_ARN", "SECRET_ARN", "DB_NAME", "RIOT_API_KEY", "USER_CREATED_FN_NAME", "KB_ID", "MODEL_ARN"]
@@ -27,7 +34,9 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             log.exception(f"Failed to initialize RDS client, Riot HTTP client, and Power Level service - {e}")
         finally:
-            # shutdown (nothing to close for Data API and Riot HTTP client, but keep the hook)
+            # shutdown (nothing to close for Data API and Riot HTTP client, but keep the hook),
+            # Mangum runs it at the end of every invocation: the client's metrics go out before it's dropped
+            flush_metrics()
             app.state.rds = None
             app.state.http_service = None
             app.state.power_level_service = None
@@ -35,6 +44,13 @@ async def lifespan(app: FastAPI):
 
 app = FastAPI(title="Rift Rewind API", lifespan=lifespan)
 
+# Riot being down/slow is not our bug, tell the client to retry later instead of a generic 500
+@app.exception_handler(RiotAPIError)
+async def _riot_unavailable(request: Request, exc: RiotAPIError):
+    log.warning("Riot API unavailable path=%s error=%s", request.url.path, exc)
+    headers = {"Retry-After": str(int(exc.retry_after) + 1)} if isinstance(exc, RiotCircuitOpen) and exc.retry_after else None
+    return JSONResponse(status_code=503, content={"error": "riot_api_unavailable", "detail": str(exc)}, headers=headers)
+
 @app.get('/')
 def hello_world():
     return {"message": "Hello World!"}
@@ -4,7 +4,7 @@ from libs.common.rds_service import RdsDataService
 from libs.common.riot_rate_limit_api import RiotRateLimitAPI
 from libs.common.constants.queries.power_level_metrics_queries import GET_PLAYER_MATCH_POWER_LEVEL_METRICS_SQL, GET_PLAYER_POWER_LEVEL_METRICS_SQL, CHECK_IF_MATCH_POWER_LEVEL_METRICS_EXISTS_SQL, POWER_LEVEL_METRICS_INSERT_SQL
 from api.power_levels.metrics.dtos import PowerLevelMetrics
-from api.helpers import get_rds, get_http_service, get_power_level_service
+from api.helpers import get_rds, get_http_service, get_power_level_service, get_riot_deadline
 from services.power_level_service import PowerLevelService
 
 router = APIRouter(prefix='/power-levels/{puuid}/metrics', tags=['power-levels-metrics'])
@@ -45,7 +45,7 @@ def upsert(createPowerLevelMetricsDto: PowerLevelMetrics, puuid: Annotated[str,
     return rds.exec(POWER_LEVEL_METRICS_INSERT_SQL, {"puuid": puuid, "match_id": match_id, **createPowerLevelMetricsDto.model_dump()})
 
 @router.post('/generate-by-match-id/{match_id}')
-def generate_metrics_by_match_id(puuid: Annotated[str, Path(title='The Riot PUUID of the player to get')], match_id: Annotated[str, Path(title='The match ID of the match that player is in')], http_service: RiotRateLimitAPI = Depends(get_http_service), power_level_service: PowerLevelService = Depends(get_power_level_service)) -> PowerLevelMetrics:
+def generate_metrics_by_match_id(puuid: Annotated[str, Path(title='The Riot PUUID of the player to get')], match_id: Annotated[str, Path(title='The match ID of the match that player is in')], http_service: RiotRateLimitAPI = Depends(get_http_service), power_level_service: PowerLevelService = Depends(get_power_level_service), riot_deadline: float = Depends(get_riot_deadline)) -> PowerLevelMetrics:
     """
     Generates the metrics of a match based on their given PUUID
 
@@ -54,6 +54,7 @@ def generate_metrics_by_match_id(puuid: Annotated[str, Path(title='The Riot PUUI
         match_id (Annotated[str, Path, optional): _description_. Defaults to 'The match ID of the match that player is in')].
         http_service (RiotRateLimitAPI, optional): _description_. Defaults to Depends(get_http_service).
         power_level_service (PowerLevelService, optional): _description_. Defaults to Depends(get_power_level_service).
+        riot_deadline (float, optional): Deadline of the Riot call. Defaults to Depends(get_riot_deadline).
 
     Raises:
         HTTPException: _description_
@@ -62,7 +63,7 @@ def generate_metrics_by_match_id(puuid: Annotated[str, Path(title='The Riot PUUI
         PowerLevelMetrics: _description_
     """
     # Get the match details from Riot Match-V5 API
-    match_details = http_service.call_endpoint_with_rate_limit('https://americas.api.riotgames.com/lol/match/v5/matches/{match_id}'.format(match_id=match_id))
+    match_details = http_service.get_match(match_id, deadline=riot_deadline)
     
     if player_idx := match_details['metadata']['participants'].index(puuid) == -1:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Player does not exist for given PUUID!")
@@ -1,14 +1,16 @@
 from fastapi import APIRouter, Path, Query, Depends, HTTPException, status
 from typing import Annotated
+from libs.common import json_codec
+from libs.common.power_level_writes import write_power_levels
 from libs.common.rds_service import RdsDataService
 from libs.common.riot_rate_limit_api import RiotRateLimitAPI
-from libs.common.constants.queries.power_level_queries import GET_PLAYER_MATCH_POWER_LEVEL_SQL, GET_PLAYER_POWER_LEVELS_SQL, CHECK_IF_MATCH_POWER_LEVEL_EXISTS_SQL, POWER_LEVEL_INSERT_SQL
+from libs.common.constants.queries.power_level_queries import GET_PLAYER_MATCH_POWER_LEVEL_SQL, GET_PLAYER_POWER_LEVELS_SQL, CHECK_IF_MATCH_POWER_LEVEL_EXISTS_SQL
 from libs.common.constants.queries.power_level_metrics_queries import GET_AGGREGATED_YEARLY_METRICS_SQL
 from libs.common.constants.league_constants import RIFT_WRAPPED_INPUT_PROMPT, RIFT_WRAPPED_GENERATION_PROMPT
 from services.power_level_service import PowerLevelService
 from api.power_levels.dtos import PowerLevel
 from api.power_levels.metrics.dtos import PowerLevelMetrics
-from api.helpers import get_http_service, get_rds, get_power_level_service, get_bedrock_runtime_client
+from api.helpers import get_http_service, get_rds, get_power_level_service, get_bedrock_runtime_client, get_riot_deadline
 import os, boto3, json, logging
 from datetime import datetime, timezone
 from botocore.exceptions import ClientError
@@ -85,7 +87,7 @@ def get_player_power_level_wrapped(puuid: Annotated[str, Path(title='The Riot PU
         
         print(f'body: {body}')
         
-        return json.loads(body) if body and body.strip().startswith("{") else body
+        return json_codec.loads(body) if body and body.strip().startswith("{") else body
         # return body
     except ClientError as ce:
         log.exception('Bedrock runtime client error - %s', ce)
@@ -108,8 +110,13 @@ def upsert(createPowerLevelDto: PowerLevel, puuid: Annotated[str, Path(title='Th
     Returns:
         _type_: _description_
     """
+    # same path as ingestion: the user's running aggregates and the rank norm sketches follow the new power level
+    with rds.transaction() as tx:
+        row = write_power_levels(rds, puuid, [(match_id, createPowerLevelDto.model_dump())], tx)
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User does not exists!")
     
-    return rds.exec(POWER_LEVEL_INSERT_SQL, {"puuid": puuid, "match_id": match_id, **createPowerLevelDto.model_dump()})
+    return row
 
 @router.post('/generate-by-metrics')
 def generate_power_level_by_metrics(metrics: PowerLevelMetrics, power_level_service: PowerLevelService = Depends(get_power_level_service)) -> PowerLevelMetrics:
@@ -131,7 +138,7 @@ def generate_power_level_by_metrics(metrics: PowerLevelMetrics, power_level_serv
     return power_levels
 
 @router.post('/generate-by-match-id/{match_id}')
-def generate_power_level_by_match_id(puuid: Annotated[str, Path(title='The Riot PUUID of the player to get')], match_id: Annotated[str, Path(title='The match ID of the match that player is in')], metrics: PowerLevelMetrics, http_service: RiotRateLimitAPI = Depends(get_http_service), power_level_service: PowerLevelService = Depends(get_power_level_service)) -> PowerLevelMetrics:
+def generate_power_level_by_match_id(puuid: Annotated[str, Path(title='The Riot PUUID of the player to get')], match_id: Annotated[str, Path(title='The match ID of the match that player is in')], metrics: PowerLevelMetrics, http_service: RiotRateLimitAPI = Depends(get_http_service), power_level_service: PowerLevelService = Depends(get_power_level_service), riot_deadline: float = Depends(get_riot_deadline)) -> PowerLevelMetrics:
     """
     Generates the power level of a match based on their match ID
 
@@ -142,11 +149,12 @@ def generate_power_level_by_match_id(puuid: Annotated[str, Path(title='The Riot
         match_id (Annotated[str, Path, optional): _description_. Defaults to 'The match ID of the match that player is in')].
         http_service (RiotRateLimitAPI, optional): _description_. Defaults to Depends(get_http_service).
         power_level_service (PowerLevelService, optional): _description_. Defaults to Depends(get_power_level_service).
+        riot_deadline (float, optional): Deadline of the Riot call. Defaults to Depends(get_riot_deadline).
 
     Returns:
         PowerLevelMetrics: _description_
     """
-    match_details = http_service.call_endpoint_with_rate_limit('https://americas.api.riotgames.com/lol/match/v5/matches/{match_id}'.format(match_id=match_id))
+    match_details = http_service.get_match(match_id, deadline=riot_deadline)
     
     if player_idx := match_details['metadata']['participants'].index(puuid) == -1:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Player does not exist for given PUUID!")
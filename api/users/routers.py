@@ -5,7 +5,7 @@ from libs.common.constants.queries.users_queries import GET_USER_SQL, GET_ALL_US
 from libs.common.constants.league_constants import GET_PLAYER_ACTIVE_REGION_URL, PLAYER_RANK_URL, GET_PLAYER_BY_NAME_URL, LeagueQueue
 from api.users.dtos import CreateUserDto, UpdateUserDto
 from typing import Annotated
-from api.helpers import get_rds, get_lambda_client, get_user_created_fn_name, get_http_service
+from api.helpers import get_rds, get_lambda_client, get_user_created_fn_name, get_http_service, get_riot_deadline
 import boto3, json, logging
 from botocore.exceptions import ClientError
 
@@ -43,7 +43,7 @@ def find_one_by_puuid(puuid: Annotated[str, Path(title='The Riot PUUID of the pl
     return rds.query_one(GET_USER_SQL, {"puuid": puuid})
 
 @router.post('')
-def create(createUserDto: CreateUserDto, rds: RdsDataService = Depends(get_rds), lambda_client: boto3.Session.client = Depends(get_lambda_client), user_created_fn: str = Depends(get_user_created_fn_name), http_service: RiotRateLimitAPI = Depends(get_http_service) ):
+def create(createUserDto: CreateUserDto, rds: RdsDataService = Depends(get_rds), lambda_client: boto3.Session.client = Depends(get_lambda_client), user_created_fn: str = Depends(get_user_created_fn_name), http_service: RiotRateLimitAPI = Depends(get_http_service), riot_deadline: float = Depends(get_riot_deadline) ):
     '''
     Creates a user
     Body:
@@ -54,12 +54,12 @@ def create(createUserDto: CreateUserDto, rds: RdsDataService = Depends(get_rds),
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User already exists!")
     
     # Get player's active region (NA1, KR, etc)
-    active_region_res = http_service.call_endpoint_with_rate_limit(GET_PLAYER_ACTIVE_REGION_URL.format(puuid=createUserDto.puuid))
+    active_region_res = http_service.call_endpoint_with_rate_limit(GET_PLAYER_ACTIVE_REGION_URL.format(puuid=createUserDto.puuid), deadline=riot_deadline)
     
     active_region = active_region_res['region']
     
     # Get player's current rank (we are only doing SOLO ranks to find their "actual" skills)
-    player_rank_res = http_service.call_endpoint_with_rate_limit(PLAYER_RANK_URL.format(region=active_region, puuid=createUserDto.puuid))
+    player_rank_res = http_service.call_endpoint_with_rate_limit(PLAYER_RANK_URL.format(region=active_region, puuid=createUserDto.puuid), deadline=riot_deadline)
     
     player_rank = next((d for d in player_rank_res if d.get("queueType") == LeagueQueue.RANKED_SOLO_5x5.value), {})
         
@@ -71,7 +71,7 @@ def create(createUserDto: CreateUserDto, rds: RdsDataService = Depends(get_rds),
         lambda_client.invoke( # invokes the get player match lambda function when user is created
             FunctionName=user_created_fn,
             InvocationType="Event",        # async
-            Payload=json.dumps({"puuid": createUserDto.puuid}).encode("utf-8"),
+            Payload=json.dumps({"puuid": createUserDto.puuid, "type": "created"}).encode("utf-8"),
         )
     except ClientError as ce:
         log.exception("Failed to invoke %s", user_created_fn)
@@ -92,13 +92,36 @@ def update(updateUserDto: UpdateUserDto, puuid: Annotated[str, Path(title='The R
     
     return rds.exec(UPDATE_USER_SQL, {"puuid": puuid, "game_name": updateUserDto.game_name, "tag_line": updateUserDto.tag_line})
 
+@router.post('/{puuid}/refresh', status_code=status.HTTP_202_ACCEPTED)
+def refresh(puuid: Annotated[str, Path(title='The Riot PUUID of the player to refresh')], rds: RdsDataService = Depends(get_rds), lambda_client: boto3.Session.client = Depends(get_lambda_client), user_created_fn: str = Depends(get_user_created_fn_name)):
+    '''
+    Downloads the matches the user played since their last ingested match (asynchronously)
+    Parameters:
+    puuid - The Riot PUUID of the player to refresh
+    '''
+    row = rds.query_one(CHECK_IF_USER_EXISTS_SQL, {"puuid": puuid})
+    if not bool(row['exists']):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User does not exists!")
+    
+    try:
+        lambda_client.invoke( # only the matches newer than the user's watermark are crawled
+            FunctionName=user_created_fn,
+            InvocationType="Event",        # async
+            Payload=json.dumps({"puuid": puuid, "type": "refresh"}).encode("utf-8"),
+        )
+    except ClientError as ce:
+        log.exception("Failed to invoke %s", user_created_fn)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to invoke {user_created_fn} - {ce}")
+    
+    return {"puuid": puuid, "refresh": "started"}
+
 @router.get('/find-player-by-name/{game_name}/{tag_line}')
-def find_player_by_name(game_name: Annotated[str, Path(title='The Summoner name in LoL')], tag_line: Annotated[str, Path(title='The Summoner tag line in LoL')], http_service: RiotRateLimitAPI = Depends(get_http_service)):
+def find_player_by_name(game_name: Annotated[str, Path(title='The Summoner name in LoL')], tag_line: Annotated[str, Path(title='The Summoner tag line in LoL')], http_service: RiotRateLimitAPI = Depends(get_http_service), riot_deadline: float = Depends(get_riot_deadline)):
     '''
     Finds a player PUUID by their game_name and tag_line
     '''
 
-    player = http_service.call_endpoint_with_rate_limit(GET_PLAYER_BY_NAME_URL.format(game_name=game_name, tag_line=tag_line))
+    player = http_service.call_endpoint_with_rate_limit(GET_PLAYER_BY_NAME_URL.format(game_name=game_name, tag_line=tag_line), deadline=riot_deadline)
     
     if not player:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Player with given name and tag line does not exists!")
@@ -0,0 +1,272 @@
+'''
+Record/replay stand-in for the Riot API, for load testing the client and the limiter without an API key
+
+Replays recorded Match-V5, Account-V1 and League-V4 responses and emulates Riot's rate limiting:
+X-App-Rate-Limit (per routing host) and X-Method-Rate-Limit (per host + method) with their -Count
+headers, 429 + Retry-After + X-Rate-Limit-Type once a window is full, plus configurable latency and
+5xx error rate. A URL that wasn't recorded is served any recording of the same method (so a handful
+of recorded matches can stand in for thousands of match IDs), or a 404 if the method has none.
+
+The client is pointed at the server with RIOT_API_BASE_URL (see RiotRateLimitAPI.request_url), the
+routing host travels as the first path segment: {base_url}/americas.api.riotgames.com/lol/match/v5/...
+
+Recordings are JSON lines: {"url": "<riot url>", "status": 200, "body": ...}
+
+Usage:
+    python -m benchmarks.fake_riot_server serve --recordings riot.jsonl [--port 8089] [--app-limit 20:1,100:120]
+                                                [--method-limit 2000:10] [--latency 0.05] [--jitter 0.02] [--error-rate 0]
+    python -m benchmarks.fake_riot_server record --out riot.jsonl URL [URL ...]   (needs RIOT_API_KEY)
+'''
+import argparse, itertools, json, random, threading, time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from libs.common.rate_limiter import Priority, RateLimiterRegistry
+from libs.common.riot_rate_limit_api import METHOD_PATTERNS
+
+# Riot's defaults for a development key
+DEFAULT_APP_LIMIT = '20:1,100:120'
+DEFAULT_METHOD_LIMIT = '2000:10'
+
+def parse_limits(header: str) -> list[tuple[int, int]]:
+    return [tuple(int(part) for part in limit.split(':')) for limit in header.split(',') if limit]
+
+def format_limits(limits: list[tuple[int, int]]) -> str:
+    return ','.join(f'{count}:{window}' for count, window in limits)
+
+def method_key(url: str) -> str:
+    '''host + method path template of a Riot URL, ex: americas.api.riotgames.com/lol/match/v5/matches/{match_id}'''
+    parts = urlsplit(url)
+    template = next((template for pattern, template in METHOD_PATTERNS if pattern.match(parts.path)), parts.path)
+    return f'{parts.netloc}{template}'
+
+class Recordings:
+    '''
+    Recorded responses by exact URL, with a round-robin fallback over the recordings of the same method
+    '''
+    def __init__(self, records: list[dict] = ()):
+        self.exact: dict[str, dict] = {}
+        self.by_method: dict[str, list[dict]] = defaultdict(list)
+        self.counter = itertools.count()
+        for record in records:
+            self.add(record)
+
+    @classmethod
+    def load(cls, path: str) -> 'Recordings':
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls([json.loads(line) for line in f if line.strip()])
+
+    def add(self, record: dict):
+        self.exact[record['url']] = record
+        if record['status'] == 200:
+            self.by_method[method_key(record['url'])].append(record)
+
+    def lookup(self, url: str) -> dict | None:
+        if (record := self.exact.get(url)) is not None:
+            return record
+        if candidates := self.by_method.get(method_key(url)):
+            return candidates[next(self.counter) % len(candidates)]
+        return None
+
+class FakeRiotServer:
+    '''
+    Threaded HTTP server replaying `recordings` behind emulated Riot rate limits
+
+        with FakeRiotServer(recordings, app_limits=[(20, 1)]) as server:
+            os.environ['RIOT_API_BASE_URL'] = server.base_url
+    '''
+    def __init__(self, recordings: Recordings, host: str = '127.0.0.1', port: int = 0, app_limits: list[tuple[int, int]] = None, method_limits: list[tuple[int, int]] = None, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        self.recordings = recordings
+        self.app_limits = app_limits or parse_limits(DEFAULT_APP_LIMIT)
+        self.method_limits = method_limits or parse_limits(DEFAULT_METHOD_LIMIT)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.limiters = RateLimiterRegistry()
+        self.stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'served': 0, 'rate_limited': 0, 'errors': 0, 'not_found': 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, stat: str):
+        with self.stats_lock:
+            self.stats[stat] += 1
+
+    def admit(self, url: str) -> tuple[dict, float, str | None]:
+        '''
+        Takes a slot from the app and method windows of `url`. Returns (rate headers, seconds to wait, limit type),
+        the wait is 0 when the request is admitted
+        '''
+        app_key, key = urlsplit(url).netloc, method_key(url)
+        self.limiters.update_limits(app_key, self.app_limits)
+        self.limiters.update_limits(key, self.method_limits)
+        app, method = self.limiters.get(app_key), self.limiters.get(key)
+        with self.limiters.lock:
+            now = self.limiters.clock()
+            app_wait, method_wait = app._wait_time(now, Priority.INTERACTIVE), method._wait_time(now, Priority.INTERACTIVE)
+            if app_wait <= 0 and method_wait <= 0:
+                app._reserve(now)
+                method._reserve(now)
+            headers = {
+                'X-App-Rate-Limit': format_limits(app.limits),
+                'X-App-Rate-Limit-Count': format_limits([(len(w.timestamps), w.window) for w in app.windows]),
+                'X-Method-Rate-Limit': format_limits(method.limits),
+                'X-Method-Rate-Limit-Count': format_limits([(len(w.timestamps), w.window) for w in method.windows]),
+            }
+        if app_wait > 0:
+            return headers, app_wait, 'application'
+        if method_wait > 0:
+            return headers, method_wait, 'method'
+        return headers, 0.0, None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.count('requests')
+                host, _, rest = self.path.lstrip('/').partition('/')
+                url = f'https://{host}/{rest}'
+                if server.latency or server.jitter:
+                    time.sleep(server.latency + random.uniform(0, server.jitter))
+
+                headers, wait, limit_type = server.admit(url)
+                if limit_type is not None:
+                    server.count('rate_limited')
+                    # Riot rounds Retry-After up to whole seconds
+                    headers.update({'Retry-After': str(max(int(wait + 0.999), 1)), 'X-Rate-Limit-Type': limit_type})
+                    return self.reply(429, {'status': {'message': 'Rate limit exceeded', 'status_code': 429}}, headers)
+                if server.error_rate and random.random() < server.error_rate:
+                    server.count('errors')
+                    return self.reply(503, {'status': {'message': 'Service unavailable', 'status_code': 503}}, headers)
+                if (record := server.recordings.lookup(url)) is None:
+                    server.count('not_found')
+                    return self.reply(404, {'status': {'message': 'Data not found', 'status_code': 404}}, headers)
+                server.count('served')
+                self.reply(record['status'], record.get('body'), headers)
+
+            def reply(self, status: int, body, headers: dict):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json;charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                # one line per request would dominate a load test
+                pass
+
+        return Handler
+
+    def start(self) -> 'FakeRiotServer':
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> 'FakeRiotServer':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class RiotRecorder:
+    '''
+    Records every response a RiotRateLimitAPI (or AsyncRiotRateLimitAPI) instance gets from Riot to a
+    recordings file while active. Cache hits aren't recorded, they never reach Riot
+
+        with RiotRecorder(api, 'riot.jsonl'):
+            api.call_endpoint_with_rate_limit(url)
+    '''
+    def __init__(self, api, path: str):
+        self.api = api
+        self.path = path
+        self.lock = threading.Lock()
+        self.recorded = 0
+
+    def write(self, url: str, status_code: int, payload):
+        line = json.dumps({'url': url, 'status': status_code, 'body': payload}, ensure_ascii=False)
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+            self.recorded += 1
+
+    def __enter__(self) -> 'RiotRecorder':
+        api = self.api
+        call_endpoint = api._call_endpoint
+
+        def recording_call_endpoint(url, *args, **kwargs):
+            status_code, payload = call_endpoint(url, *args, **kwargs)
+            self.write(url, status_code, payload)
+            return status_code, payload
+
+        api._call_endpoint = recording_call_endpoint
+        if (call_endpoint_async := getattr(api, '_call_endpoint_async', None)) is not None:
+            async def recording_call_endpoint_async(client, url, *args, **kwargs):
+                status_code, payload = await call_endpoint_async(client, url, *args, **kwargs)
+                self.write(url, status_code, payload)
+                return status_code, payload
+
+            api._call_endpoint_async = recording_call_endpoint_async
+        return self
+
+    def __exit__(self, *exc):
+        # drop the instance attributes, the class methods show through again
+        self.api.__dict__.pop('_call_endpoint', None)
+        self.api.__dict__.pop('_call_endpoint_async', None)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve')
+    serve.add_argument('--recordings', required=True)
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8089)
+    serve.add_argument('--app-limit', default=DEFAULT_APP_LIMIT)
+    serve.add_argument('--method-limit', default=DEFAULT_METHOD_LIMIT)
+    serve.add_argument('--latency', type=float, default=0.05)
+    serve.add_argument('--jitter', type=float, default=0.0)
+    serve.add_argument('--error-rate', type=float, default=0.0)
+
+    record = commands.add_parser('record')
+    record.add_argument('--out', required=True)
+    record.add_argument('urls', nargs='+')
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        server = FakeRiotServer(
+            Recordings.load(args.recordings), args.host, args.port,
+            parse_limits(args.app_limit), parse_limits(args.method_limit),
+            args.latency, args.jitter, args.error_rate,
+        )
+        print(f'Fake Riot API on {server.base_url} (RIOT_API_BASE_URL={server.base_url})')
+        try:
+            server.httpd.serve_forever()
+        except KeyboardInterrupt:
+            print(json.dumps(server.stats))
+    else:
+        from libs.common.match_cache import MatchCache
+        from libs.common.metrics import NullMetricsSink
+        from libs.common.riot_rate_limit_api import RiotRateLimitAPI
+        from libs.common.ttl_cache import TieredTTLCache
+        # fresh in-memory caches, so every URL really goes to Riot
+        api = RiotRateLimitAPI(match_cache=MatchCache(), lookup_cache=TieredTTLCache(), metrics=NullMetricsSink())
+        with RiotRecorder(api, args.out) as recorder:
+            for url in args.urls:
+                api.call_endpoint_with_rate_limit(url)
+        print(f'Recorded {recorder.recorded} responses to {args.out}')
+
+if __name__ == '__main__':
+    main()
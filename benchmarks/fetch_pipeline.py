@@ -0,0 +1,109 @@
+'''
+Throughput benchmark of the Riot fetch pipeline against the fake Riot server
+
+Fetches `--matches` Match-V5 payloads through AsyncRiotRateLimitAPI.fetch_many (and optionally the
+blocking RiotRateLimitAPI one by one) from a FakeRiotServer enforcing the given limits, with fresh
+in-memory caches so every match goes over the wire. The limits are the ceiling: a healthy client
+stays close to them with few 429s, a regression shows up as lower req/s or more 429s.
+
+With `--baseline` the runs are checked against per client floors/ceilings (see fetch_pipeline_baseline.json,
+recorded with the CI arguments) and the benchmark exits non-zero when any of them is crossed.
+
+Usage:
+    python -m benchmarks.fetch_pipeline [--recordings riot.jsonl] [--matches 500] [--app-limit 100:1]
+                                        [--method-limit 2000:10] [--latency 0.05] [--sync] [--json]
+                                        [--baseline benchmarks/fetch_pipeline_baseline.json]
+'''
+import argparse, json, os, sys, time
+from libs.common.constants.league_constants import MATCH_V5_URL
+from libs.common.match_cache import MatchCache
+from libs.common.metrics import InMemoryMetricsSink
+from libs.common.rate_limiter import RateLimiterRegistry
+from libs.common.ttl_cache import TieredTTLCache
+from benchmarks.fake_riot_server import FakeRiotServer, Recordings, parse_limits
+
+def synthetic_recordings() -> Recordings:
+    '''A single finished match, served for every match ID when no recordings file is given'''
+    match = {
+        'metadata': {'matchId': 'NA1_0', 'participants': [f'puuid-{i}' for i in range(10)]},
+        'info': {'gameEndTimestamp': 1_700_000_000_000, 'participants': [{'puuid': f'puuid-{i}'} for i in range(10)]},
+    }
+    return Recordings([{'url': MATCH_V5_URL.format(match_id='NA1_0'), 'status': 200, 'body': match}])
+
+def make_client(async_client: bool):
+    kwargs = dict(limiters=RateLimiterRegistry(), match_cache=MatchCache(), lookup_cache=TieredTTLCache(), metrics=InMemoryMetricsSink())
+    if async_client:
+        from libs.common.async_riot_rate_limit_api import AsyncRiotRateLimitAPI
+        return AsyncRiotRateLimitAPI(**kwargs)
+    from libs.common.riot_rate_limit_api import RiotRateLimitAPI
+    return RiotRateLimitAPI(**kwargs)
+
+def run(server: FakeRiotServer, matches: int, async_client: bool) -> dict:
+    api = make_client(async_client)
+    urls = [MATCH_V5_URL.format(match_id=f'NA1_{i}') for i in range(1, matches + 1)]
+    before = dict(server.stats)
+    start = time.perf_counter()
+    if async_client:
+        results = api.fetch_many(urls)
+    else:
+        results = [api.call_endpoint_with_rate_limit(url) for url in urls]
+    elapsed = time.perf_counter() - start
+
+    queue_waits = [v for (name, _), values in api.metrics.histograms.items() if name == 'QueueWait' for v in values]
+    return {
+        'client': 'async' if async_client else 'sync',
+        'matches': len([r for r in results if r is not None]),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(matches / elapsed, 1),
+        'server_429s': server.stats['rate_limited'] - before['rate_limited'],
+        'queue_wait_total_s': round(sum(queue_waits) / 1000, 3),
+    }
+
+def regressions(res: dict, baseline: dict) -> list[str]:
+    '''The thresholds of `baseline` this run crosses, empty when it has none for the client'''
+    limits = baseline.get(res['client'], {})
+    failures = []
+    if res['matches'] < res['expected_matches']:
+        failures.append(f"{res['client']}: fetched {res['matches']} of {res['expected_matches']} matches")
+    if 'min_throughput_rps' in limits and res['throughput_rps'] < limits['min_throughput_rps']:
+        failures.append(f"{res['client']}: {res['throughput_rps']} req/s < {limits['min_throughput_rps']} req/s")
+    if 'max_server_429s' in limits and res['server_429s'] > limits['max_server_429s']:
+        failures.append(f"{res['client']}: {res['server_429s']} 429s > {limits['max_server_429s']} 429s")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--recordings', help='JSON lines recorded with fake_riot_server record (default: synthetic match)')
+    parser.add_argument('--matches', type=int, default=500)
+    parser.add_argument('--app-limit', default='100:1')
+    parser.add_argument('--method-limit', default='2000:10')
+    parser.add_argument('--latency', type=float, default=0.05, help='server side latency (s)')
+    parser.add_argument('--sync', action='store_true', help='also run the blocking client')
+    parser.add_argument('--json', action='store_true', help='print one JSON object per run (for CI)')
+    parser.add_argument('--baseline', help='JSON of min_throughput_rps / max_server_429s per client, exit 1 on a regression')
+    args = parser.parse_args()
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    recordings = Recordings.load(args.recordings) if args.recordings else synthetic_recordings()
+    os.environ.setdefault('ENV', 'benchmark')
+    os.environ.setdefault('RIOT_API_KEY', 'fake')
+    with FakeRiotServer(recordings, app_limits=parse_limits(args.app_limit), method_limits=parse_limits(args.method_limit), latency=args.latency) as server:
+        os.environ['RIOT_API_BASE_URL'] = server.base_url
+        failures = []
+        for async_client in ([True, False] if args.sync else [True]):
+            res = run(server, args.matches, async_client)
+            failures += regressions({**res, 'expected_matches': args.matches}, baseline)
+            if args.json:
+                print(json.dumps(res))
+            else:
+                print(f"{res['client']:>5}: {res['matches']} matches in {res['elapsed_s']:.2f}s  {res['throughput_rps']:.1f} req/s  "
+                      f"429s={res['server_429s']}  queue wait={res['queue_wait_total_s']:.2f}s")
+    if failures:
+        print('fetch pipeline regressed against the baseline:\n  ' + '\n  '.join(failures), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
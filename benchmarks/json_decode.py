@@ -0,0 +1,88 @@
+'''
+Decode benchmark for match bulk files: stdlib json vs json_codec (and orjson / msgspec, whichever are installed)
+
+Pass real bulks (ex: downloaded with `aws s3 cp --recursive s3://$S3_BUCKET_NAME/rank_match_info/ bulks/`),
+without paths a synthetic 50-match bulk shaped like Match-V5 payloads is used. Files are read with
+bulk_format.iter_bulk_lines (decompressed outside the timings, legacy `.json` bulks re-encoded one record per line),
+then every record line is decoded, as preprocess_power_level does. Reports the best of `--repeat` runs per file
+and backend, and checks every backend decodes to the same records.
+
+Usage:
+    python -m benchmarks.json_decode [bulks/**/*.ndjson.gz ...] [--repeat 5]
+'''
+import argparse, glob, io, json, random, time
+from libs.common import json_codec
+from libs.common.bulk_format import KIND_MATCHES, encode_bulk, iter_bulk_lines, make_header
+
+def decoders() -> dict:
+    found = {'json': json.loads, f'json_codec ({json_codec.BACKEND})': json_codec.loads}
+    try:
+        import orjson
+        found['orjson'] = orjson.loads
+    except ImportError:
+        pass
+    try:
+        import msgspec
+        found['msgspec'] = msgspec.json.Decoder().decode
+    except ImportError:
+        pass
+    return found
+
+def synthetic_bulk(matches: int = 50) -> bytes:
+    '''Roughly the size and shape of a real matches bulk (~100 KB per match, mostly numeric participant stats)'''
+    rng = random.Random(0)
+    def participant(i):
+        stats = {f'stat{k}': rng.randint(0, 50000) for k in range(120)}
+        challenges = {f'challenge{k}': rng.random() * 100 for k in range(120)}
+        return {'puuid': f'puuid-{i}-' + 'x' * 60, 'championName': 'Ahri', 'win': i < 5, **stats, 'challenges': challenges}
+    bulk = [{
+        'metadata': {'matchId': f'NA1_{m}', 'participants': [f'puuid-{i}-' + 'x' * 60 for i in range(10)]},
+        'info': {'gameEndTimestamp': 1_700_000_000_000 + m, 'participants': [participant(i) for i in range(10)]},
+    } for m in range(matches)]
+    return encode_bulk(make_header(KIND_MATCHES, len(bulk)), bulk)
+
+def bulk_lines(data: bytes) -> list[bytes]:
+    _, lines = iter_bulk_lines(io.BytesIO(data))
+    return list(lines)
+
+def bench(lines: list[bytes], decode, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            decode(line)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('paths', nargs='*', help='bulk files or glob patterns')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    files = [path for pattern in args.paths for path in sorted(glob.glob(pattern, recursive=True))]
+    inputs = [(path, open(path, 'rb').read()) for path in files] or [('synthetic 50-match bulk', synthetic_bulk())]
+    backends = decoders()
+    totals = dict.fromkeys(backends, 0.0)
+
+    for name, data in inputs:
+        lines = bulk_lines(data)
+        expected = [json.loads(line) for line in lines]
+        timings = []
+        for backend, decode in backends.items():
+            assert [decode(line) for line in lines] == expected, f'{backend} decoded {name} differently'
+            elapsed = bench(lines, decode, args.repeat)
+            totals[backend] += elapsed
+            timings.append(f'{backend}={1000 * elapsed:.1f}ms')
+        size = sum(map(len, lines))
+        print(f'{name} ({len(data) / 1e6:.1f} MB, {size / 1e6:.1f} MB of {len(lines)} records): ' + '  '.join(timings))
+
+    if len(inputs) > 1:
+        print('total: ' + '  '.join(f'{backend}={1000 * elapsed:.1f}ms' for backend, elapsed in totals.items()))
+    baseline = totals['json']
+    for backend, elapsed in totals.items():
+        if backend != 'json':
+            print(f'{backend}: {baseline / elapsed:.1f}x faster than json')
+
+if __name__ == '__main__':
+    main()
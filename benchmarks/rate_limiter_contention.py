@@ -0,0 +1,100 @@
+'''
+Contention benchmark for the Riot rate limiter
+
+Runs 50 threads that each acquire a rate slot and then "call" Riot (simulated round-trip latency),
+against both the new RateLimiter and the old lock-held-while-sleeping implementation. Once the key is
+saturated both are rate bound, the number to watch is the max lock hold: with the legacy limiter every
+thread (including ones that would have room) is stuck behind the sleeper.
+
+Usage:
+    python -m benchmarks.rate_limiter_contention [--threads 50] [--requests 20] [--latency 0.05]
+'''
+import argparse, statistics, threading, time
+from collections import defaultdict
+from libs.common.rate_limiter import RateLimiter
+
+# scaled-down version of a production key (500:10, 30000:600) so a run takes a few seconds
+LIMITS = [(50, 1), (300, 10)]
+
+class LegacyLimiter:
+    '''The previous RiotRateLimitAPI.wait_for_request_slot, kept here as the baseline'''
+    def __init__(self, limits):
+        self.limits = limits
+        self.history = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.time()
+            for limit, window in self.limits:
+                self.history[window] = [t for t in self.history[window] if now - t < window]
+                if len(self.history[window]) >= limit:
+                    time.sleep(window - (now - self.history[window][0]) + 0.01)
+            for _, window in self.limits:
+                self.history[window].append(time.time())
+
+class TimedLock:
+    '''threading.Lock wrapper recording the longest time the lock was held'''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._acquired_at = 0.0
+        self.max_hold = 0.0
+
+    def __enter__(self):
+        self._lock.acquire()
+        self._acquired_at = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.max_hold = max(self.max_hold, time.perf_counter() - self._acquired_at)
+        self._lock.release()
+
+def run(limiter, threads: int, requests: int, latency: float) -> dict:
+    limiter.lock = TimedLock()
+    waits = []
+    waits_lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        barrier.wait()
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            limiter.acquire()
+            waited = time.perf_counter() - t0
+            with waits_lock:
+                waits.append(waited)
+            time.sleep(latency)  # simulated network round trip
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    waits.sort()
+    return {
+        'elapsed_s': elapsed,
+        'throughput_rps': len(waits) / elapsed,
+        'wait_p50_ms': 1000 * statistics.median(waits),
+        'wait_p99_ms': 1000 * waits[int(0.99 * (len(waits) - 1))],
+        'max_lock_hold_ms': 1000 * limiter.lock.max_hold,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=20, help='requests per thread')
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated round trip (s)')
+    args = parser.parse_args()
+
+    total = args.threads * args.requests
+    print(f'{args.threads} threads x {args.requests} requests = {total}, limits={LIMITS}, latency={args.latency}s')
+    for name, limiter in (('legacy', LegacyLimiter(LIMITS)), ('rate_limiter', RateLimiter(LIMITS))):
+        res = run(limiter, args.threads, args.requests, args.latency)
+        print(f"{name:>12}: {res['elapsed_s']:.2f}s  {res['throughput_rps']:.1f} req/s  "
+              f"wait p50={res['wait_p50_ms']:.1f}ms p99={res['wait_p99_ms']:.1f}ms  "
+              f"max lock hold={res['max_lock_hold_ms']:.2f}ms")
+
+if __name__ == '__main__':
+    main()
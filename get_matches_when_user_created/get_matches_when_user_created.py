@@ -1,106 +1,455 @@
-import logging, json, os, boto3, uuid
+import asyncio, logging, json, os, boto3, time, uuid
 from botocore.exceptions import ClientError
 from libs.common.constants.league_constants import LeagueTier, LeagueQueue, MATCH_V5_URL, MATCH_PUUID_V5_URL, GET_PLAYER_ACTIVE_REGION_URL, PLAYER_RANK_URL
-from libs.common.riot_rate_limit_api import RiotRateLimitAPI
+from libs.common.async_riot_rate_limit_api import AsyncRiotRateLimitAPI
+from libs.common.constants.queries.users_queries import GET_USER_WATERMARK_SQL
+from libs.common.crawl_checkpoint import checkpoint_store_from_env
+from libs.common.bulk_format import KIND_MANIFEST, bulk_name, encode_bulk, make_header
+from libs.common.match_cache import MatchCache
+from libs.common.match_projection import VIEW_INGEST, VIEW_RAW, ingest_store_from_env, project_match
+from libs.common.rds_service import RdsDataService
+from libs.common.riot_errors import RiotDeadlineExceeded
+from libs.common.riot_rate_limit_api import lambda_deadline
+from libs.common.rate_limiter import Priority
+from libs.common.rate_limit_backends import DynamoDBRateLimitBackend
+from libs.common.work_queue import InProcessWorkQueue, WorkQueue, work_queue_from_env
 from datetime import datetime, timezone
 
 log = logging.getLogger(__name__)
-riot_api_service = RiotRateLimitAPI()
+
+# what the crawler stores per match (see match_projection.py): "raw" full payloads in the match store,
+# "ingest" only their ingest view, "both" (default) the two. Manifests point to the ingest views when they're stored
+MATCH_VIEWS = os.getenv("MATCH_VIEWS") or "both"
+STORE_RAW = MATCH_VIEWS in ("raw", "both")
+STORE_INGEST = MATCH_VIEWS in ("ingest", "both")
+
+# async client so match payloads can be fetched concurrently (sync calls share the same rate windows),
+# backfills are background traffic and leave headroom for the API's interactive calls.
+# Without raw payloads the client only keeps them in memory (its default store is the persistent one)
+riot_api_service = AsyncRiotRateLimitAPI(priority=Priority.BACKGROUND, match_cache=None if STORE_RAW else MatchCache())
+ingest_store = ingest_store_from_env() if STORE_INGEST else None
 
 s3_client = boto3.client(
             "s3",
             region_name=os.getenv("AWS_REGION") or os.getenv("AWS_DEFAULT_REGION")
         )
 
+lambda_client = boto3.client(
+            "lambda",
+            region_name=os.getenv("AWS_REGION") or os.getenv("AWS_DEFAULT_REGION")
+        )
+
+rds_service = RdsDataService.from_env()
+# crawl state of unfinished crawls (see crawl_checkpoint.py), None disables resuming
+checkpoints = checkpoint_store_from_env()
+
 BUCKET = os.getenv("S3_BUCKET_NAME")
+# event types: "created" crawls the whole season, "refresh" only the matches newer than the user's watermark
+EVENT_CREATED = "created"
+EVENT_REFRESH = "refresh"
+# pipeline buffers of download_players_yearly_match_info_async
+PAGES_AHEAD = 2
+UPLOADS_AHEAD = 2
+# "gzip" or "zstd" (needs the zstandard package), see libs/common/bulk_format.py
+BULK_COMPRESSION = os.getenv("BULK_COMPRESSION") or "gzip"
+# paging stops this long before the Lambda deadline so the pages in flight finish, then the crawl continues
+# in a new invocation from its checkpoint (at most MAX_CONTINUATIONS times)
+HANDOFF_SECONDS = 60
+MAX_CONTINUATIONS = 20
+# an older checkpoint is abandoned and the crawl starts over
+CHECKPOINT_TTL = 24 * 3600
+
+# "pipeline" (default): this invocation pages, fetches and writes everything (download_players_yearly_match_info).
+# "fanout": this invocation only pages the match IDs and sends them in chunks of CHUNK_SIZE to the work queue
+# (CRAWL_QUEUE_URL), worker invocations (worker_handler) fetch them and write one manifest per chunk. Workers share
+# the API key's budget through the rate limit backend, which must then be the fleet-wide one (RATE_LIMIT_BACKEND=dynamodb:...).
+# Without a queue the workers run in this process (LOCAL_WORKERS of them)
+CRAWL_MODE = os.getenv("CRAWL_MODE") or "pipeline"
+CHUNK_SIZE = 50
+# largest `count` of the match IDs by puuid endpoint
+MATCH_ID_PAGE_SIZE = 100
+LOCAL_WORKERS = 4
+work_queue = work_queue_from_env()
 
-def put_json_s3(key: str, obj) -> str:
-    """Write a JSON object (pretty-printed UTF-8) to S3."""
+def bulk_exists_s3(key: str) -> bool:
     try:
-        body = json.dumps(obj, ensure_ascii=False, indent=4).encode("utf-8")
+        s3_client.head_object(Bucket=BUCKET, Key=key)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+def put_bulk_s3(key: str, header: dict, records: list) -> str:
+    """
+    Write a bulk (compressed NDJSON, see bulk_format.py) to S3. Keys are deterministic (bulk_name): a bulk
+    that's already there is left alone, rewriting it would only trigger its ingestion again
+    """
+    try:
+        if bulk_exists_s3(key):
+            log.info("Skipping existing bulk %s", key)
+            return f"s3://{BUCKET}/{key}"
+        body = encode_bulk(header, records, BULK_COMPRESSION)
         s3_client.put_object(
             Bucket=BUCKET,
             Key=key,
             Body=body,
-            ContentType="application/json; charset=utf-8",
+            ContentType="application/x-ndjson",
+            ContentEncoding=BULK_COMPRESSION,
         )
         return f"s3://{BUCKET}/{key}"
     except ClientError:
         # re-raise after logging if you have a logger
         raise Exception("cannot")
 
-def download_players_yearly_match_info(puuid: str, save_directory: str, count: int = 10):
+def get_user_watermark(puuid: str) -> tuple[int, str] | None:
+    """Returns (game start time in epoch seconds, match ID) of the newest match stored for the user, None if none is"""
+    row = rds_service.query_one(GET_USER_WATERMARK_SQL, {"puuid": puuid})
+    if not row or row.get("last_match_start_time") is None:
+        return None
+    return int(row["last_match_start_time"]), row["last_match_id"]
+
+def new_crawl_state(puuid: str, event_type: str = EVENT_CREATED, watermark: tuple[int, str] = None) -> dict:
     """
-    Downloads the player's last-year ranked match payloads and writes them to S3 in bulks.
-    S3 keys:  {prefix}/{puuid}/match_info_bulk_{n}.json
+    State of a new crawl, checkpointed as it progresses:
+        start                 offset of the next page of match IDs not written to a manifest yet
+        start_time, end_time  the crawled time window (epoch seconds), fixed for the whole crawl so page offsets
+                              stay valid across continuations
+        last_match_id         the watermark match, dropped from the pages (Riot's startTime is inclusive)
+        s3_keys               manifests written so far
+    Matches fetched for a page that wasn't written yet aren't tracked: they're in the match store already,
+    the resumed crawl references them without downloading them again.
     """
-
     # time window: last year → now (epoch seconds)
     now_dt = datetime.now(timezone.utc)
     # limit until Jan 1st of current year
     last_year_dt = now_dt.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
     start_time = int(last_year_dt.timestamp())
-    end_time = int(now_dt.timestamp())
+    last_match_id = None
+    if watermark is not None:
+        start_time = max(start_time, watermark[0])
+        last_match_id = watermark[1]
+    return {
+        "puuid": puuid,
+        "type": event_type,
+        "start": 0,
+        "start_time": start_time,
+        "end_time": int(now_dt.timestamp()),
+        "last_match_id": last_match_id,
+        "s3_keys": [],
+        "done": False,
+        "continuations": 0,
+    }
 
+def checkpoint_key(puuid: str, event_type: str) -> str:
+    """
+    One checkpoint per user and crawl type: a refresh started while the user's first ("created") crawl is still
+    running leaves its checkpoint alone, the created crawl's continuations still cover the history older than
+    the watermark its first manifest moved
+    """
+    return f"{puuid}_{event_type}"
+
+def load_crawl_state(puuid: str, event_type: str) -> dict | None:
+    """The checkpoint of the user's unfinished crawl of this type, None if there's none (or it's too old)"""
+    if checkpoints is None:
+        return None
+    state = checkpoints.get(checkpoint_key(puuid, event_type))
+    if not state or state.get("type") != event_type or time.time() - state.get("updated_at", 0) > CHECKPOINT_TTL:
+        return None
+    return state
+
+def save_crawl_state(state: dict):
+    state["updated_at"] = int(time.time())
+    if checkpoints is not None:
+        checkpoints.put(checkpoint_key(state["puuid"], state["type"]), state)
+
+def continue_crawl(state: dict, context) -> bool:
+    """Checkpoints an unfinished crawl and invokes this Lambda again to resume it, False when it can't be continued"""
+    if checkpoints is None or context is None:
+        log.error("Crawl of %s stopped at offset %d and can't be resumed (no checkpoint store)", state["puuid"], state["start"])
+        return False
+    if state["continuations"] >= MAX_CONTINUATIONS:
+        log.error("Crawl of %s stopped at offset %d after %d continuations", state["puuid"], state["start"], state["continuations"])
+        return False
+    state["continuations"] += 1
+    save_crawl_state(state)
+    lambda_client.invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType="Event",
+        Payload=json.dumps({"puuid": state["puuid"], "type": state["type"], "continuation": state["continuations"]}).encode("utf-8"),
+    )
+    return True
+
+async def player_key_prefix(client, puuid: str, save_directory: str, deadline: float = None) -> str:
+    """S3 folder of the player's bulks: {save_directory}/{tier}_{rank}_match_infos/{puuid}"""
     # Get player's active region (NA1, KR, etc)
-    active_region_res = riot_api_service.call_endpoint_with_rate_limit(GET_PLAYER_ACTIVE_REGION_URL.format(puuid=puuid))
+    active_region_res = await riot_api_service.call_endpoint_with_rate_limit_async(client, GET_PLAYER_ACTIVE_REGION_URL.format(puuid=puuid), deadline=deadline)
     
     active_region = active_region_res['region']
     
     # Get player's current rank (we are only doing SOLO ranks to find their "actual" skills)
-    player_rank_res = riot_api_service.call_endpoint_with_rate_limit(PLAYER_RANK_URL.format(region=active_region, puuid=puuid))
+    player_rank_res = await riot_api_service.call_endpoint_with_rate_limit_async(client, PLAYER_RANK_URL.format(region=active_region, puuid=puuid), deadline=deadline)
     
     player_rank = next((d for d in player_rank_res if d.get("queueType") == LeagueQueue.RANKED_SOLO_5x5.value), {})
         
     p_tier, p_rank = player_rank.get('tier', "SILVER"), player_rank.get('rank', 'I')
     
-    start = 0
-    bulk_count = 0
-    s3_keys = []
-    key_prefix = f"{save_directory}/{p_tier.lower()}_{f'{p_rank}_' if p_tier not in (LeagueTier.CHALLENGER.name, LeagueTier.GRANDMASTER.name, LeagueTier.MASTER.name) else ""}match_infos/{puuid}"
-
-    while True:
-        # page ranked match IDs
-        match_ids_ranked = riot_api_service.call_endpoint_with_rate_limit(
-            MATCH_PUUID_V5_URL.format(
-                puuid=puuid, start=start, count=count,
-                startTime=start_time, endTime=end_time, type='ranked'
-            ),
-        )
-        if not match_ids_ranked:
-            break
-
-        # fetch each match object
-        match_obj = []
-        for match_id in match_ids_ranked:
-            match_info = riot_api_service.call_endpoint_with_rate_limit(
-                MATCH_V5_URL.format(match_id=match_id)
+    return f"{save_directory}/{p_tier.lower()}_{f'{p_rank}_' if p_tier not in (LeagueTier.CHALLENGER.name, LeagueTier.GRANDMASTER.name, LeagueTier.MASTER.name) else ''}match_infos/{puuid}"
+
+async def store_matches(client, match_ids: list[str], deadline: float = None):
+    """Downloads the matches that aren't in the store the manifests point to yet (match store or ingest views)"""
+    match_store = ingest_store if STORE_INGEST else riot_api_service.match_cache
+    # S3 HEADs, off the event loop
+    stored = await asyncio.gather(*(asyncio.to_thread(match_store.contains, match_id) for match_id in match_ids))
+    missing = [match_id for match_id, is_stored in zip(match_ids, stored) if not is_stored]
+    # fetch the match objects concurrently, bounded by the rate limits,
+    # the client's read-through cache writes them to the match store (or reads them back from it)
+    payloads = await riot_api_service.fetch_many_async(
+        [MATCH_V5_URL.format(match_id=match_id) for match_id in missing],
+        deadline,
+        client,
+    )
+    if STORE_INGEST:
+        await asyncio.gather(*(
+            asyncio.to_thread(ingest_store.put, match_id, project_match(payload))
+            for match_id, payload in zip(missing, payloads) if payload is not None
+        ))
+    log.info("Page of %d matches, %d already stored", len(match_ids), len(match_ids) - len(missing))
+
+def write_manifest(key_prefix: str, puuid: str, match_ids: list[str]) -> str:
+    """Writes the manifest bulk of a page of stored matches, returns its S3 URI"""
+    key = f"{key_prefix}/{bulk_name(KIND_MANIFEST, match_ids, BULK_COMPRESSION)}"
+    header = make_header(KIND_MANIFEST, len(match_ids), puuid=puuid, view=VIEW_INGEST if STORE_INGEST else VIEW_RAW)
+    return put_bulk_s3(key, header, [{"match_id": match_id} for match_id in match_ids])
+
+async def download_players_yearly_match_info_async(puuid: str, save_directory: str, count: int = 10, deadline: float = None, state: dict = None, stop_at: float = None) -> dict:
+    """
+    Downloads the player's last-year ranked match payloads into the match store (s3://{bucket}/matches/, see
+    match_cache.py) and/or their ingest views (s3://{bucket}/ingest/, see MATCH_VIEWS) and writes one manifest
+    bulk of match IDs per page (see bulk_format.py).
+    S3 keys:  {prefix}/{puuid}/match_manifest_{first match ID}_{last match ID}_{hash}.ndjson.gz
+    Matches already in the store (ex: crawled for a teammate) are referenced without being downloaded again.
+    Riot calls raise a RiotAPIError instead of waiting past `deadline` (time.monotonic()).
+
+    Crawls `state` (see new_crawl_state, a new full crawl by default) from its `start` offset and returns it:
+    it's checkpointed after every manifest, `done` once the last page is written. No page is requested after
+    `stop_at` (time.monotonic()), the crawl is then left unfinished for a continuation.
+
+    Runs as a pipeline, every stage overlaps with the others:
+        page match IDs -> [PAGES_AHEAD pages] -> fetch missing match bodies -> [UPLOADS_AHEAD manifests] -> upload to S3
+    match bodies are fetched concurrently (bounded by max_in_flight and the rate limiter) and uploads
+    run in a thread while the next page downloads.
+    """
+
+    state = state or new_crawl_state(puuid)
+    last_match_id = state["last_match_id"]
+
+    async with riot_api_service.make_client() as client:
+        key_prefix = await player_key_prefix(client, puuid, save_directory, deadline)
+        # bounded queues: paging can't run more than PAGES_AHEAD pages ahead of the downloads,
+        # and at most UPLOADS_AHEAD manifests wait for S3
+        pages = asyncio.Queue(maxsize=PAGES_AHEAD)
+        manifests = asyncio.Queue(maxsize=UPLOADS_AHEAD)
+
+        finished = False
+
+        async def page_match_ids():
+            nonlocal finished
+            start = state["start"]
+            while True:
+                if stop_at is not None and time.monotonic() >= stop_at:
+                    log.info("Stopping the crawl of %s at offset %d before the deadline", puuid, start)
+                    break
+                # page ranked match IDs
+                match_ids_ranked = await riot_api_service.call_endpoint_with_rate_limit_async(
+                    client,
+                    MATCH_PUUID_V5_URL.format(
+                        puuid=puuid, start=start, count=count,
+                        startTime=state["start_time"], endTime=state["end_time"], type='ranked'
+                    ),
+                    deadline=deadline,
+                )
+                if not match_ids_ranked:
+                    finished = True
+                    break
+                # pages go down the pipeline with the offset of the page after them (the checkpoint once written),
+                # even one only holding the watermark match
+                await pages.put((start + count, [match_id for match_id in match_ids_ranked if match_id != last_match_id]))
+                # a short page is the last one, no need to ask for an empty one
+                if len(match_ids_ranked) < count:
+                    finished = True
+                    break
+                start += count
+            await pages.put(None)
+
+        async def fetch_matches():
+            while (page := await pages.get()) is not None:
+                next_start, match_ids_ranked = page
+                await store_matches(client, match_ids_ranked, deadline)
+                await manifests.put((next_start, match_ids_ranked))
+            await manifests.put(None)
+
+        async def upload_manifests():
+            while (manifest := await manifests.get()) is not None:
+                next_start, match_ids = manifest
+                if match_ids:
+                    # write the manifest to S3 (boto3 is blocking, keep it off the event loop)
+                    state["s3_keys"].append(await asyncio.to_thread(write_manifest, key_prefix, puuid, match_ids))
+                # pages are written in order, a resumed crawl starts after this one
+                state["start"] = next_start
+                await asyncio.to_thread(save_crawl_state, state)
+
+        try:
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(page_match_ids())
+                tg.create_task(fetch_matches())
+                tg.create_task(upload_manifests())
+        except ExceptionGroup as eg:
+            # the other stages are cancelled, surface the failure that stopped the pipeline (ex: RiotDeadlineExceeded)
+            raise eg.exceptions[0]
+
+    state["done"] = finished
+    return state
+
+def download_players_yearly_match_info(puuid: str, save_directory: str, count: int = 10, deadline: float = None, state: dict = None, stop_at: float = None) -> dict:
+    """Blocking entry point for download_players_yearly_match_info_async"""
+    return asyncio.run(download_players_yearly_match_info_async(puuid, save_directory, count, deadline, state, stop_at))
+
+async def enqueue_match_chunks_async(puuid: str, save_directory: str, queue: WorkQueue, deadline: float = None, state: dict = None, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Coordinator of the fan-out crawl: pages all the player's match IDs in `state`'s window (see new_crawl_state)
+    and sends them to `queue` in chunks of `chunk_size`, returns the number of chunks sent.
+    Chunks start at multiples of `chunk_size` like the pipeline's pages, so both modes write the same manifests
+    """
+    state = state or new_crawl_state(puuid)
+    match_ids = []
+    async with riot_api_service.make_client() as client:
+        key_prefix = await player_key_prefix(client, puuid, save_directory, deadline)
+        start = 0
+        while True:
+            match_ids_ranked = await riot_api_service.call_endpoint_with_rate_limit_async(
+                client,
+                MATCH_PUUID_V5_URL.format(
+                    puuid=puuid, start=start, count=MATCH_ID_PAGE_SIZE,
+                    startTime=state["start_time"], endTime=state["end_time"], type='ranked'
+                ),
+                deadline=deadline,
             )
-            match_obj.append(match_info)
+            match_ids.extend(match_ids_ranked or [])
+            if not match_ids_ranked or len(match_ids_ranked) < MATCH_ID_PAGE_SIZE:
+                break
+            start += MATCH_ID_PAGE_SIZE
 
-        # write bulk JSON to S3
-        key = f"{key_prefix}/match_info_bulk_{datetime.now(timezone.utc)}.json"
-        uri = put_json_s3(key, match_obj)
-        s3_keys.append(uri)
+    chunks = [[match_id for match_id in match_ids[i:i + chunk_size] if match_id != state["last_match_id"]] for i in range(0, len(match_ids), chunk_size)]
+    messages = [{"puuid": puuid, "key_prefix": key_prefix, "match_ids": chunk} for chunk in chunks if chunk]
+    await asyncio.to_thread(queue.send, messages)
+    log.info("Sent %d chunks (%d matches) of %s to the work queue", len(messages), len(match_ids), puuid)
+    return len(messages)
 
-        start += count
-        bulk_count += 1
-        
+async def process_chunk(client, message: dict, deadline: float = None) -> str:
+    """Worker side of the fan-out crawl: stores the chunk's matches and writes its manifest, returns the manifest's S3 URI"""
+    await store_matches(client, message["match_ids"], deadline)
+    return await asyncio.to_thread(write_manifest, message["key_prefix"], message["puuid"], message["match_ids"])
+
+async def run_workers_async(queue: WorkQueue, workers: int = LOCAL_WORKERS, deadline: float = None) -> list[str]:
+    """Drains `queue` with `workers` concurrent workers in this process (fan-out crawl without SQS)"""
+    s3_keys = []
+    async with riot_api_service.make_client() as client:
+        async def worker():
+            while items := await asyncio.to_thread(queue.receive, 1):
+                for item in items:
+                    s3_keys.append(await process_chunk(client, item.body, deadline))
+                    await asyncio.to_thread(queue.ack, item)
 
+        await asyncio.gather(*(worker() for _ in range(workers)))
     return s3_keys
 
+def fan_out_crawl(puuid: str, save_directory: str, deadline: float = None, state: dict = None) -> dict:
+    """Fan-out crawl of the player's matches (see CRAWL_MODE), the chunks are processed here when the queue is in-process"""
+    if not isinstance(riot_api_service.limiters, DynamoDBRateLimitBackend):
+        log.warning("Fan-out crawl without a shared rate limit backend, workers don't see each other's calls")
+    result = {"chunks": asyncio.run(enqueue_match_chunks_async(puuid, save_directory, work_queue, deadline, state))}
+    if isinstance(work_queue, InProcessWorkQueue):
+        result["s3_keys"] = asyncio.run(run_workers_async(work_queue, LOCAL_WORKERS, deadline))
+    return result
+
+def worker_handler(event, context):
+    """
+    Worker Lambda of the fan-out crawl, fed by the work queue (SQS event source mapping with ReportBatchItemFailures):
+    event: {"Records": [{"messageId": "...", "body": "{\"puuid\": ..., \"key_prefix\": ..., \"match_ids\": [...]}"}]}
+    The chunks that failed are reported back to SQS and delivered again, the others are deleted
+    """
+    records = (event or {}).get("Records", [])
+    deadline = lambda_deadline(context)
+
+    async def process_all():
+        async with riot_api_service.make_client() as client:
+            return await asyncio.gather(*(process_chunk(client, json.loads(record["body"]), deadline) for record in records), return_exceptions=True)
+
+    try:
+        results = asyncio.run(process_all())
+    finally:
+        # EMF metrics go out through stdout, write them before the invocation is frozen
+        riot_api_service.metrics.flush()
+
+    failures = []
+    for record, result in zip(records, results):
+        if isinstance(result, BaseException):
+            log.error("Chunk %s failed: %r", record["messageId"], result)
+            failures.append({"itemIdentifier": record["messageId"]})
+        else:
+            log.info("Chunk %s written to %s", record["messageId"], result)
+    return {"batchItemFailures": failures}
+
 def lambda_handler(event, context):
+    """
+    event: {"puuid": "...", "type": "created" | "refresh"}, type defaults to "created" (full season crawl)
+    An unfinished crawl of the same type (checkpointed by a timed out or handed off invocation) is resumed,
+    a crawl that can't finish before the deadline continues in a new invocation ("continuation": n in its event).
+    """
     puuid = (event or {}).get("puuid")
+    event_type = (event or {}).get("type") or EVENT_CREATED
     corr_id = str(uuid.uuid4())
     if not puuid or not isinstance(puuid, str):
         log.error("Missing/invalid 'puuid' in event")
         # For async invoke, return value is ignored; we still log for observability
         return {"ok": False, "error": "missing_puuid", "corr_id": corr_id}
+    if event_type not in (EVENT_CREATED, EVENT_REFRESH):
+        log.error("Invalid event type %s", event_type)
+        return {"ok": False, "error": "invalid_type", "corr_id": corr_id}
 
     try:
-        result = download_players_yearly_match_info(puuid, "rank_match_info", 50)
-        log.info("DONE corr_id=%s summary=%s", corr_id, json.dumps(result)[:2000])
-        return {"ok": True, "corr_id": corr_id, "result": result}
+        deadline = lambda_deadline(context)
+        if CRAWL_MODE == "fanout":
+            # paging is quick, the fan-out coordinator doesn't checkpoint (repeated chunks skip their existing manifests)
+            watermark = get_user_watermark(puuid) if event_type == EVENT_REFRESH else None
+            log.info("FANOUT corr_id=%s puuid=%s type=%s watermark=%s", corr_id, puuid, event_type, watermark)
+            result = fan_out_crawl(puuid, "rank_match_info", deadline, new_crawl_state(puuid, event_type, watermark))
+            return {"ok": True, "corr_id": corr_id, "result": result}
+        stop_at = deadline - HANDOFF_SECONDS if deadline is not None else None
+        if (state := load_crawl_state(puuid, event_type)) is not None:
+            log.info("RESUME corr_id=%s puuid=%s type=%s start=%d continuation=%s", corr_id, puuid, event_type, state["start"], event.get("continuation"))
+        else:
+            # a refresh only downloads the matches played since the newest one already stored
+            watermark = get_user_watermark(puuid) if event_type == EVENT_REFRESH else None
+            log.info("START corr_id=%s puuid=%s type=%s watermark=%s", corr_id, puuid, event_type, watermark)
+            state = new_crawl_state(puuid, event_type, watermark)
+        try:
+            download_players_yearly_match_info(puuid, "rank_match_info", 50, deadline=deadline, state=state, stop_at=stop_at)
+        except RiotDeadlineExceeded:
+            # the pages written so far are checkpointed, the rest is left to a continuation
+            log.warning("Deadline reached crawling %s at offset %d", puuid, state["start"])
+        if not state["done"]:
+            continued = continue_crawl(state, context)
+            log.info("HANDOFF corr_id=%s puuid=%s start=%d continued=%s", corr_id, puuid, state["start"], continued)
+            return {"ok": continued, "corr_id": corr_id, "continued": continued, "result": state["s3_keys"]}
+        if checkpoints is not None:
+            checkpoints.delete(checkpoint_key(puuid, event_type))
+        log.info("DONE corr_id=%s summary=%s", corr_id, json.dumps(state["s3_keys"])[:2000])
+        return {"ok": True, "corr_id": corr_id, "result": state["s3_keys"]}
     except Exception as exc:
         log.exception("FAILED corr_id=%s puuid=%s", corr_id, puuid)
-        return {"ok": False, "error": str(exc), "corr_id": corr_id}
\ No newline at end of file
+        return {"ok": False, "error": str(exc), "corr_id": corr_id}
+    finally:
+        # EMF metrics go out through stdout, write them before the invocation is frozen
+        riot_api_service.metrics.flush()
\ No newline at end of file
@@ -2,7 +2,6 @@ from dotenv import load_dotenv
 from typing import Optional
 import os, json, requests, time
 from datetime import datetime, timezone
-from collections import defaultdict
 from libs.common.constants.league_constants import LeagueTier, LeagueDivision, LeagueQueue, MATCH_V5_INFO_URL, MATCH_V5_URL, MATCH_PUUID_V5_URL
 from libs.common.riot_rate_limit_api import RiotRateLimitAPI
 
@@ -97,8 +96,6 @@ class PlayerMatchDownloader(RiotRateLimitAPI):
         if not os.path.exists(os.path.join(save_directory, puuid)):
             os.makedirs(os.path.join(save_directory, puuid))
 
-        rate_limits = []
-        rate_history = defaultdict(list)
         # Get matches from puuid
         start = 0
         bulk_count = 0
@@ -109,11 +106,11 @@ class PlayerMatchDownloader(RiotRateLimitAPI):
         last_year_from_now = int(last_year_from_now.timestamp())
         now = int(now.timestamp())
         
-        while len(match_ids_ranked := (self.call_endpoint_with_rate_limit(self.match_puuid_v5_url.format(puuid=puuid, start=start, count=count, startTime=last_year_from_now, endTime=now, type='ranked'), rate_limits, rate_history))) > 0:
+        while len(match_ids_ranked := (self.call_endpoint_with_rate_limit(self.match_puuid_v5_url.format(puuid=puuid, start=start, count=count, startTime=last_year_from_now, endTime=now, type='ranked')))) > 0:
             # get all the match-v5 objects from RANKED games
             match_obj = []
             for match_id in match_ids_ranked:
-                match_info = self.call_endpoint_with_rate_limit(self.match_v5_url.format(match_id=match_id), rate_limits, rate_history)
+                match_info = self.call_endpoint_with_rate_limit(self.match_v5_url.format(match_id=match_id))
                 match_obj.append(match_info)
             # save the result in a json file
             with open(os.path.join(save_directory, puuid, f'match_info_bulk_{bulk_count}.json'), 'w+', encoding='utf-8') as f:
@@ -0,0 +1,173 @@
+import asyncio, httpx, time
+from libs.common import json_codec
+from libs.common.circuit_breaker import Admission
+from libs.common.constants.league_constants import RIOT_LOOKUP_NEGATIVE_TTL
+from libs.common.match_cache import MatchCache
+from libs.common.metrics import MetricsSink
+from libs.common.rate_limiter import Priority, RateLimitBackend
+from libs.common.riot_errors import RiotAPIError, RiotCircuitOpen, RiotRetriesExhausted
+from libs.common.riot_rate_limit_api import CallTimings, RiotRateLimitAPI
+from libs.common.ttl_cache import MISS, TieredTTLCache
+
+class AsyncRiotRateLimitAPI(RiotRateLimitAPI):
+    '''
+    asyncio flavour of RiotRateLimitAPI backed by httpx.AsyncClient
+
+    Shares the rate windows (and the blocking call path) of RiotRateLimitAPI, so sync and async calls
+    made through the same instance count against the same budget. Up to `max_in_flight` requests are
+    kept on the wire at once, which makes bulk fetches bound by the rate limit instead of round-trip latency.
+    '''
+    def __init__(self, max_in_flight: int = 20, timeout: float = 10.0, limiters: RateLimitBackend = None, match_cache: MatchCache = None, lookup_cache: TieredTTLCache = None, priority: Priority = Priority.INTERACTIVE, metrics: MetricsSink = None):
+        super().__init__(limiters, match_cache, lookup_cache, priority, metrics)
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+
+    def make_client(self) -> httpx.AsyncClient:
+        # a new client per event loop, httpx clients can't be shared across asyncio.run() calls
+        return httpx.AsyncClient(
+            headers=dict(self.session.headers),
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.max_in_flight, max_keepalive_connections=self.max_in_flight),
+        )
+
+    async def wait_for_request_slot_async(self, keys: tuple[str, str], deadline: float = None, url: str = None):
+        '''
+        Awaits until the app and method limiters have room for one more request, without blocking the event loop
+        (the SQLite and DynamoDB backends do I/O, they're called from a thread like the cache tiers)
+        '''
+        while (wait := await asyncio.to_thread(self.limiters.try_acquire, keys, self.priority)) > 0:
+            self.check_deadline(url, deadline, wait)
+            await asyncio.sleep(wait)
+
+    async def call_endpoint_with_rate_limit_async(self, client: httpx.AsyncClient, url: str, max_retries: int = 6, deadline: float = None):
+        '''
+        Async equivalent of call_endpoint_with_rate_limit. Returns the decoded JSON (None on 404), raises a RiotAPIError
+        when Riot can't answer
+        '''
+        # the persistent cache tiers may be S3/RDS, keep their I/O off the event loop
+        if (match_id := self.match_id_from_url(url)) and (cached := await asyncio.to_thread(self.match_cache.get, match_id)) is not None:
+            self.metrics.count('CacheHits', 1, {'Family': self.endpoint_family(url)})
+            return cached
+        if (ttl := self.lookup_cache_ttl(url)) and (cached := await asyncio.to_thread(self.lookup_cache.get, url)) is not MISS:
+            self.metrics.count('CacheHits', 1, {'Family': self.endpoint_family(url)})
+            return cached
+
+        status_code, payload = await self._call_endpoint_async(client, url, max_retries, deadline)
+
+        if status_code == 200 and match_id:
+            await asyncio.to_thread(self.match_cache.put, match_id, payload)
+        elif ttl and status_code in (200, 404):
+            await asyncio.to_thread(self.lookup_cache.set, url, payload, ttl if status_code == 200 else RIOT_LOOKUP_NEGATIVE_TTL)
+        return payload
+
+    async def _call_endpoint_async(self, client: httpx.AsyncClient, url: str, max_retries: int, deadline: float = None) -> tuple[int, object]:
+        timings = CallTimings()
+        try:
+            return await self._call_with_retries_async(client, url, max_retries, deadline, timings)
+        except RiotAPIError as e:
+            timings.error = type(e).__name__
+            raise
+        finally:
+            self.record_call(url, timings)
+
+    async def _call_with_retries_async(self, client: httpx.AsyncClient, url: str, max_retries: int, deadline: float | None, timings: CallTimings) -> tuple[int, object]:
+        keys = self.rate_limit_keys(url)
+        breaker = self.circuit_breaker(keys[0])
+        status_code = None
+
+        for attempt in range(max_retries):
+            # fail fast on an open breaker without spending a rate limit slot
+            if (retry_after := breaker.retry_after()) > 0:
+                raise RiotCircuitOpen(f'Circuit open for {keys[0]}, not calling {url}', url, retry_after)
+            started = time.perf_counter()
+            await self.wait_for_request_slot_async(keys, deadline, url)
+            timings.queue_wait += time.perf_counter() - started
+            timeout = self.request_timeout(url, deadline)
+            # claimed once nothing but the request itself can fail: a half-open breaker lets a single trial through
+            if not (admission := breaker.allow()):
+                raise RiotCircuitOpen(f'Circuit open for {keys[0]}, not calling {url}', url, breaker.retry_after())
+            timings.attempts += 1
+            started = time.perf_counter()
+            try:
+                response = await client.get(self.request_url(url), timeout=timeout)
+            except httpx.HTTPError as e:
+                timings.network += time.perf_counter() - started
+                print('Request Error:', e)
+                breaker.record_failure()
+                delay = self.backoff_delay(attempt)
+            else:
+                timings.network += time.perf_counter() - started
+                status_code = timings.status_code = response.status_code
+                await asyncio.to_thread(self.update_rate_limits, keys, response.headers)
+                if status_code >= 500:
+                    breaker.record_failure()
+                    delay = self.backoff_delay(attempt)
+                    print(f'Server error {status_code}, retrying in {delay:.2f}s...')
+                else:
+                    breaker.record_success()
+                    if status_code == 200:
+                        return status_code, json_codec.loads(response.content)
+                    if status_code == 404:
+                        return status_code, None
+                    if status_code != 429:
+                        raise RiotAPIError(f'Riot returned {status_code} for {url}', url, status_code)
+                    timings.rate_limited += 1
+                    delay = float(response.headers.get('Retry-After', 1))
+                    print(f'Rate limited, sleeping for {delay}s...')
+            finally:
+                # the trial is given back if it ended without an outcome (limiter errors, cancellation...)
+                if admission == Admission.TRIAL:
+                    breaker.release_trial()
+
+            if attempt == max_retries - 1:
+                break
+            self.check_deadline(url, deadline, delay)
+            await asyncio.sleep(delay)
+            timings.retry_sleep += delay
+
+        raise RiotRetriesExhausted(f'Giving up on {url} after {max_retries} attempts (last status {status_code})', url, status_code)
+
+    async def fetch_many_async(self, urls: list[str], deadline: float = None, client: httpx.AsyncClient = None) -> list:
+        '''
+        Fetches all urls concurrently (at most max_in_flight at a time) and returns the results in input order.
+        The first RiotAPIError (ex: deadline exceeded) fails the whole batch.
+        Pass `client` to reuse its connections across batches, otherwise one is opened for this batch
+        '''
+        if not urls:
+            return []
+        if client is None:
+            async with self.make_client() as client:
+                return await self.fetch_many_async(urls, deadline, client)
+
+        # duplicate URLs in the batch share one request
+        unique_urls = list(dict.fromkeys(urls))
+        if len(unique_urls) < len(urls):
+            self.single_flight.record_coalesced(len(urls) - len(unique_urls))
+
+        results = [None] * len(unique_urls)
+
+        # until the first response tells us the rate limits of this endpoint, probe with a single
+        # request so we don't burst max_in_flight calls against an unknown budget
+        pending = list(enumerate(unique_urls))
+        _, method_key = self.rate_limit_keys(urls[0])
+        while pending and not await asyncio.to_thread(self.limiters.limits, method_key):
+            # (cache hits don't reach Riot, keep probing until a real response comes back)
+            idx, url = pending.pop(0)
+            results[idx] = await self.call_endpoint_with_rate_limit_async(client, url, deadline=deadline)
+
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async def worker(idx: int, url: str):
+            async with semaphore:
+                results[idx] = await self.call_endpoint_with_rate_limit_async(client, url, deadline=deadline)
+
+        await asyncio.gather(*(worker(idx, url) for idx, url in pending))
+
+        by_url = dict(zip(unique_urls, results))
+        return [by_url[url] for url in urls]
+
+    def fetch_many(self, urls: list[str], deadline: float = None) -> list:
+        '''
+        Blocking entry point for fetch_many_async (for Lambda handlers and other sync code)
+        '''
+        return asyncio.run(self.fetch_many_async(urls, deadline))
@@ -0,0 +1,156 @@
+'''
+Versioned bulk format for the objects the crawler writes to S3 (rank_match_info/.../{puuid}/...)
+
+Compressed newline-delimited JSON: the first line is a header, every following line is one record
+
+    {"format": "rift-bulk", "version": 1, "kind": "manifest", "puuid": "...", "count": 2}
+    {"match_id": "NA1_1"}
+    {"match_id": "NA1_2"}
+
+kinds: "manifest" (records reference matches in the match store) and "matches" (records are Match-V5 payloads).
+A manifest header's "view" says which store: "raw" (full payloads, the default) or "ingest" (see match_projection.py).
+gzip by default, zstd when requested and the `zstandard` package is installed. The reader detects the
+compression from the magic bytes, streams records one line at a time, and still reads the legacy `.json`
+objects (a JSON array of payloads, or a match_ids manifest) as version 0 bulks.
+
+Local use:
+    python -m libs.common.bulk_format FILE [FILE ...] [--records]
+'''
+import argparse, gzip, hashlib, io, json, sys
+from typing import IO, Iterable, Iterator
+from libs.common import json_codec
+
+BULK_FORMAT = 'rift-bulk'
+BULK_VERSION = 1
+KIND_MANIFEST = 'manifest'
+KIND_MATCHES = 'matches'
+BULK_EXTENSIONS = {'gzip': '.ndjson.gz', 'zstd': '.ndjson.zst'}
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+def bulk_extension(compression: str = 'gzip') -> str:
+    return BULK_EXTENSIONS[compression]
+
+def bulk_name(kind: str, match_ids: list[str], compression: str = 'gzip') -> str:
+    '''
+    Deterministic file name of a bulk over `match_ids`: match_{kind}_{first}_{last}_{hash of the IDs}{ext}
+    The same page crawled again (retry, resumed or repeated crawl) gets the same name
+    '''
+    digest = hashlib.sha1('\n'.join(match_ids).encode('utf-8')).hexdigest()[:16]
+    return f'match_{kind}_{match_ids[0]}_{match_ids[-1]}_{digest}{bulk_extension(compression)}'
+
+def is_bulk_key(key: str) -> bool:
+    '''True for S3 keys holding a bulk (current or legacy), False for anything else (ex: matches/*.json.gz)'''
+    return key.endswith('.json') or any(key.endswith(ext) for ext in BULK_EXTENSIONS.values())
+
+def make_header(kind: str, count: int, **fields) -> dict:
+    return {'format': BULK_FORMAT, 'version': BULK_VERSION, 'kind': kind, 'count': count, **fields}
+
+def encode_bulk(header: dict, records: Iterable, compression: str = 'gzip') -> bytes:
+    '''Serializes a header and its records, compressed with `compression` ("gzip" or "zstd")'''
+    ndjson = b'\n'.join([json_codec.dumps(header), *(json_codec.dumps(record) for record in records)]) + b'\n'
+    if compression == 'gzip':
+        return gzip.compress(ndjson, compresslevel=6)
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=10).compress(ndjson)
+    raise ValueError(f'Unknown bulk compression: {compression}')
+
+class _Prefixed(io.RawIOBase):
+    '''Stream that replays `head` (the bytes already read to sniff the format) before the rest of `raw`'''
+    def __init__(self, head: bytes, raw: IO[bytes]):
+        self.head = head
+        self.raw = raw
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.head:
+            n = min(len(buffer), len(self.head))
+            buffer[:n] = self.head[:n]
+            self.head = self.head[n:]
+            return n
+        data = self.raw.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def _legacy(obj) -> tuple[dict, list]:
+    if isinstance(obj, dict) and 'match_ids' in obj:
+        records = [{'match_id': match_id} for match_id in obj['match_ids']]
+        return {'format': BULK_FORMAT, 'version': 0, 'kind': KIND_MANIFEST, 'count': len(records), 'puuid': obj.get('puuid')}, records
+    return {'format': BULK_FORMAT, 'version': 0, 'kind': KIND_MATCHES, 'count': len(obj)}, obj
+
+def _bulk_lines(fileobj: IO[bytes]) -> tuple[dict | None, object]:
+    '''(header, raw record lines) of a current bulk, (None, decoded JSON) of a legacy one'''
+    head = fileobj.read(64)
+    stream = io.BufferedReader(_Prefixed(head, fileobj))
+    if head.startswith(GZIP_MAGIC):
+        lines = gzip.GzipFile(fileobj=stream)
+    elif head.startswith(ZSTD_MAGIC):
+        import zstandard
+        lines = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(stream))
+    elif _is_ndjson_header(head):
+        lines = stream
+    else:
+        return None, json_codec.loads(stream.read())
+
+    header = json_codec.loads(lines.readline())
+    if header.get('format') != BULK_FORMAT:
+        raise ValueError(f'Not a {BULK_FORMAT} bulk: {header}')
+    if header.get('version', 0) > BULK_VERSION:
+        raise ValueError(f'Unsupported {BULK_FORMAT} version {header["version"]}, this reader knows up to {BULK_VERSION}')
+    return header, (line for line in lines if line.strip())
+
+def iter_bulk(fileobj: IO[bytes]) -> tuple[dict, Iterator]:
+    '''
+    Reads a bulk from a binary stream (an open file, an S3 StreamingBody...). Returns (header, records),
+    records are decoded lazily one line at a time, except for legacy bulks which are parsed whole
+    '''
+    header, lines = _bulk_lines(fileobj)
+    if header is None:
+        header, records = _legacy(lines)
+        return header, iter(records)
+    return header, (json_codec.loads(line) for line in lines)
+
+def iter_bulk_lines(fileobj: IO[bytes]) -> tuple[dict, Iterator[bytes]]:
+    '''
+    iter_bulk without the decoding: records as their raw JSON lines (ex: to time decoders on them).
+    Legacy bulks have no lines, their records are re-encoded one per line
+    '''
+    header, lines = _bulk_lines(fileobj)
+    if header is None:
+        header, records = _legacy(lines)
+        return header, (json_codec.dumps(record) for record in records)
+    return header, lines
+
+def _is_ndjson_header(head: bytes) -> bool:
+    # an uncompressed bulk starts with its header object, legacy bulks with a JSON array or a manifest object
+    return f'"format":"{BULK_FORMAT}"'.encode() in head
+
+def read_bulk(data: bytes) -> tuple[dict, list]:
+    '''iter_bulk for bytes already in memory, records as a list'''
+    header, records = iter_bulk(io.BytesIO(data))
+    return header, list(records)
+
+def read_bulk_file(path: str) -> tuple[dict, list]:
+    with open(path, 'rb') as f:
+        header, records = iter_bulk(f)
+        return header, list(records)
+
+def main():
+    parser = argparse.ArgumentParser(description='Prints the header (and optionally the records) of bulk files')
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--records', action='store_true', help='print every record as a JSON line')
+    args = parser.parse_args()
+    for path in args.paths:
+        with open(path, 'rb') as f:
+            header, records = iter_bulk(f)
+            print(f'{path}: {json.dumps(header)}')
+            for record in records:
+                if args.records:
+                    sys.stdout.write(json_codec.dumps(record).decode('utf-8') + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import threading, time
+from enum import IntEnum
+from typing import Callable
+
+class Admission(IntEnum):
+    '''What CircuitBreaker.allow granted: falsy when the call is rejected'''
+    REJECTED = 0
+    ALLOWED = 1
+    # the single half-open trial, the caller owns it until it records an outcome or releases it
+    TRIAL = 2
+
+class CircuitBreaker:
+    '''
+    Classic closed -> open -> half-open breaker
+
+    After `failure_threshold` consecutive failures the breaker opens and rejects calls for
+    `reset_timeout` seconds, then lets a single trial call through (half-open): success closes it,
+    failure opens it again.
+    '''
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def allow(self) -> Admission:
+        '''Returns a truthy Admission if a call may be attempted now, Admission.TRIAL if it is the half-open trial'''
+        with self.lock:
+            if self.state == self.CLOSED:
+                return Admission.ALLOWED
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return Admission.TRIAL
+            return Admission.REJECTED
+
+    def release_trial(self):
+        '''
+        Gives back a half-open trial that ended without an outcome (ex: an exception before Riot answered), so the
+        next call can be the trial. Only the caller allow() returned Admission.TRIAL to may call it, a call admitted
+        while closed would release another caller's trial. No-op once record_success/record_failure ran
+        '''
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.trial_in_flight = False
+
+    def retry_after(self) -> float:
+        '''Seconds until the breaker lets a trial call through'''
+        with self.lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(self.reset_timeout - (self.clock() - self.opened_at), 0.0)
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+                self.trial_in_flight = False
@@ -14,6 +14,27 @@ GET_PLAYER_ACTIVE_REGION_URL = 'https://americas.api.riotgames.com/riot/account/
 GET_NAME_BY_PUUID_URL = 'https://americas.api.riotgames.com/riot/account/v1/accounts/by-puuid/{puuid}'
 GET_PLAYER_BY_NAME_URL = 'https://americas.api.riotgames.com/riot/account/v1/accounts/by-riot-id/{game_name}/{tag_line}'
 
+# Riot method rate limits are per endpoint, these are used to group concrete URLs by their method
+RIOT_METHOD_URLS = (
+    MATCH_PUUID_V5_URL,
+    MATCH_V5_URL,
+    MATCH_V5_INFO_URL,
+    PLAYER_RANK_URL,
+    GET_PLAYER_ACTIVE_REGION_URL,
+    GET_NAME_BY_PUUID_URL,
+    GET_PLAYER_BY_NAME_URL,
+)
+
+# Seconds account metadata lookups are cached for (they change rarely, ranks change a few times a day at most)
+RIOT_LOOKUP_CACHE_TTLS = {
+    GET_PLAYER_ACTIVE_REGION_URL: 24 * 60 * 60,
+    GET_NAME_BY_PUUID_URL: 6 * 60 * 60,
+    GET_PLAYER_BY_NAME_URL: 6 * 60 * 60,
+    PLAYER_RANK_URL: 30 * 60,
+}
+# Seconds a 404 from one of the endpoints above is cached for
+RIOT_LOOKUP_NEGATIVE_TTL = 5 * 60
+
 class RolePosition(str, Enum):
     TOP = "TOP"
     JUNGLE = "JUNGLE"
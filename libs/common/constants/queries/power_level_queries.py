@@ -18,6 +18,7 @@ SELECT EXISTS (
 ) AS exists;
 """
 
+# only through power_level_writes.write_power_levels, which keeps the user's running aggregates in step
 POWER_LEVEL_INSERT_SQL = """
 INSERT INTO app.power_levels (
   match_id, puuid,
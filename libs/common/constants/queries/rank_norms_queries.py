@@ -1,12 +1,61 @@
-REBUILD_RANK_NORMS_SQL = """
+# a bulk's new power levels, as a delta sketch of the user's tier
+INSERT_RANK_NORM_SKETCH_DELTA_SQL = """
+INSERT INTO app.rank_norm_sketch_deltas (real_rank_tier, real_rank_division, sketch)
+SELECT real_rank_tier, real_rank_division, :sketch
+FROM app.users
+WHERE puuid = :puuid AND real_rank_tier IS NOT NULL;
+"""
+
+# claims the next rebuild when the last one is older than :interval seconds and a delta is pending,
+# returns no row (without waiting) when another invocation holds the claim or it's too early
+CLAIM_RANK_NORMS_REBUILD_SQL = """
+UPDATE app.rank_norms_rebuild
+SET last_rebuild_at = now()
+WHERE id = (
+  SELECT id FROM app.rank_norms_rebuild
+  WHERE id = 1
+    AND last_rebuild_at <= now() - make_interval(secs => :interval)
+    AND EXISTS (SELECT 1 FROM app.rank_norm_sketch_deltas)
+  FOR UPDATE SKIP LOCKED
+)
+RETURNING last_rebuild_at;
+"""
+
+# the oldest :limit pending deltas (a Data API response is capped at 1 MB, the rebuild pages through them).
+# Deltas written while the rebuild runs aren't in its snapshot, they stay for the next one
+TAKE_RANK_NORM_SKETCH_DELTAS_SQL = """
+DELETE FROM app.rank_norm_sketch_deltas
+WHERE id IN (
+  SELECT id FROM app.rank_norm_sketch_deltas
+  ORDER BY id
+  LIMIT :limit
+)
+RETURNING real_rank_tier, real_rank_division, sketch;
+"""
+
+# :tiers is a comma separated list of {tier}_{division}
+GET_RANK_NORM_SKETCHES_SQL = """
+SELECT real_rank_tier, real_rank_division, sketch
+FROM app.rank_norm_sketches
+WHERE real_rank_tier || '_' || real_rank_division = ANY(string_to_array(:tiers, ','));
+"""
+
+UPSERT_RANK_NORM_SKETCH_SQL = """
+INSERT INTO app.rank_norm_sketches (real_rank_tier, real_rank_division, sketch, n, updated_at)
+VALUES (:real_rank_tier, :real_rank_division, :sketch, :n, now())
+ON CONFLICT (real_rank_tier, real_rank_division)
+DO UPDATE SET
+  sketch = EXCLUDED.sketch,
+  n = EXCLUDED.n,
+  updated_at = EXCLUDED.updated_at;
+"""
+
+# p10/p95 from the tier's sketch, k_rank: the tier's rank constant
+UPSERT_RANK_NORMS_SQL = """
 INSERT INTO app.rank_norms (real_rank_tier, real_rank_division, p10, p95, k_rank, updated_at)
-SELECT
-  u.real_rank_tier,
-  u.real_rank_division,
-  percentile_disc(0.10) WITHIN GROUP (ORDER BY pl.total)::double precision AS p10,
-  percentile_disc(0.95) WITHIN GROUP (ORDER BY pl.total)::double precision AS p95,
-  -- choose your rank constants here (example values; tweak later)
-  CASE u.real_rank_tier
+VALUES (
+  :real_rank_tier, :real_rank_division, :p10, :p95,
+  CASE :real_rank_tier
     WHEN 'IRON' THEN 0.85
     WHEN 'BRONZE' THEN 0.90
     WHEN 'SILVER' THEN 0.95
@@ -18,16 +67,45 @@ SELECT
     WHEN 'GRANDMASTER' THEN 1.20
     WHEN 'CHALLENGER' THEN 1.25
     ELSE 1.00
-  END AS k_rank,
+  END,
   now()
-FROM app.power_levels pl
-JOIN app.users u ON u.puuid = pl.puuid
-WHERE u.real_rank_tier IS NOT NULL
-GROUP BY u.real_rank_tier, u.real_rank_division
+)
 ON CONFLICT (real_rank_tier, real_rank_division)
 DO UPDATE SET
   p10 = EXCLUDED.p10,
   p95 = EXCLUDED.p95,
   k_rank = EXCLUDED.k_rank,
   updated_at = EXCLUDED.updated_at;
-"""
\ No newline at end of file
+"""
+
+# ---- reseed: the sketches rebuilt from app.power_levels (preprocess_power_level.reseed_rank_norm_sketches) ----
+
+# first statement of the reseed transaction: one snapshot for the whole scan, so every power level is either in
+# the scan or in a delta written after it, never both
+SET_REPEATABLE_READ_SQL = """
+SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;
+"""
+
+# waits for a running rebuild, and keeps the next ones out until the reseed commits
+LOCK_RANK_NORMS_REBUILD_SQL = """
+SELECT id FROM app.rank_norms_rebuild WHERE id = 1 FOR UPDATE;
+"""
+
+CLEAR_RANK_NORM_SKETCHES_SQL = """
+DELETE FROM app.rank_norm_sketches;
+"""
+
+CLEAR_RANK_NORM_SKETCH_DELTAS_SQL = """
+DELETE FROM app.rank_norm_sketch_deltas;
+"""
+
+# a page of the ranked users' power levels in primary key order, after (:after_match_id, :after_puuid)
+GET_RANKED_POWER_LEVELS_PAGE_SQL = """
+SELECT pl.match_id, pl.puuid, pl.total::double precision AS total, u.real_rank_tier, u.real_rank_division
+FROM app.power_levels pl
+JOIN app.users u ON u.puuid = pl.puuid
+WHERE u.real_rank_tier IS NOT NULL
+  AND (pl.match_id, pl.puuid) > (:after_match_id, :after_puuid)
+ORDER BY pl.match_id, pl.puuid
+LIMIT :limit;
+"""
@@ -0,0 +1,18 @@
+GET_RIOT_CACHE_SQL = """
+SELECT value
+FROM app.riot_cache
+WHERE cache_key = :cache_key AND expires_at > now()
+"""
+
+UPSERT_RIOT_CACHE_SQL = """
+INSERT INTO app.riot_cache (cache_key, value, expires_at)
+VALUES (:cache_key, :value, now() + make_interval(secs => :ttl))
+ON CONFLICT (cache_key) DO UPDATE SET
+  value      = EXCLUDED.value,
+  expires_at = EXCLUDED.expires_at;
+"""
+
+DELETE_EXPIRED_RIOT_CACHE_SQL = """
+DELETE FROM app.riot_cache
+WHERE expires_at <= now()
+"""
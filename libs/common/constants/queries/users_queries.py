@@ -9,7 +9,7 @@ OFFSET :skip
 GET_ALL_USERS_RANKED_SQL = '''
 SELECT *
 FROM app.users
-ORDER BY power_level_std DESC
+ORDER BY power_level_std DESC NULLS LAST
 LIMIT :limit
 OFFSET :skip
 '''
@@ -43,6 +43,7 @@ WHERE puuid = :puuid
 RETURNING id, puuid, game_name, tag_line, updated_at;
 """
 
+# full recompute from app.power_levels, ingestion keeps power_level up to date with UPDATE_USER_POWER_LEVEL_AGGREGATES_SQL
 UPDATE_USER_AVERAGE_POWER_LEVEL_SQL = """
 UPDATE app.users u
 SET power_level = COALESCE(pl.avg_total, 0)
@@ -64,4 +65,65 @@ WHERE u.puuid = :puuid
   AND rn.real_rank_tier = u.real_rank_tier
   AND rn.real_rank_division = u.real_rank_division
 RETURNING u.power_level_std;
-"""
\ No newline at end of file
+"""
+
+# UPDATE_USER_STD_POWER_LEVEL_SQL for every user of a tier, after its norms were rebuilt
+UPDATE_TIER_STD_POWER_LEVEL_SQL = """
+UPDATE app.users u
+SET power_level_std = 10000 * rn.k_rank *
+                      GREATEST( LEAST( (u.power_level - rn.p10) / NULLIF(rn.p95 - rn.p10, 0), 1), 0 )
+FROM app.rank_norms rn
+WHERE rn.real_rank_tier = :real_rank_tier
+  AND rn.real_rank_division = :real_rank_division
+  AND u.real_rank_tier = rn.real_rank_tier
+  AND u.real_rank_division = rn.real_rank_division;
+"""
+GET_USER_WATERMARK_SQL = """
+SELECT EXTRACT(EPOCH FROM last_match_start_time)::bigint AS last_match_start_time, last_match_id
+FROM app.users
+WHERE puuid = :puuid;
+"""
+
+# only ever moves forward, bulks can be ingested out of order
+UPDATE_USER_WATERMARK_SQL = """
+UPDATE app.users
+SET last_match_start_time = to_timestamp(:game_start_time),
+    last_match_id         = :match_id
+WHERE puuid = :puuid
+  AND (last_match_start_time IS NULL
+       OR (last_match_start_time, last_match_id) < (to_timestamp(:game_start_time), :match_id))
+RETURNING last_match_start_time, last_match_id;
+"""
+
+# taken first in the bulk's write transaction: a concurrent delivery of the same bulk waits for this one to commit,
+# then (read committed, new snapshot per statement) sees its power levels and doesn't add them to the sums again
+LOCK_USER_SQL = """
+SELECT puuid FROM app.users WHERE puuid = :puuid FOR UPDATE;
+"""
+
+# applies a bulk to the user's running aggregates after LOCK_USER_SQL and before its power levels are written, in
+# the same transaction: a new match adds to the count and the sums, a match already ingested (a bulk delivered
+# twice, a re-score) only swaps its old total for the new one. Index lookups on the bulk's IDs only, power_level is recomputed from the
+# sums. :match_ids and :totals are comma separated and aligned, so are the returned added_match_ids
+UPDATE_USER_POWER_LEVEL_AGGREGATES_SQL = """
+WITH bulk AS (
+  SELECT b.match_id, b.total, pl.total::double precision AS old_total
+  FROM unnest(string_to_array(:match_ids, ','), string_to_array(:totals, ',')::double precision[]) AS b(match_id, total)
+  LEFT JOIN app.power_levels pl ON pl.match_id = b.match_id AND pl.puuid = :puuid
+),
+delta AS (
+  SELECT COUNT(*) FILTER (WHERE old_total IS NULL)::int AS n,
+         COALESCE(string_agg(match_id, ',') FILTER (WHERE old_total IS NULL), '') AS match_ids,
+         COALESCE(SUM(total - COALESCE(old_total, 0)), 0) AS sum,
+         COALESCE(SUM(total * total - COALESCE(old_total * old_total, 0)), 0) AS sumsq
+  FROM bulk
+)
+UPDATE app.users u
+SET processed_match_count = u.processed_match_count + d.n,
+    power_level_sum       = u.power_level_sum + d.sum,
+    power_level_sumsq     = u.power_level_sumsq + d.sumsq,
+    power_level           = COALESCE((u.power_level_sum + d.sum) / NULLIF(u.processed_match_count + d.n, 0), 0)
+FROM delta d
+WHERE u.puuid = :puuid
+RETURNING u.processed_match_count, d.n AS added, d.match_ids AS added_match_ids, u.power_level;
+"""
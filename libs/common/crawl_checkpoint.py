@@ -0,0 +1,95 @@
+'''
+Checkpoints of a running match crawl, so a crawl cut short by the Lambda time limit resumes where it stopped
+
+A checkpoint is a small JSON document per player (see get_matches_when_user_created.py for its fields), written
+after every manifest upload and deleted when the crawl finishes. In S3 they go to the match store bucket, not
+the bulk bucket whose object-created events trigger the preprocess Lambda. Keys end in ".ckpt" so bulk ingestion
+(is_bulk_key) would skip them anyway.
+'''
+import json, os, tempfile
+from typing import Optional
+
+class CheckpointStore:
+    def get(self, key: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def put(self, key: str, state: dict):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+class LocalCheckpointStore(CheckpointStore):
+    '''
+    Stores checkpoints as {directory}/{key}.ckpt (local runs and tests)
+    '''
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.ckpt')
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._path(key), 'rb') as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, state: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        # write to a temp file then rename, a crash mid-write leaves the previous checkpoint
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self._path(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+class S3CheckpointStore(CheckpointStore):
+    '''
+    Stores checkpoints in S3 at s3://{bucket}/{prefix}/{key}.ckpt
+    '''
+    def __init__(self, bucket: str, prefix: str = 'checkpoints', client=None):
+        self.bucket = bucket
+        self.prefix = prefix.rstrip('/')
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('s3', region_name=os.getenv('AWS_REGION') or os.getenv('AWS_DEFAULT_REGION'))
+        return self._client
+
+    def _key(self, key: str) -> str:
+        return f'{self.prefix}/{key}.ckpt'
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            return json.loads(self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body'].read())
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def put(self, key: str, state: dict):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=json.dumps(state).encode('utf-8'), ContentType='application/json')
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+def checkpoint_store_from_env() -> Optional[CheckpointStore]:
+    '''
+    Builds the CheckpointStore configured by the environment:
+        CHECKPOINT_DIR                                                   -> local directory
+        CHECKPOINT_S3_BUCKET or MATCH_CACHE_S3_BUCKET (+ CHECKPOINT_S3_PREFIX) -> S3
+        neither                                                          -> None, crawls aren't checkpointed
+    '''
+    if directory := os.getenv('CHECKPOINT_DIR'):
+        return LocalCheckpointStore(directory)
+    if bucket := os.getenv('CHECKPOINT_S3_BUCKET') or os.getenv('MATCH_CACHE_S3_BUCKET'):
+        return S3CheckpointStore(bucket, os.getenv('CHECKPOINT_S3_PREFIX') or 'checkpoints')
+    return None
@@ -0,0 +1,43 @@
+'''
+JSON encoding/decoding for the hot paths (Riot responses, match bulks, match cache)
+
+Uses orjson if installed, else msgspec, else the standard library. All backends take bytes or str
+and produce the same compact UTF-8 output, so payloads written with one can be read by any other.
+'''
+import json
+from typing import Any
+
+try:
+    import orjson
+
+    BACKEND = 'orjson'
+
+    def loads(data: bytes | str) -> Any:
+        return orjson.loads(data)
+
+    def dumps(obj: Any) -> bytes:
+        '''Compact UTF-8 JSON'''
+        return orjson.dumps(obj)
+except ImportError:
+    try:
+        import msgspec
+
+        BACKEND = 'msgspec'
+        _decoder = msgspec.json.Decoder()
+        _encoder = msgspec.json.Encoder()
+
+        def loads(data: bytes | str) -> Any:
+            return _decoder.decode(data)
+
+        def dumps(obj: Any) -> bytes:
+            '''Compact UTF-8 JSON'''
+            return _encoder.encode(obj)
+    except ImportError:
+        BACKEND = 'json'
+
+        def loads(data: bytes | str) -> Any:
+            return json.loads(data)
+
+        def dumps(obj: Any) -> bytes:
+            '''Compact UTF-8 JSON'''
+            return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
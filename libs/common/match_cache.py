@@ -0,0 +1,166 @@
+import gzip, hashlib, os, tempfile, threading
+from collections import OrderedDict
+from typing import Optional
+from libs.common import json_codec
+
+class MatchCacheBackend:
+    '''
+    Persistent storage for Match-V5 payloads, addressed by match ID (a finished match never changes)
+    '''
+    def get(self, match_id: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def put(self, match_id: str, data: bytes):
+        raise NotImplementedError
+
+    def exists(self, match_id: str) -> bool:
+        return self.get(match_id) is not None
+
+class LocalMatchCacheBackend(MatchCacheBackend):
+    '''
+    Stores gzipped payloads under `directory`, sharded by a hash of the match ID:
+        {directory}/{sha1(match_id)[:2]}/{match_id}.json.gz
+    '''
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, match_id: str) -> str:
+        shard = hashlib.sha1(match_id.encode('utf-8')).hexdigest()[:2]
+        return os.path.join(self.directory, shard, f'{match_id}.json.gz')
+
+    def get(self, match_id: str) -> Optional[bytes]:
+        try:
+            with open(self._path(match_id), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, match_id: str, data: bytes):
+        path = self._path(match_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temp file then rename, so concurrent readers never see a partial payload
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def exists(self, match_id: str) -> bool:
+        return os.path.exists(self._path(match_id))
+
+class S3MatchCacheBackend(MatchCacheBackend):
+    '''
+    Stores gzipped payloads in S3 at s3://{bucket}/{prefix}/{match_id}.json.gz
+    '''
+    def __init__(self, bucket: str, prefix: str = 'matches', client=None):
+        self.bucket = bucket
+        self.prefix = prefix.rstrip('/')
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('s3', region_name=os.getenv('AWS_REGION') or os.getenv('AWS_DEFAULT_REGION'))
+        return self._client
+
+    def _key(self, match_id: str) -> str:
+        return f'{self.prefix}/{match_id}.json.gz'
+
+    def get(self, match_id: str) -> Optional[bytes]:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(match_id))['Body'].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def put(self, match_id: str, data: bytes):
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self._key(match_id),
+            Body=data,
+            ContentType='application/json; charset=utf-8',
+            ContentEncoding='gzip',
+        )
+
+    def exists(self, match_id: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(match_id))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+class MatchCache:
+    '''
+    Read-through cache for Match-V5 payloads: an in-memory LRU in front of an optional persistent backend
+
+    Only finished matches are stored, so a cached payload is always the final one.
+    '''
+    def __init__(self, backend: Optional[MatchCacheBackend] = None, lru_size: int = 256):
+        self.backend = backend
+        self.lru_size = lru_size
+        self._lru: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_finished(match_obj: dict) -> bool:
+        info = (match_obj or {}).get('info') or {}
+        return bool(info.get('gameEndTimestamp') or info.get('endOfGameResult') == 'GameComplete')
+
+    @staticmethod
+    def encode(match_obj: dict) -> bytes:
+        return gzip.compress(json_codec.dumps(match_obj))
+
+    @staticmethod
+    def decode(data: bytes) -> dict:
+        return json_codec.loads(gzip.decompress(data))
+
+    def _remember(self, match_id: str, match_obj: dict):
+        with self._lock:
+            self._lru[match_id] = match_obj
+            self._lru.move_to_end(match_id)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def get(self, match_id: str) -> Optional[dict]:
+        with self._lock:
+            if (match_obj := self._lru.get(match_id)) is not None:
+                self._lru.move_to_end(match_id)
+                return match_obj
+
+        if self.backend is None or (data := self.backend.get(match_id)) is None:
+            return None
+        match_obj = self.decode(data)
+        self._remember(match_id, match_obj)
+        return match_obj
+
+    def put(self, match_id: str, match_obj: dict) -> bool:
+        '''Caches a match payload, returns False (and stores nothing) if the match isn't finished'''
+        if not self.is_finished(match_obj):
+            return False
+        self._remember(match_id, match_obj)
+        if self.backend is not None:
+            self.backend.put(match_id, self.encode(match_obj))
+        return True
+
+    def contains(self, match_id: str) -> bool:
+        with self._lock:
+            if match_id in self._lru:
+                return True
+        return self.backend is not None and self.backend.exists(match_id)
+
+def match_cache_from_env(prefix: str = None) -> MatchCache:
+    '''
+    Builds the MatchCache configured by the environment:
+        MATCH_CACHE_DIR                               -> local directory backend
+        MATCH_CACHE_S3_BUCKET (+ MATCH_CACHE_S3_PREFIX) -> S3 backend
+        neither                                       -> in-memory LRU only
+    `prefix` builds a sibling store instead (ex: the ingest views): s3://{bucket}/{prefix}/ or {MATCH_CACHE_DIR}/{prefix}/
+    '''
+    lru_size = int(os.getenv('MATCH_CACHE_LRU_SIZE') or 256)
+    if directory := os.getenv('MATCH_CACHE_DIR'):
+        return MatchCache(LocalMatchCacheBackend(os.path.join(directory, prefix) if prefix else directory), lru_size)
+    if bucket := os.getenv('MATCH_CACHE_S3_BUCKET'):
+        return MatchCache(S3MatchCacheBackend(bucket, prefix or os.getenv('MATCH_CACHE_S3_PREFIX') or 'matches'), lru_size)
+    return MatchCache(lru_size=lru_size)
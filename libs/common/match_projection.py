@@ -0,0 +1,67 @@
+'''
+Ingest view of Match-V5 payloads: the same shape as the payload, keeping only the fields
+PowerLevelService.extract_all_metrics (and the preprocess Lambda's watermark) read
+
+A full payload is ~100 KB (perks, every challenge key, all ten participants' stats), its ingest view ~10 KB.
+All ten participants are kept: the stores are shared, the same view is ingested for every player of the match.
+Views are stored next to the match store, one per match:
+    s3://{MATCH_CACHE_S3_BUCKET}/{MATCH_INGEST_PREFIX or "ingest"}/{match_id}.json.gz
+
+Bump INGEST_VIEW_VERSION when the fields change, older views are then projected again from the full payload.
+'''
+import os
+from libs.common.match_cache import MatchCache, match_cache_from_env
+
+INGEST_VIEW_VERSION = 1
+
+# what a manifest's match IDs point to (header field "view", see bulk_format.py)
+VIEW_RAW = 'raw'
+VIEW_INGEST = 'ingest'
+
+METADATA_FIELDS = ('matchId', 'participants')
+# gameEndTimestamp / endOfGameResult: MatchCache only stores finished matches
+INFO_FIELDS = ('gameDuration', 'gameStartTimestamp', 'gameEndTimestamp', 'endOfGameResult')
+PARTICIPANT_FIELDS = (
+    'championName', 'champLevel', 'win',
+    'kills', 'deaths', 'assists', 'doubleKills', 'tripleKills', 'quadraKills', 'pentaKills',
+    'killingSprees', 'largestKillingSpree', 'firstBloodKill', 'firstBloodAssist',
+    'totalDamageDealtToChampions', 'totalDamageTaken', 'goldEarned',
+    'totalMinionsKilled', 'totalAllyJungleMinionsKilled', 'totalEnemyJungleMinionsKilled',
+    'visionScore', 'wardsPlaced', 'wardsKilled',
+    'longestTimeSpentLiving', 'totalTimeSpentDead', 'timeCCingOthers',
+)
+CHALLENGE_FIELDS = (
+    'riftHeraldTakedowns', 'baronTakedowns', 'dragonTakedowns', 'turretTakedowns', 'turretPlatesTaken',
+    'visionScorePerMinute', 'damagePerMinute', 'goldPerMinute', 'teamDamagePercentage', 'damageTakenOnTeamPercentage',
+    'skillshotsHit', 'skillshotsDodged', 'immobilizeAndKillWithAlly', 'soloKills', 'outnumberedKills',
+    'killParticipation', 'fullTeamTakedown', 'saveAllyFromDeath', 'pickKillWithAlly', 'killAfterHiddenWithAlly',
+    'deathsByEnemyChamps', 'survivedThreeImmobilizesInFight', 'legendaryItemUsed', 'maxLevelLeadLaneOpponent',
+    'takedownsFirstXMinutes', 'earlyLaningPhaseGoldExpAdvantage', 'enemyChampionImmobilizations',
+    'flawlessAces', 'perfectGame',
+)
+
+def _pick(obj: dict, fields: tuple) -> dict:
+    # absent keys stay absent, extract_all_metrics defaults the optional ones
+    return {field: obj[field] for field in fields if field in obj}
+
+def _project_participant(participant: dict) -> dict:
+    view = _pick(participant, PARTICIPANT_FIELDS)
+    if 'challenges' in participant:
+        view['challenges'] = _pick(participant['challenges'], CHALLENGE_FIELDS)
+    return view
+
+def project_match(match_obj: dict) -> dict:
+    '''Returns the ingest view of a Match-V5 payload'''
+    info = match_obj['info']
+    return {
+        'metadata': {**_pick(match_obj['metadata'], METADATA_FIELDS), 'ingestView': INGEST_VIEW_VERSION},
+        'info': {**_pick(info, INFO_FIELDS), 'participants': [_project_participant(p) for p in info['participants']]},
+    }
+
+def is_ingest_view(match_obj: dict) -> bool:
+    '''True for a view projected with the current fields'''
+    return (match_obj or {}).get('metadata', {}).get('ingestView') == INGEST_VIEW_VERSION
+
+def ingest_store_from_env() -> MatchCache:
+    '''The ingest view store, configured like the match store (see match_cache_from_env) under its own prefix'''
+    return match_cache_from_env(os.getenv('MATCH_INGEST_PREFIX') or 'ingest')
@@ -0,0 +1,126 @@
+import atexit, json, os, sys, threading, time
+from collections import defaultdict
+from typing import TextIO
+
+# CloudWatch rejects EMF documents with more than 100 values per metric
+EMF_MAX_VALUES = 100
+
+class MetricsSink:
+    '''
+    Destination of the client metrics: histograms (every observed value is kept) and counters,
+    both keyed by name and a dict of dimensions (ex: {"Family": "match-v5"})
+    '''
+    def histogram(self, name: str, value: float, dimensions: dict = None, unit: str = 'Milliseconds'):
+        raise NotImplementedError
+
+    def count(self, name: str, value: int = 1, dimensions: dict = None):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+class NullMetricsSink(MetricsSink):
+    def histogram(self, name: str, value: float, dimensions: dict = None, unit: str = 'Milliseconds'):
+        pass
+
+    def count(self, name: str, value: int = 1, dimensions: dict = None):
+        pass
+
+class InMemoryMetricsSink(MetricsSink):
+    '''
+    Keeps everything in memory (tests, benchmarks): histograms[(name, dims)] -> values, counters[(name, dims)] -> total
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms: dict[tuple, list[float]] = defaultdict(list)
+        self.counters: dict[tuple, int] = defaultdict(int)
+
+    def histogram(self, name: str, value: float, dimensions: dict = None, unit: str = 'Milliseconds'):
+        with self.lock:
+            self.histograms[(name, tuple(sorted((dimensions or {}).items())))].append(value)
+
+    def count(self, name: str, value: int = 1, dimensions: dict = None):
+        with self.lock:
+            self.counters[(name, tuple(sorted((dimensions or {}).items())))] += value
+
+class EmfMetricsSink(MetricsSink):
+    '''
+    Buffers metrics and writes them to stdout in CloudWatch Embedded Metric Format, Lambda ships
+    stdout to CloudWatch Logs which extracts the metrics (no PutMetricData calls on the hot path)
+
+    Buffered values are written on flush(), at most every `flush_interval` seconds while recording
+    and at interpreter exit. Lambda handlers should flush before returning, the process may be frozen after.
+    '''
+    def __init__(self, namespace: str = 'RiftRewind/Riot', flush_interval: float = 60.0, stream: TextIO = None):
+        self.namespace = namespace
+        self.flush_interval = flush_interval
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        # dimensions -> metric name -> (unit, values); counters are kept as a single summed value
+        self.metrics: dict[tuple, dict[str, tuple[str, list[float]]]] = defaultdict(dict)
+        atexit.register(self.flush)
+
+    def _record(self, name: str, unit: str, dimensions: dict, value: float, accumulate: bool):
+        with self.lock:
+            unit_values = self.metrics[tuple(sorted((dimensions or {}).items()))].setdefault(name, (unit, []))[1]
+            if accumulate and unit_values:
+                unit_values[0] += value
+            else:
+                unit_values.append(value)
+            due = time.monotonic() - self.last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def histogram(self, name: str, value: float, dimensions: dict = None, unit: str = 'Milliseconds'):
+        self._record(name, unit, dimensions, value, accumulate=False)
+
+    def count(self, name: str, value: int = 1, dimensions: dict = None):
+        self._record(name, 'Count', dimensions, value, accumulate=True)
+
+    def documents(self, metrics: dict, timestamp_ms: int) -> list[dict]:
+        '''Builds the EMF documents of the buffered metrics, one per dimension set and 100 values per metric'''
+        documents = []
+        for dims, by_name in metrics.items():
+            offset = 0
+            while True:
+                chunk = {name: values[offset:offset + EMF_MAX_VALUES] for name, (_, values) in by_name.items()}
+                chunk = {name: values for name, values in chunk.items() if values}
+                if not chunk:
+                    break
+                documents.append({
+                    '_aws': {
+                        'Timestamp': timestamp_ms,
+                        'CloudWatchMetrics': [{
+                            'Namespace': self.namespace,
+                            'Dimensions': [[key for key, _ in dims]],
+                            'Metrics': [{'Name': name, 'Unit': by_name[name][0]} for name in chunk],
+                        }],
+                    },
+                    **dict(dims),
+                    **{name: values if len(values) > 1 else values[0] for name, values in chunk.items()},
+                })
+                offset += EMF_MAX_VALUES
+        return documents
+
+    def flush(self):
+        with self.lock:
+            metrics, self.metrics = self.metrics, defaultdict(dict)
+            self.last_flush = time.monotonic()
+        stream = self.stream or sys.stdout
+        for document in self.documents(metrics, int(time.time() * 1000)):
+            stream.write(json.dumps(document, separators=(',', ':')) + '\n')
+        stream.flush()
+
+def metrics_sink_from_env() -> MetricsSink:
+    '''
+    Builds the MetricsSink selected by RIOT_METRICS_SINK:
+        unset / "emf" -> EmfMetricsSink (namespace from RIOT_METRICS_NAMESPACE)
+        "none"        -> NullMetricsSink
+    '''
+    sink = os.getenv('RIOT_METRICS_SINK') or 'emf'
+    if sink == 'emf':
+        return EmfMetricsSink(os.getenv('RIOT_METRICS_NAMESPACE') or 'RiftRewind/Riot')
+    if sink == 'none':
+        return NullMetricsSink()
+    raise ValueError(f'Invalid RIOT_METRICS_SINK: {sink}')
@@ -0,0 +1,48 @@
+'''
+Writes to app.power_levels that keep what is derived from it in step, for the preprocess Lambda and the API alike:
+the user's running aggregates (users.processed_match_count, power_level_sum, power_level_sumsq, power_level, see
+migrations/006) and the rank norm sketches (a delta sketch of the new power levels, see migrations/005).
+A power level written any other way is missing from both until the user's sums are recomputed.
+'''
+from typing import Optional
+from libs.common.constants.queries.power_level_queries import POWER_LEVEL_INSERT_SQL
+from libs.common.constants.queries.rank_norms_queries import INSERT_RANK_NORM_SKETCH_DELTA_SQL
+from libs.common.constants.queries.users_queries import LOCK_USER_SQL, UPDATE_USER_POWER_LEVEL_AGGREGATES_SQL
+from libs.common.quantile_sketch import KLLSketch
+from libs.common.rds_service import RdsDataService
+
+# rows per Data API batch_execute_statement call (requests are capped at 4 MB)
+WRITE_BATCH_SIZE = 100
+
+def batch_write(rds: RdsDataService, sql: str, parameter_sets: list, transaction_id: str = None, batch_size: int = WRITE_BATCH_SIZE):
+    for i in range(0, len(parameter_sets), batch_size):
+        rds.batch_exec(sql, parameter_sets[i:i + batch_size], transaction_id)
+
+def write_power_levels(rds: RdsDataService, puuid: str, power_levels: list[tuple[str, dict]], transaction_id: str, batch_size: int = WRITE_BATCH_SIZE) -> Optional[dict]:
+    '''
+    Upserts the (match ID, power level) pairs of a user inside the caller's transaction: locks the user's row,
+    applies them to the running aggregates (a match already there only swaps its old total for the new one),
+    writes them and queues the new matches' totals for the rank norms.
+    Returns the aggregates row (processed_match_count, added, added_match_ids, power_level), None when the user
+    doesn't exist (nothing is written)
+    '''
+    # serializes the writes of a user (ex: an S3 event delivered twice at once, an API upsert during ingestion),
+    # the aggregates below must see the power levels committed before
+    rds.exec(LOCK_USER_SQL, {"puuid": puuid}, transaction_id)
+    # before the writes: the old totals are read from app.power_levels
+    row = rds.query_one(UPDATE_USER_POWER_LEVEL_AGGREGATES_SQL, {
+        "puuid": puuid,
+        "match_ids": ",".join(match_id for match_id, _ in power_levels),
+        "totals": ",".join(str(float(power_level["total"])) for _, power_level in power_levels),
+    }, transaction_id)
+    if row is None:
+        return None
+    batch_write(rds, POWER_LEVEL_INSERT_SQL, [{**power_level, "match_id": match_id, "puuid": puuid} for match_id, power_level in power_levels], transaction_id, batch_size)
+    # only the new matches go in the tier's sketch, a re-ingested match is already in it
+    added = set(filter(None, (row.get("added_match_ids") or "").split(",")))
+    delta = KLLSketch()
+    delta.extend(power_level["total"] for match_id, power_level in power_levels if match_id in added)
+    if delta.n:
+        # folded in the tier's norms by the next rank norms rebuild (preprocess_power_level.maybe_rebuild_rank_norms)
+        rds.exec(INSERT_RANK_NORM_SKETCH_DELTA_SQL, {"puuid": puuid, "sketch": delta.to_json()}, transaction_id)
+    return row
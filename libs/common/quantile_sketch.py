@@ -0,0 +1,100 @@
+'''
+KLL quantile sketch (Karnin, Lang, Liberty 2016): approximate quantiles of a stream in O(k log(n/k)) memory
+
+Sketches are mergeable, the rank norms keep one per (tier, division) and fold each bulk's power levels into it
+(see preprocess_power_level.maybe_rebuild_rank_norms). Quantiles follow percentile_disc: the smallest value whose
+cumulative weight reaches q, so a sketch that never compacted (fewer than ~k values) gives exactly percentile_disc.
+With the default k=200 the rank error stays around 1% of n.
+
+Serialized as JSON: {"k": 200, "n": 1234, "levels": [[level 0 values], [level 1 values], ...]}, a value at
+level h stands for 2^h values. A single level holding raw values is a valid sketch, compacted when loaded.
+The stored sketches are built from app.power_levels by preprocess_power_level.reseed_rank_norm_sketches (invoke
+the rank norms Lambda with {"reseed": true}).
+'''
+import json, math, random
+
+class KLLSketch:
+    def __init__(self, k: int = 200, c: float = 2 / 3, seed: int = None):
+        self.k = k
+        self.c = c
+        self.n = 0
+        self.compactors: list[list] = []
+        self.size = 0
+        self.max_size = 0
+        self._rng = random.Random(seed)
+        self._grow()
+
+    def _grow(self):
+        self.compactors.append([])
+        self.max_size = sum(self._capacity(h) for h in range(len(self.compactors)))
+
+    def _capacity(self, h: int) -> int:
+        # the top level holds k values, every level below it c times fewer (at least 2)
+        depth = len(self.compactors) - h - 1
+        return int(math.ceil(self.k * self.c ** depth)) + 1
+
+    def _compact(self, h: int) -> list:
+        '''Halves level h: sorts it and promotes every other value (random offset), an odd one out stays'''
+        items = sorted(self.compactors[h])
+        self.compactors[h] = [items.pop()] if len(items) % 2 else []
+        return items[self._rng.randint(0, 1)::2]
+
+    def _compress(self):
+        while self.size >= self.max_size:
+            for h in range(len(self.compactors)):
+                if len(self.compactors[h]) >= self._capacity(h):
+                    if h + 1 == len(self.compactors):
+                        self._grow()
+                    self.compactors[h + 1].extend(self._compact(h))
+                    self.size = sum(map(len, self.compactors))
+                    if self.size < self.max_size:
+                        break
+
+    def update(self, value):
+        self.compactors[0].append(value)
+        self.size += 1
+        self.n += 1
+        self._compress()
+
+    def extend(self, values):
+        for value in values:
+            self.update(value)
+
+    def merge(self, other: 'KLLSketch'):
+        '''Folds `other` into this sketch'''
+        self.merge_levels(other.compactors, other.n)
+
+    def quantile(self, q: float):
+        '''percentile_disc(q) of the values seen (approximate once compacted), None for an empty sketch'''
+        weighted = sorted((value, 1 << h) for h, items in enumerate(self.compactors) for value in items)
+        if not weighted:
+            return None
+        total = sum(weight for _, weight in weighted)
+        # same rank as Postgres' percentile_disc: ceil(q * n), at least the first value
+        rank = max(1, math.ceil(q * total))
+        cumulative = 0
+        for value, weight in weighted:
+            cumulative += weight
+            if cumulative >= rank:
+                return value
+        return weighted[-1][0]
+
+    def to_json(self) -> str:
+        return json.dumps({'k': self.k, 'n': self.n, 'levels': self.compactors})
+
+    @classmethod
+    def from_json(cls, data: str) -> 'KLLSketch':
+        obj = json.loads(data)
+        sketch = cls(obj.get('k', 200))
+        sketch.merge_levels(obj['levels'], obj.get('n'))
+        return sketch
+
+    def merge_levels(self, levels: list[list], n: int = None):
+        '''Folds serialized levels in (`n` defaults to the weight they stand for)'''
+        while len(self.compactors) < len(levels):
+            self._grow()
+        for h, items in enumerate(levels):
+            self.compactors[h].extend(items)
+        self.n += n if n is not None else sum(len(items) << h for h, items in enumerate(levels))
+        self.size = sum(map(len, self.compactors))
+        self._compress()
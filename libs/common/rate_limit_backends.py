@@ -0,0 +1,186 @@
+import os, sqlite3, threading, time
+from typing import Callable
+from libs.common.rate_limiter import DEFAULT_INTERACTIVE_RESERVE, Priority, RateLimitBackend, RateLimiterRegistry, allowed_requests
+
+class SqliteRateLimitBackend(RateLimitBackend):
+    '''
+    RateLimitBackend stored in a SQLite file, shared by every process (and thread) that opens the same path
+
+    Each reservation is one `BEGIN IMMEDIATE` transaction, so concurrent processes serialize on the
+    database lock only for the duration of the check, never while waiting for a slot.
+    Meant for local runs and tests, production should use a central store (see DynamoDBRateLimitBackend).
+    '''
+    def __init__(self, path: str, clock: Callable[[], float] = time.time, sleep: Callable[[float], None] = time.sleep, interactive_reserve: float = DEFAULT_INTERACTIVE_RESERVE):
+        self.path = path
+        self.clock = clock
+        self.sleep = sleep
+        self.interactive_reserve = interactive_reserve
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    key TEXT NOT NULL, window REAL NOT NULL, lim INTEGER NOT NULL,
+                    PRIMARY KEY (key, window)
+                );
+                CREATE TABLE IF NOT EXISTS rate_hits (
+                    key TEXT NOT NULL, window REAL NOT NULL, ts REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS rate_hits_idx ON rate_hits (key, window, ts);
+            ''')
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared across threads, keep one per thread
+        if (conn := getattr(self._local, 'conn', None)) is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _limits(self, conn: sqlite3.Connection, key: str) -> list[tuple[int, int]]:
+        return [(lim, window) for lim, window in conn.execute('SELECT lim, window FROM rate_limits WHERE key = ? ORDER BY window', (key,))]
+
+    def limits(self, key: str) -> list[tuple[int, int]]:
+        return self._limits(self._conn(), key)
+
+    def update_limits(self, key: str, limits: list[tuple[int, int]]):
+        conn = self._conn()
+        if self._limits(conn, key) == sorted(limits, key=lambda l: l[1]):
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM rate_limits WHERE key = ?', (key,))
+            conn.executemany('INSERT INTO rate_limits (key, window, lim) VALUES (?, ?, ?)', [(key, window, lim) for lim, window in limits])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def sync_counts(self, key: str, counts: list[tuple[int, int]]):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = self.clock()
+            for count, window in counts:
+                conn.execute('DELETE FROM rate_hits WHERE key = ? AND window = ? AND ts <= ?', (key, window, now - window))
+                used, = conn.execute('SELECT COUNT(*) FROM rate_hits WHERE key = ? AND window = ?', (key, window)).fetchone()
+                conn.executemany('INSERT INTO rate_hits (key, window, ts) VALUES (?, ?, ?)', [(key, window, now)] * (count - used))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def try_acquire(self, keys: tuple[str, ...], priority: Priority = Priority.INTERACTIVE) -> float:
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = self.clock()
+            wait = 0.0
+            windows = [(key, lim, window) for key in keys for lim, window in self._limits(conn, key)]
+            for key, lim, window in windows:
+                allowed = allowed_requests(lim, priority, self.interactive_reserve)
+                conn.execute('DELETE FROM rate_hits WHERE key = ? AND window = ? AND ts <= ?', (key, window, now - window))
+                used, = conn.execute('SELECT COUNT(*) FROM rate_hits WHERE key = ? AND window = ?', (key, window)).fetchone()
+                if used >= allowed:
+                    oldest, = conn.execute(
+                        'SELECT ts FROM rate_hits WHERE key = ? AND window = ? ORDER BY ts LIMIT 1 OFFSET ?',
+                        (key, window, used - allowed),
+                    ).fetchone()
+                    wait = max(wait, oldest + window - now)
+            if wait <= 0:
+                conn.executemany('INSERT INTO rate_hits (key, window, ts) VALUES (?, ?, ?)', [(key, window, now) for key, _, window in windows])
+            conn.execute('COMMIT')
+            return max(wait, 0.0)
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+class DynamoDBRateLimitBackend(RateLimitBackend):
+    '''
+    RateLimitBackend backed by fixed-window counters in a DynamoDB table, shared by the whole fleet
+
+    Table: partition key `pk` (S), TTL attribute `expires_at`. One item per (key, window, window start),
+    all the windows of a call are incremented in a single TransactWriteItems guarded by `hits < limit`,
+    so a reservation either lands in every window or in none. Limits are learned from the Riot headers
+    by every instance, they are identical for the same API key.
+    '''
+    def __init__(self, table_name: str, region_name: str = None, client=None, clock: Callable[[], float] = time.time, sleep: Callable[[float], None] = time.sleep, interactive_reserve: float = DEFAULT_INTERACTIVE_RESERVE):
+        import boto3
+        self.table_name = table_name
+        self.client = client or boto3.client('dynamodb', region_name=region_name or os.getenv('AWS_REGION') or os.getenv('AWS_DEFAULT_REGION'))
+        self.clock = clock
+        self.sleep = sleep
+        self.interactive_reserve = interactive_reserve
+        self._limits: dict[str, list[tuple[int, int]]] = {}
+
+    def _item_key(self, key: str, window: int, now: float) -> tuple[dict, int]:
+        start = int(now // window) * window
+        return {'pk': {'S': f'{key}|{window}|{start}'}}, start + window
+
+    def limits(self, key: str) -> list[tuple[int, int]]:
+        return self._limits.get(key, [])
+
+    def update_limits(self, key: str, limits: list[tuple[int, int]]):
+        self._limits[key] = list(limits)
+
+    def sync_counts(self, key: str, counts: list[tuple[int, int]]):
+        from botocore.exceptions import ClientError
+        now = self.clock()
+        for count, window in counts:
+            item_key, end = self._item_key(key, window, now)
+            try:
+                self.client.update_item(
+                    TableName=self.table_name,
+                    Key=item_key,
+                    UpdateExpression='SET hits = :count, expires_at = :expires',
+                    ConditionExpression='attribute_not_exists(hits) OR hits < :count',
+                    ExpressionAttributeValues={':count': {'N': str(count)}, ':expires': {'N': str(int(end) + 60)}},
+                )
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+
+    def try_acquire(self, keys: tuple[str, ...], priority: Priority = Priority.INTERACTIVE) -> float:
+        from botocore.exceptions import ClientError
+        now = self.clock()
+        windows = [(key, lim, window) for key in keys for lim, window in self.limits(key)]
+        if not windows:
+            return 0.0
+
+        items, ends = [], []
+        for key, lim, window in windows:
+            item_key, end = self._item_key(key, window, now)
+            ends.append(end)
+            items.append({'Update': {
+                'TableName': self.table_name,
+                'Key': item_key,
+                'UpdateExpression': 'ADD hits :one SET expires_at = :expires',
+                'ConditionExpression': 'attribute_not_exists(hits) OR hits < :lim',
+                'ExpressionAttributeValues': {':one': {'N': '1'}, ':lim': {'N': str(allowed_requests(lim, priority, self.interactive_reserve))}, ':expires': {'N': str(int(end) + 60)}},
+            }})
+        try:
+            self.client.transact_write_items(TransactItems=items)
+            return 0.0
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'TransactionCanceledException':
+                raise
+            # the cancellation reasons are in the same order as the items, wait for every full window to roll over
+            reasons = e.response.get('CancellationReasons', [])
+            full = [end for end, reason in zip(ends, reasons) if reason.get('Code') == 'ConditionalCheckFailed']
+            return max((end - now for end in full), default=0.05)
+
+def rate_limit_backend_from_env() -> RateLimitBackend:
+    '''
+    Builds the RateLimitBackend selected by RATE_LIMIT_BACKEND:
+        unset / "local"         -> in-process limiters
+        "sqlite:<path>"         -> SqliteRateLimitBackend shared by processes on this machine
+        "dynamodb:<table name>" -> DynamoDBRateLimitBackend shared by the whole fleet
+    '''
+    backend = os.getenv('RATE_LIMIT_BACKEND') or 'local'
+    kind, _, target = backend.partition(':')
+    if kind == 'local':
+        return RateLimiterRegistry()
+    if kind == 'sqlite' and target:
+        return SqliteRateLimitBackend(target)
+    if kind == 'dynamodb' and target:
+        return DynamoDBRateLimitBackend(target)
+    raise ValueError(f'Invalid RATE_LIMIT_BACKEND: {backend}')
@@ -0,0 +1,228 @@
+import math, threading, time
+from collections import deque
+from enum import Enum
+from typing import Callable, Optional
+
+class Priority(Enum):
+    '''
+    Traffic classes sharing the Riot budget. Background traffic (backfills, ingestion) can only use
+    part of every window, the rest is headroom kept for interactive calls (API requests)
+    '''
+    INTERACTIVE = "interactive"
+    BACKGROUND = "background"
+
+# share of every window that background traffic can't use
+DEFAULT_INTERACTIVE_RESERVE = 0.2
+
+def allowed_requests(limit: int, priority: Priority, interactive_reserve: float) -> int:
+    '''Number of requests `priority` traffic may make in a window of `limit` requests'''
+    if priority is Priority.INTERACTIVE:
+        return limit
+    # always leave background at least one request per window
+    return max(limit - math.ceil(limit * interactive_reserve), 1)
+
+class SlidingWindow:
+    '''
+    A single Riot rate window, ex: "20:1" -> at most 20 requests in any 1 second span
+
+    Keeps the timestamps of the requests made inside the window in a deque, so expiring old
+    entries and recording new ones are both (amortized) O(1)
+    '''
+    __slots__ = ('limit', 'window', 'timestamps')
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.timestamps = deque()
+
+    def prune(self, now: float):
+        '''Drops the timestamps that have fallen out of the window'''
+        timestamps = self.timestamps
+        while timestamps and now - timestamps[0] >= self.window:
+            timestamps.popleft()
+
+    def wait_time(self, now: float, allowed: Optional[int] = None) -> float:
+        '''
+        Seconds until this window has room for one more request (0 if it has room now),
+        `allowed` caps the usable part of the window (see allowed_requests)
+        '''
+        self.prune(now)
+        limit = self.limit if allowed is None else allowed
+        used = len(self.timestamps)
+        if used < limit:
+            return 0.0
+        # the slot frees up once enough of the oldest requests expire
+        # (normally used == limit, so this is the oldest timestamp)
+        return self.timestamps[used - limit] + self.window - now
+
+    def add(self, now: float):
+        self.timestamps.append(now)
+
+    def sync_count(self, count: int, now: float):
+        '''
+        Aligns the window with the server side count (X-*-Rate-Limit-Count). Only ever adds usage: requests
+        made by someone else with the same key show up as extra timestamps at `now`
+        '''
+        self.prune(now)
+        for _ in range(count - len(self.timestamps)):
+            self.timestamps.append(now)
+
+class RateLimiter:
+    '''
+    Thread-safe multi-window limiter (ex: 20 requests/1s AND 100 requests/120s)
+
+    `try_acquire` atomically checks every window and either reserves a slot in all of them or
+    reserves nothing and returns how long to wait. `acquire` loops on it and sleeps *outside* the lock,
+    so a thread waiting for a slot never blocks other threads from checking or reserving.
+    '''
+    def __init__(self, limits: Optional[list[tuple[int, int]]] = None, clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep, lock: Optional[threading.Lock] = None, interactive_reserve: float = DEFAULT_INTERACTIVE_RESERVE):
+        self.clock = clock
+        self.sleep = sleep
+        self.interactive_reserve = interactive_reserve
+        # limiters that must be reserved together (see RateLimiterRegistry) share one lock
+        self.lock = lock or threading.Lock()
+        self.windows: list[SlidingWindow] = []
+        if limits:
+            self.update_limits(limits)
+
+    @property
+    def limits(self) -> list[tuple[int, int]]:
+        return [(w.limit, w.window) for w in self.windows]
+
+    def update_limits(self, limits: list[tuple[int, int]]):
+        '''
+        Replaces the rate windows with `limits` [(count, seconds), ...]; history of windows
+        with the same duration is kept so a limit change doesn't reset the budget
+        '''
+        with self.lock:
+            existing = {w.window: w for w in self.windows}
+            windows = []
+            for limit, window in limits:
+                w = existing.get(window) or SlidingWindow(limit, window)
+                w.limit = limit
+                windows.append(w)
+            self.windows = windows
+
+    def sync_counts(self, counts: list[tuple[int, int]]):
+        '''
+        Seeds the windows from the live counts [(count, seconds), ...] returned by Riot
+        '''
+        with self.lock:
+            now = self.clock()
+            by_window = {w.window: w for w in self.windows}
+            for count, window in counts:
+                if (w := by_window.get(window)) is not None:
+                    w.sync_count(count, now)
+
+    def _wait_time(self, now: float, priority: Priority) -> float:
+        # caller holds self.lock
+        return max((w.wait_time(now, allowed_requests(w.limit, priority, self.interactive_reserve)) for w in self.windows), default=0.0)
+
+    def _reserve(self, now: float):
+        # caller holds self.lock
+        for w in self.windows:
+            w.add(now)
+
+    def try_acquire(self, priority: Priority = Priority.INTERACTIVE) -> float:
+        '''
+        Reserves a slot in every window and returns 0, or returns the seconds to wait if any window is full
+        '''
+        with self.lock:
+            now = self.clock()
+            if (wait := self._wait_time(now, priority)) > 0:
+                return wait
+            self._reserve(now)
+            return 0.0
+
+    def acquire(self, priority: Priority = Priority.INTERACTIVE) -> float:
+        '''
+        Blocks until a slot is reserved in every window. Returns the total time spent waiting
+        '''
+        waited = 0.0
+        # re-check every window after each sleep, another window may have filled up in the meantime
+        while (wait := self.try_acquire(priority)) > 0:
+            self.sleep(wait)
+            waited += wait
+        return waited
+
+class RateLimitBackend:
+    '''
+    Storage for named rate limiters that can be shared between processes (see rate_limit_backends.py)
+
+    Implementations only have to provide the non-blocking primitives, waiting always happens in the
+    caller (outside of any lock/transaction) so a backend can be anything with an atomic
+    "check every window and reserve" operation: an in-process dict, a SQLite file, a central counter store...
+    Background priority reservations may only use `allowed_requests` of every window.
+    '''
+    sleep: Callable[[float], None] = staticmethod(time.sleep)
+    interactive_reserve: float = DEFAULT_INTERACTIVE_RESERVE
+
+    def limits(self, key: str) -> list[tuple[int, int]]:
+        '''The known (count, seconds) windows of `key`, empty if not known yet'''
+        raise NotImplementedError
+
+    def update_limits(self, key: str, limits: list[tuple[int, int]]):
+        raise NotImplementedError
+
+    def sync_counts(self, key: str, counts: list[tuple[int, int]]):
+        '''Seeds the windows of `key` from the live counts returned by Riot'''
+        raise NotImplementedError
+
+    def try_acquire(self, keys: tuple[str, ...], priority: Priority = Priority.INTERACTIVE) -> float:
+        '''
+        Reserves a slot in every limiter of `keys` and returns 0, or returns the seconds to wait (nothing reserved)
+        '''
+        raise NotImplementedError
+
+    def acquire(self, keys: tuple[str, ...], priority: Priority = Priority.INTERACTIVE) -> float:
+        '''
+        Blocks until a slot is reserved in every limiter of `keys`. Returns the total time spent waiting
+        '''
+        waited = 0.0
+        while (wait := self.try_acquire(keys, priority)) > 0:
+            self.sleep(wait)
+            waited += wait
+        return waited
+
+class RateLimiterRegistry(RateLimitBackend):
+    '''
+    In-process RateLimitBackend: named RateLimiters (ex: one per Riot routing host and one per
+    method on that host) that are reserved together
+
+    All limiters share a single lock, so `try_acquire(keys)` either takes a slot from every limiter
+    in `keys` or from none of them. Limiters are created lazily without windows (unlimited) until
+    their limits are known.
+    '''
+    def __init__(self, clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep, interactive_reserve: float = DEFAULT_INTERACTIVE_RESERVE):
+        self.clock = clock
+        self.sleep = sleep
+        self.interactive_reserve = interactive_reserve
+        self.lock = threading.Lock()
+        self.limiters: dict[str, RateLimiter] = {}
+
+    def get(self, key: str) -> RateLimiter:
+        if (limiter := self.limiters.get(key)) is None:
+            limiter = self.limiters.setdefault(key, RateLimiter(clock=self.clock, sleep=self.sleep, lock=self.lock, interactive_reserve=self.interactive_reserve))
+        return limiter
+
+    def limits(self, key: str) -> list[tuple[int, int]]:
+        return self.get(key).limits
+
+    def update_limits(self, key: str, limits: list[tuple[int, int]]):
+        limiter = self.get(key)
+        if limiter.limits != limits:
+            limiter.update_limits(limits)
+
+    def sync_counts(self, key: str, counts: list[tuple[int, int]]):
+        self.get(key).sync_counts(counts)
+
+    def try_acquire(self, keys: tuple[str, ...], priority: Priority = Priority.INTERACTIVE) -> float:
+        limiters = [self.get(key) for key in keys]
+        with self.lock:
+            now = self.clock()
+            wait = max((limiter._wait_time(now, priority) for limiter in limiters), default=0.0)
+            if wait > 0:
+                return wait
+            for limiter in limiters:
+                limiter._reserve(now)
+            return 0.0
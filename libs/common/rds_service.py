@@ -177,6 +177,7 @@ class RdsDataService:
         self,
         sql: str,
         parameter_sets: Sequence[Dict[str, Any]],
+        transaction_id: Optional[str] = None,
         retries: Optional[int] = None,
         backoff: Optional[float] = None,
     ) -> Dict[str, Any]:
@@ -190,6 +191,7 @@ class RdsDataService:
                 "database": self.database,
                 "sql": sql,
                 "parameterSets": sets,
+                **({"transactionId": transaction_id} if transaction_id else {}),
             },
             retries,
             backoff,
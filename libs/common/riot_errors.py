@@ -0,0 +1,18 @@
+class RiotAPIError(Exception):
+    '''Base class of the errors raised by RiotRateLimitAPI when Riot can't answer a call'''
+    def __init__(self, message: str, url: str = None, status_code: int = None):
+        super().__init__(message)
+        self.url = url
+        self.status_code = status_code
+
+class RiotRetriesExhausted(RiotAPIError):
+    '''Every retry of the call failed (5xx, 429 or network errors)'''
+
+class RiotDeadlineExceeded(RiotAPIError):
+    '''The call (including waiting for a rate slot and retry sleeps) can't finish before the caller's deadline'''
+
+class RiotCircuitOpen(RiotAPIError):
+    '''Riot has been failing for this routing host, the call wasn't attempted'''
+    def __init__(self, message: str, url: str = None, retry_after: float = None):
+        super().__init__(message, url)
+        self.retry_after = retry_after
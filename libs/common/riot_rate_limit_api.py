@@ -1,7 +1,59 @@
-import requests, threading, os, time
-from collections import defaultdict
-class RiotRateLimitAPI:
+import requests, os, random, re, threading, time
+from urllib.parse import urlsplit
+from libs.common import json_codec
+from libs.common.constants.league_constants import RIOT_METHOD_URLS, MATCH_V5_URL, RIOT_LOOKUP_CACHE_TTLS, RIOT_LOOKUP_NEGATIVE_TTL
+from libs.common.circuit_breaker import Admission, CircuitBreaker
+from libs.common.match_cache import MatchCache, match_cache_from_env
+from libs.common.metrics import MetricsSink, metrics_sink_from_env
+from libs.common.rate_limiter import Priority, RateLimitBackend
+from libs.common.rate_limit_backends import rate_limit_backend_from_env
+from libs.common.riot_errors import RiotAPIError, RiotCircuitOpen, RiotDeadlineExceeded, RiotRetriesExhausted
+from libs.common.single_flight import SingleFlight, SingleFlightTimeout
+from libs.common.ttl_cache import MISS, TieredTTLCache, ttl_cache_from_env
+
+def _method_pattern(url_template: str) -> tuple[re.Pattern, str]:
+    '''Compiles the path of a Riot URL template, ex: /lol/match/v5/matches/{match_id} -> regex matching any match id'''
+    path = urlsplit(url_template).path
+    regex = re.sub(r'\\\{[^}]+\\\}', '[^/]+', re.escape(path))
+    return re.compile(f'^{regex}$'), path
+
+METHOD_PATTERNS = [_method_pattern(url) for url in RIOT_METHOD_URLS]
+MATCH_V5_PATTERN, _ = _method_pattern(MATCH_V5_URL)
+# method path template -> TTL of the account metadata lookups that are cached
+LOOKUP_CACHE_TTLS = {_method_pattern(url)[1]: ttl for url, ttl in RIOT_LOOKUP_CACHE_TTLS.items()}
+
+def lambda_deadline(context, safety_margin: float = 15.0) -> float | None:
+    '''
+    Riot call deadline (time.monotonic() value) for a Lambda invocation: its remaining time minus `safety_margin`
+    seconds to log and write results. None when there is no Lambda context (local runs)
+    '''
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return None
+    return time.monotonic() + context.get_remaining_time_in_millis() / 1000 - safety_margin
+
+class CallTimings:
+    '''
+    Where the time of one Riot call went (seconds): waiting for a rate slot, on the wire, sleeping between retries
+    '''
+    __slots__ = ('queue_wait', 'network', 'retry_sleep', 'attempts', 'rate_limited', 'status_code', 'error')
+
     def __init__(self):
+        self.queue_wait = self.network = self.retry_sleep = 0.0
+        self.attempts = self.rate_limited = 0
+        self.status_code = None
+        self.error = None
+
+class RiotRateLimitAPI:
+    # retry sleeps on 5xx/network errors: random in [0, min(cap, base * 2^attempt)] (full jitter)
+    BACKOFF_BASE = 0.5
+    BACKOFF_CAP = 8.0
+    # per request timeout, shortened to what is left of the caller's deadline
+    REQUEST_TIMEOUT = 10.0
+    # consecutive failures before a routing host's breaker opens, and how long it stays open
+    BREAKER_FAILURE_THRESHOLD = 5
+    BREAKER_RESET_TIMEOUT = 30.0
+
+    def __init__(self, limiters: RateLimitBackend = None, match_cache: MatchCache = None, lookup_cache: TieredTTLCache = None, priority: Priority = Priority.INTERACTIVE, metrics: MetricsSink = None):
          # Get the Riot Token, then set the token as a header param in request.Session
         if os.getenv('ENV', 'local') == 'local':
             from dotenv import load_dotenv
@@ -12,11 +64,27 @@ class RiotRateLimitAPI:
         self.session.headers.update({
             'X-Riot-Token': self.__api_key
         })
-        self.rate_limits = []
-        self.rate_history = defaultdict(list)
-        # use threading lock to update rate limits
-        self.lock = threading.Lock()
-    
+        # one limiter per routing host (app limit) and per host + method (method limit),
+        # windows are unknown until the first response's X-*-Rate-Limit headers.
+        # RATE_LIMIT_BACKEND picks where they live, so Lambdas and the API can share one budget
+        self.limiters = limiters or rate_limit_backend_from_env()
+        # default traffic class of this client, background clients leave headroom for interactive ones
+        self.priority = priority
+        # finished Match-V5 payloads never change, serve repeats from the cache (MATCH_CACHE_* env)
+        self.match_cache = match_cache or match_cache_from_env()
+        # account, active region and ranked entry lookups, including 404s (RIOT_CACHE_BACKEND env)
+        self.lookup_cache = lookup_cache or ttl_cache_from_env()
+        # identical GETs in flight at the same time share one request (and one rate slot)
+        self.single_flight = SingleFlight()
+        # one breaker per routing host, a Riot incident on one region doesn't stop calls to the others
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.breakers_lock = threading.Lock()
+        self.timeout = self.REQUEST_TIMEOUT
+        # point the client at a stand-in server (benchmarks/fake_riot_server.py) instead of *.api.riotgames.com
+        self.base_url = (os.getenv('RIOT_API_BASE_URL') or '').rstrip('/') or None
+        # per call timing split and 429 counters per endpoint family (RIOT_METRICS_SINK env)
+        self.metrics = metrics or metrics_sink_from_env()
+
     def parse_rate_header(self, rate_header: str):
         '''
         Parses the 'X-Rate-Limit' header from Riot Endpoints to get the rate limits
@@ -31,51 +99,200 @@ class RiotRateLimitAPI:
 
         return parts
 
-    def wait_for_request_slot(self, rate_limits: list[tuple[int, int]], rate_history: dict[list]):
+    def method_template(self, url: str) -> str:
+        '''Returns the path template of the Riot method `url` calls (the path itself for unknown methods)'''
+        path = urlsplit(url).path
+        return next((template for pattern, template in METHOD_PATTERNS if pattern.match(path)), path)
+
+    def rate_limit_keys(self, url: str) -> tuple[str, str]:
+        '''
+        Returns the (app, method) limiter keys of a URL. Riot enforces app limits per routing host
+        (americas, na1, ...) and method limits per endpoint on that host.
+        Ex: https://americas.api.riotgames.com/lol/match/v5/matches/NA1_123
+            -> ('americas.api.riotgames.com', 'americas.api.riotgames.com/lol/match/v5/matches/{match_id}')
+        '''
+        host = urlsplit(url).netloc
+        return host, f'{host}{self.method_template(url)}'
+
+    def request_url(self, url: str) -> str:
+        '''
+        URL actually requested for a Riot URL. With RIOT_API_BASE_URL set the routing host moves into the path:
+        https://americas.api.riotgames.com/lol/... -> {RIOT_API_BASE_URL}/americas.api.riotgames.com/lol/...
+        '''
+        if self.base_url is None:
+            return url
+        parts = urlsplit(url)
+        return f'{self.base_url}/{parts.netloc}{parts.path}' + (f'?{parts.query}' if parts.query else '')
+
+    def endpoint_family(self, url: str) -> str:
+        '''
+        Returns the Riot API a URL belongs to, ex: /lol/match/v5/matches/NA1_123 -> match-v5, /riot/account/v1/... -> account-v1
+        '''
+        parts = urlsplit(url).path.strip('/').split('/')
+        return '-'.join(parts[1:3]) if len(parts) >= 3 else '/'.join(parts)
+
+    def record_call(self, url: str, timings: CallTimings):
+        '''Sends the timings of one (non cached) call to the metrics sink'''
+        dimensions = {'Family': self.endpoint_family(url)}
+        self.metrics.histogram('QueueWait', timings.queue_wait * 1000, dimensions)
+        self.metrics.histogram('Network', timings.network * 1000, dimensions)
+        self.metrics.histogram('RetrySleep', timings.retry_sleep * 1000, dimensions)
+        self.metrics.histogram('Attempts', timings.attempts, dimensions, unit='Count')
+        self.metrics.count('Calls', 1, dimensions)
+        if timings.rate_limited:
+            self.metrics.count('RateLimited', timings.rate_limited, dimensions)
+        if timings.error:
+            self.metrics.count(timings.error, 1, dimensions)
+
+    def match_id_from_url(self, url: str) -> str | None:
+        '''Returns the match ID if `url` is a Match-V5 match payload URL, None otherwise'''
+        path = urlsplit(url).path
+        return path.rsplit('/', 1)[-1] if MATCH_V5_PATTERN.match(path) else None
+
+    def lookup_cache_ttl(self, url: str) -> int | None:
+        '''Returns the cache TTL of an account metadata lookup URL, None if the URL isn't cached'''
+        return LOOKUP_CACHE_TTLS.get(self.method_template(url))
+
+    def update_rate_limits(self, keys: tuple[str, str], headers):
+        '''
+        Updates the app and method limiters from the X-App-Rate-Limit / X-Method-Rate-Limit headers (and their -Count headers)
+        '''
+        for key, prefix in zip(keys, ('X-App-Rate-Limit', 'X-Method-Rate-Limit')):
+            if rate_header := headers.get(prefix):
+                self.limiters.update_limits(key, self.parse_rate_header(rate_header))
+            if count_header := headers.get(f'{prefix}-Count'):
+                self.limiters.sync_counts(key, self.parse_rate_header(count_header))
+
+    def circuit_breaker(self, host: str) -> CircuitBreaker:
+        with self.breakers_lock:
+            if (breaker := self.breakers.get(host)) is None:
+                breaker = self.breakers[host] = CircuitBreaker(self.BREAKER_FAILURE_THRESHOLD, self.BREAKER_RESET_TIMEOUT)
+            return breaker
+
+    def backoff_delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.BACKOFF_CAP, self.BACKOFF_BASE * 2 ** attempt))
+
+    def check_deadline(self, url: str, deadline: float | None, wait: float = 0.0):
+        '''
+        Raises RiotDeadlineExceeded if waiting `wait` more seconds would go past `deadline` (a time.monotonic() value)
+        '''
+        if deadline is not None and time.monotonic() + wait > deadline:
+            raise RiotDeadlineExceeded(f'Deadline exceeded calling {url} (needed {wait:.2f}s more)', url)
+
+    def request_timeout(self, url: str, deadline: float | None) -> float:
+        if deadline is None:
+            return self.timeout
+        self.check_deadline(url, deadline)
+        return min(self.timeout, deadline - time.monotonic())
+
+    def wait_for_request_slot(self, keys: tuple[str, str], priority: Priority = None, deadline: float = None, url: str = None) -> float:
+        '''
+        Blocks the calling thread (only) until the app and method limiters have room for one more request.
+        Raises RiotDeadlineExceeded instead of sleeping past `deadline`
         '''
-        Blocks all requests until rate windows are within limits
+        waited = 0.0
+        while (wait := self.limiters.try_acquire(keys, priority or self.priority)) > 0:
+            self.check_deadline(url, deadline, wait)
+            self.limiters.sleep(wait)
+            waited += wait
+        return waited
+
+    def get_match(self, match_id: str, deadline: float = None):
+        '''Gets a Match-V5 payload, from the match cache if it has been fetched before'''
+        return self.call_endpoint_with_rate_limit(MATCH_V5_URL.format(match_id=match_id), deadline=deadline)
+
+    def call_endpoint_with_rate_limit(self, url: str, max_retries: int = 6, priority: Priority = None, deadline: float = None):
+        '''
+        Gets the decoded JSON of a Riot URL (None on 404). `deadline` is a time.monotonic() value the whole call,
+        rate limit waits and retries included, must finish by.
+        Raises a RiotAPIError when Riot can't answer: retries exhausted, deadline exceeded or circuit open
         '''
+        if (match_id := self.match_id_from_url(url)) and (cached := self.match_cache.get(match_id)) is not None:
+            self.metrics.count('CacheHits', 1, {'Family': self.endpoint_family(url)})
+            return cached
+        if (ttl := self.lookup_cache_ttl(url)) and (cached := self.lookup_cache.get(url)) is not MISS:
+            self.metrics.count('CacheHits', 1, {'Family': self.endpoint_family(url)})
+            return cached
 
-        with self.lock:
-            now = time.time()
-            for limit, window in rate_limits:
-                # Remove timestamps older than window
-                rate_history[window] = [t for t in rate_history[window] if now - t < window]
-                # If at limit, wait until the earliest timestamp expires
-                if len(rate_history[window]) >= limit:
-                    sleep_time = window - (now - rate_history[window][0]) + 0.01
-                    time.sleep(sleep_time)
+        try:
+            status_code, payload = self.single_flight.do(url, lambda: self._call_endpoint(url, max_retries, priority, deadline), deadline)
+        except SingleFlightTimeout as e:
+            # coalesced on a call (with a later deadline, or none) that didn't finish in time for this caller
+            raise RiotDeadlineExceeded(f'Deadline exceeded waiting for the in-flight call to {url}', url) from e
 
-            for _, window in rate_limits:
-                rate_history[window].append(time.time())
+        if status_code == 200 and match_id:
+            self.match_cache.put(match_id, payload)
+        elif ttl and status_code in (200, 404):
+            self.lookup_cache.set(url, payload, ttl if status_code == 200 else RIOT_LOOKUP_NEGATIVE_TTL)
+        return payload
+
+    def _call_endpoint(self, url: str, max_retries: int, priority: Priority = None, deadline: float = None) -> tuple[int, object]:
+        '''
+        Calls Riot, retrying on 429/5xx/network errors. Returns (status code, decoded JSON or None on 404)
+        '''
+        timings = CallTimings()
+        try:
+            return self._call_with_retries(url, max_retries, priority, deadline, timings)
+        except RiotAPIError as e:
+            timings.error = type(e).__name__
+            raise
+        finally:
+            self.record_call(url, timings)
 
-    def call_endpoint_with_rate_limit(self, url: str, rate_limits: list[tuple[int, int]] = None, rate_history: dict[list] = None, max_retries: int = 6):
-        backoff = 0.5
-        if not rate_history:
-            rate_history = self.rate_history
-        if not rate_limits:
-            rate_limits = self.rate_limits
-            
-        for _ in range(max_retries):
+    def _call_with_retries(self, url: str, max_retries: int, priority: Priority, deadline: float | None, timings: CallTimings) -> tuple[int, object]:
+        keys = self.rate_limit_keys(url)
+        breaker = self.circuit_breaker(keys[0])
+        status_code = None
+
+        for attempt in range(max_retries):
+            # fail fast on an open breaker without spending a rate limit slot
+            if (retry_after := breaker.retry_after()) > 0:
+                raise RiotCircuitOpen(f'Circuit open for {keys[0]}, not calling {url}', url, retry_after)
+            started = time.perf_counter()
+            self.wait_for_request_slot(keys, priority, deadline, url)
+            timings.queue_wait += time.perf_counter() - started
+            timeout = self.request_timeout(url, deadline)
+            # claimed once nothing but the request itself can fail: a half-open breaker lets a single trial through
+            if not (admission := breaker.allow()):
+                raise RiotCircuitOpen(f'Circuit open for {keys[0]}, not calling {url}', url, breaker.retry_after())
+            timings.attempts += 1
+            started = time.perf_counter()
             try:
-                self.wait_for_request_slot(rate_limits, rate_history)
-                response = self.session.get(url)
-                if response.status_code == 200:
-                    if not rate_limits:
-                        rate_limits.extend(self.parse_rate_header(response.headers.get('X-App-Rate-Limit', '')))
-                    return response.json()
-                elif response.status_code == 429:
-                    retry_after = float(response.headers.get('Retry-After', 1))
-                    print(f'Rate limited, sleeping for {retry_after}s...')
-                    time.sleep(retry_after)
-                elif response.status_code == 404:
-                    return None
-                else:
-                    print(f'Server error {response.status_code}, retrying in {backoff}s...')
-                    time.sleep(backoff)
-                    backoff *= 2
-                    response.raise_for_status()
-            except requests.exceptions.HTTPError as e:
+                response = self.session.get(self.request_url(url), timeout=timeout)
+            except requests.exceptions.RequestException as e:
+                timings.network += time.perf_counter() - started
                 print('Request Error:', e)
-                
-        return None
\ No newline at end of file
+                breaker.record_failure()
+                delay = self.backoff_delay(attempt)
+            else:
+                timings.network += time.perf_counter() - started
+                status_code = timings.status_code = response.status_code
+                self.update_rate_limits(keys, response.headers)
+                if status_code >= 500:
+                    breaker.record_failure()
+                    delay = self.backoff_delay(attempt)
+                    print(f'Server error {status_code}, retrying in {delay:.2f}s...')
+                else:
+                    # any other answer means the host is up
+                    breaker.record_success()
+                    if status_code == 200:
+                        return status_code, json_codec.loads(response.content)
+                    if status_code == 404:
+                        return status_code, None
+                    if status_code != 429:
+                        raise RiotAPIError(f'Riot returned {status_code} for {url}', url, status_code)
+                    timings.rate_limited += 1
+                    delay = float(response.headers.get('Retry-After', 1))
+                    print(f'Rate limited, sleeping for {delay}s...')
+            finally:
+                # the trial is given back if it ended without an outcome (limiter errors, cancellation...)
+                if admission == Admission.TRIAL:
+                    breaker.release_trial()
+
+            if attempt == max_retries - 1:
+                break
+            self.check_deadline(url, deadline, delay)
+            time.sleep(delay)
+            timings.retry_sleep += delay
+
+        raise RiotRetriesExhausted(f'Giving up on {url} after {max_retries} attempts (last status {status_code})', url, status_code)
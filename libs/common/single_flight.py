@@ -0,0 +1,65 @@
+import threading, time
+from typing import Any, Callable
+
+class SingleFlightTimeout(TimeoutError):
+    '''A follower's deadline passed before the call it waits on finished'''
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    '''
+    Coalesces concurrent calls with the same key: the first caller runs the function, every caller
+    that arrives while it is in flight waits for and shares its result (or exception)
+
+    `calls` counts calls that actually ran, `coalesced` counts calls that were served by another one.
+    A follower waits at most until its own `deadline` (a time.monotonic() value), then gets a SingleFlightTimeout
+    while the leader carries on.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight: dict[str, _Call] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any], deadline: float = None) -> Any:
+        with self.lock:
+            if (call := self.in_flight.get(key)) is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self.in_flight[key] = _Call()
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            if not call.done.wait(None if deadline is None else max(deadline - time.monotonic(), 0.0)):
+                raise SingleFlightTimeout(f'{key} still in flight at the deadline')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            call.done.set()
+
+    def record_coalesced(self, count: int = 1):
+        '''For callers that deduplicate on their own (ex: duplicate URLs in one async batch)'''
+        with self.lock:
+            self.coalesced += count
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self.in_flight)}
@@ -0,0 +1,136 @@
+import json, os, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Any, Callable
+from libs.common.constants.queries.riot_cache_queries import GET_RIOT_CACHE_SQL, UPSERT_RIOT_CACHE_SQL
+
+# returned by get() on a miss, so a cached None (ex: a Riot 404) can be told apart from "not cached"
+MISS = object()
+
+class TTLCache:
+    '''
+    In-process cache where every entry has its own time to live, evicts least recently used past `max_size`
+    '''
+    def __init__(self, max_size: int = 4096, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.clock = clock
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISS
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return MISS
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._entries[key] = (self.clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+class TTLStore:
+    '''
+    Persistent tier of a TieredTTLCache, values are JSON serializable
+    '''
+    def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float):
+        raise NotImplementedError
+
+class SqliteTTLStore(TTLStore):
+    '''
+    TTLStore in a local SQLite file (local runs and tests)
+    '''
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.clock = clock
+        self._local = threading.local()
+        self._conn().execute('CREATE TABLE IF NOT EXISTS riot_cache (cache_key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)')
+
+    def _conn(self) -> sqlite3.Connection:
+        if (conn := getattr(self._local, 'conn', None)) is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return conn
+
+    def get(self, key: str) -> Any:
+        row = self._conn().execute('SELECT value FROM riot_cache WHERE cache_key = ? AND expires_at > ?', (key, self.clock())).fetchone()
+        return MISS if row is None else json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO riot_cache (cache_key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value), self.clock() + ttl),
+        )
+
+class RdsTTLStore(TTLStore):
+    '''
+    TTLStore in Aurora (app.riot_cache, see migrations/001_riot_cache.sql), shared by the API and the Lambdas
+    '''
+    def __init__(self, rds):
+        self.rds = rds
+
+    def get(self, key: str) -> Any:
+        row = self.rds.query_one(GET_RIOT_CACHE_SQL, {"cache_key": key})
+        return MISS if row is None else json.loads(row['value'])
+
+    def set(self, key: str, value: Any, ttl: float):
+        self.rds.exec(UPSERT_RIOT_CACHE_SQL, {"cache_key": key, "value": json.dumps(value), "ttl": float(ttl)})
+
+class TieredTTLCache:
+    '''
+    TTLCache in front of an optional persistent TTLStore. Persistent hits are promoted to memory
+    (for at most `promote_ttl` seconds, the persistent expiry isn't known)
+    '''
+    def __init__(self, memory: TTLCache = None, store: TTLStore = None, promote_ttl: float = 300):
+        self.memory = memory or TTLCache()
+        self.store = store
+        self.promote_ttl = promote_ttl
+
+    def get(self, key: str) -> Any:
+        if (value := self.memory.get(key)) is not MISS:
+            return value
+        if self.store is None:
+            return MISS
+        try:
+            value = self.store.get(key)
+        except Exception as e:
+            # the cache must never fail a lookup that Riot can still answer
+            print(f'TTL store read failed for {key}: {e}')
+            return MISS
+        if value is not MISS:
+            self.memory.set(key, value, self.promote_ttl)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        self.memory.set(key, value, ttl)
+        if self.store is not None:
+            try:
+                self.store.set(key, value, ttl)
+            except Exception as e:
+                print(f'TTL store write failed for {key}: {e}')
+
+def ttl_cache_from_env() -> TieredTTLCache:
+    '''
+    Builds the account metadata cache selected by RIOT_CACHE_BACKEND:
+        unset / "memory" -> in-process only
+        "sqlite:<path>"  -> + SqliteTTLStore
+        "rds"            -> + RdsTTLStore (reads DB_ARN, SECRET_ARN, DB_NAME)
+    '''
+    backend = os.getenv('RIOT_CACHE_BACKEND') or 'memory'
+    kind, _, target = backend.partition(':')
+    if kind == 'memory':
+        return TieredTTLCache()
+    if kind == 'sqlite' and target:
+        return TieredTTLCache(store=SqliteTTLStore(target))
+    if kind == 'rds':
+        from libs.common.rds_service import RdsDataService
+        return TieredTTLCache(store=RdsTTLStore(RdsDataService.from_env()))
+    raise ValueError(f'Invalid RIOT_CACHE_BACKEND: {backend}')
@@ -0,0 +1,96 @@
+'''
+Work queue of the fan-out crawl (see get_matches_when_user_created.py): a coordinator sends chunks of match IDs,
+workers receive them, process them and acknowledge them
+
+SQS in AWS (workers are Lambda invocations fed by the queue's event source mapping), an in-process queue for
+local runs and tests. Messages are JSON-serializable dicts.
+'''
+import json, os, threading
+from collections import deque
+
+class WorkItem:
+    __slots__ = ('body', 'receipt')
+
+    def __init__(self, body: dict, receipt=None):
+        self.body = body
+        self.receipt = receipt
+
+class WorkQueue:
+    def send(self, messages: list[dict]):
+        raise NotImplementedError
+
+    def receive(self, max_messages: int = 10) -> list[WorkItem]:
+        '''Up to `max_messages` items, an empty list when the queue has nothing for now'''
+        raise NotImplementedError
+
+    def ack(self, item: WorkItem):
+        '''Removes a processed item (an item that's never acknowledged is delivered again, SQS only)'''
+        raise NotImplementedError
+
+class InProcessWorkQueue(WorkQueue):
+    '''
+    Thread-safe FIFO living in this process. Received items are gone, ack is a no-op
+    '''
+    def __init__(self):
+        self._items = deque()
+        self._lock = threading.Lock()
+
+    def send(self, messages: list[dict]):
+        with self._lock:
+            # round-trip through JSON like SQS does, so local runs catch messages that wouldn't serialize
+            self._items.extend(WorkItem(json.loads(json.dumps(message))) for message in messages)
+
+    def receive(self, max_messages: int = 10) -> list[WorkItem]:
+        with self._lock:
+            return [self._items.popleft() for _ in range(min(max_messages, len(self._items)))]
+
+    def ack(self, item: WorkItem):
+        pass
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+class SqsWorkQueue(WorkQueue):
+    # SendMessageBatch / ReceiveMessage limit
+    MAX_BATCH = 10
+
+    def __init__(self, queue_url: str, client=None, wait_seconds: int = 1):
+        self.queue_url = queue_url
+        self.wait_seconds = wait_seconds
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('sqs', region_name=os.getenv('AWS_REGION') or os.getenv('AWS_DEFAULT_REGION'))
+        return self._client
+
+    def send(self, messages: list[dict]):
+        for i in range(0, len(messages), self.MAX_BATCH):
+            batch = messages[i:i + self.MAX_BATCH]
+            response = self.client.send_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[{'Id': str(n), 'MessageBody': json.dumps(message)} for n, message in enumerate(batch)],
+            )
+            if failed := response.get('Failed'):
+                raise RuntimeError(f'SQS rejected {len(failed)} of {len(batch)} messages: {failed[0].get("Message")}')
+
+    def receive(self, max_messages: int = 10) -> list[WorkItem]:
+        response = self.client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_messages, self.MAX_BATCH),
+            WaitTimeSeconds=self.wait_seconds,
+        )
+        return [WorkItem(json.loads(m['Body']), m['ReceiptHandle']) for m in response.get('Messages', [])]
+
+    def ack(self, item: WorkItem):
+        self.client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=item.receipt)
+
+def work_queue_from_env() -> WorkQueue:
+    '''
+    CRAWL_QUEUE_URL -> SQS, otherwise an in-process queue (local runs: the workers run in the coordinator's process)
+    '''
+    if queue_url := os.getenv('CRAWL_QUEUE_URL'):
+        return SqsWorkQueue(queue_url)
+    return InProcessWorkQueue()
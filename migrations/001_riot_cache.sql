@@ -0,0 +1,8 @@
+-- Persistent tier of the Riot account/region/rank lookup cache (libs/common/ttl_cache.py)
+CREATE TABLE IF NOT EXISTS app.riot_cache (
+  cache_key  text PRIMARY KEY,
+  value      text NOT NULL,           -- JSON payload, "null" for cached 404s
+  expires_at timestamptz NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS riot_cache_expires_at_idx ON app.riot_cache (expires_at);
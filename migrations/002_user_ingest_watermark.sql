@@ -0,0 +1,17 @@
+-- Per-user ingestion watermark: newest match already stored for the user, refresh crawls only
+-- ask Riot for matches from there on (get_matches_when_user_created "refresh" events)
+ALTER TABLE app.users
+  ADD COLUMN IF NOT EXISTS last_match_start_time timestamptz,
+  ADD COLUMN IF NOT EXISTS last_match_id         text;
+
+-- seed from the matches ingested so far
+UPDATE app.users u
+SET last_match_start_time = m.game_start_time,
+    last_match_id         = m.match_id
+FROM (
+  SELECT DISTINCT ON (puuid) puuid, match_id, game_start_time
+  FROM app.power_level_metrics
+  ORDER BY puuid, game_start_time DESC, match_id DESC
+) m
+WHERE u.puuid = m.puuid
+  AND u.last_match_start_time IS NULL;
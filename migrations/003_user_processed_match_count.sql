@@ -0,0 +1,14 @@
+-- Per-user count of ingested matches, maintained by preprocess_power_level in the transaction that writes
+-- a bulk (UPDATE_USER_POWER_LEVEL_AGGREGATES_SQL) instead of a COUNT over app.power_levels
+ALTER TABLE app.users
+  ADD COLUMN IF NOT EXISTS processed_match_count integer NOT NULL DEFAULT 0;
+
+-- seed from the matches ingested so far
+UPDATE app.users u
+SET processed_match_count = pl.n
+FROM (
+  SELECT puuid, COUNT(*)::int AS n
+  FROM app.power_levels
+  GROUP BY puuid
+) pl
+WHERE u.puuid = pl.puuid;
@@ -0,0 +1,12 @@
+-- Debounced rank norm rebuilds: preprocess_power_level rebuilds the norms of the tiers with new power levels
+-- (the pending deltas of migrations/005) at most once per RANK_NORMS_REBUILD_INTERVAL
+
+-- single row claimed (FOR UPDATE SKIP LOCKED) by the invocation that runs the next rebuild
+CREATE TABLE IF NOT EXISTS app.rank_norms_rebuild (
+  id              integer PRIMARY KEY CHECK (id = 1),
+  last_rebuild_at timestamptz NOT NULL
+);
+
+INSERT INTO app.rank_norms_rebuild (id, last_rebuild_at)
+VALUES (1, 'epoch')
+ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,23 @@
+-- Rank norms from mergeable KLL sketches (libs/common/quantile_sketch.py) instead of percentile_disc over
+-- app.power_levels: every bulk appends a delta sketch of its new power levels, the debounced rebuild
+-- (preprocess_power_level.maybe_rebuild_rank_norms, claimed through migrations/004) merges the pending deltas
+-- into the sketches of their tiers
+CREATE TABLE IF NOT EXISTS app.rank_norm_sketches (
+  real_rank_tier     text NOT NULL,
+  real_rank_division text NOT NULL,
+  sketch             text NOT NULL,          -- KLL sketch JSON
+  n                  bigint NOT NULL,
+  updated_at         timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (real_rank_tier, real_rank_division)
+);
+
+CREATE TABLE IF NOT EXISTS app.rank_norm_sketch_deltas (
+  id                 bigserial PRIMARY KEY,
+  real_rank_tier     text NOT NULL,
+  real_rank_division text NOT NULL,
+  sketch             text NOT NULL,
+  created_at         timestamptz NOT NULL DEFAULT now()
+);
+
+-- the sketches are seeded from app.power_levels after this migration, compacted in pages by the rank norms
+-- Lambda: invoke it with {"reseed": true} (preprocess_power_level.reseed_rank_norm_sketches)
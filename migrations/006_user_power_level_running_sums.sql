@@ -0,0 +1,21 @@
+-- Running sums of a user's power level totals, maintained by preprocess_power_level in the transaction that
+-- writes a bulk (UPDATE_USER_POWER_LEVEL_AGGREGATES_SQL). With processed_match_count as the count,
+-- users.power_level is sum / count and the variance sumsq / count - (sum / count)^2, no scan of app.power_levels
+ALTER TABLE app.users
+  ADD COLUMN IF NOT EXISTS power_level_sum   double precision NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS power_level_sumsq double precision NOT NULL DEFAULT 0;
+
+-- seed from the matches ingested so far (and realign the count they're divided by)
+UPDATE app.users u
+SET power_level_sum       = pl.s,
+    power_level_sumsq     = pl.ss,
+    processed_match_count = pl.n
+FROM (
+  SELECT puuid,
+         SUM(total)::double precision AS s,
+         SUM(total::double precision * total) AS ss,
+         COUNT(*)::int AS n
+  FROM app.power_levels
+  GROUP BY puuid
+) pl
+WHERE u.puuid = pl.puuid;
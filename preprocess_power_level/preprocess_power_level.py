@@ -1,13 +1,18 @@
-import os, json, boto3, requests, logging
+import os, boto3, requests, logging
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from urllib.parse import unquote_plus
 from libs.common.constants.queries.power_level_metrics_queries import POWER_LEVEL_METRICS_INSERT_SQL
-from libs.common.constants.queries.power_level_queries import POWER_LEVEL_INSERT_SQL, GET_PLAYER_MATCH_POWER_LEVEL_COUNT
-from libs.common.constants.queries.users_queries import INSERT_USER_SQL, CHECK_IF_USER_EXISTS_SQL, UPDATE_USER_AVERAGE_POWER_LEVEL_SQL, UPDATE_USER_STD_POWER_LEVEL_SQL
-from libs.common.constants.queries.rank_norms_queries import REBUILD_RANK_NORMS_SQL
+from libs.common.constants.queries.users_queries import INSERT_USER_SQL, CHECK_IF_USER_EXISTS_SQL, UPDATE_USER_STD_POWER_LEVEL_SQL, UPDATE_TIER_STD_POWER_LEVEL_SQL, UPDATE_USER_WATERMARK_SQL
+from libs.common.constants.queries.rank_norms_queries import CLAIM_RANK_NORMS_REBUILD_SQL, TAKE_RANK_NORM_SKETCH_DELTAS_SQL, GET_RANK_NORM_SKETCHES_SQL, UPSERT_RANK_NORM_SKETCH_SQL, UPSERT_RANK_NORMS_SQL, SET_REPEATABLE_READ_SQL, LOCK_RANK_NORMS_REBUILD_SQL, CLEAR_RANK_NORM_SKETCHES_SQL, CLEAR_RANK_NORM_SKETCH_DELTAS_SQL, GET_RANKED_POWER_LEVELS_PAGE_SQL
 from libs.common.constants.league_constants import GET_NAME_BY_PUUID_URL, GET_PLAYER_ACTIVE_REGION_URL, PLAYER_RANK_URL, LeagueQueue
+from libs.common import power_level_writes
+from libs.common.bulk_format import KIND_MANIFEST, iter_bulk, is_bulk_key
+from libs.common.match_projection import VIEW_INGEST, ingest_store_from_env, is_ingest_view, project_match
+from libs.common.quantile_sketch import KLLSketch
 from libs.common.rds_service import RdsDataService
-from libs.common.riot_rate_limit_api import RiotRateLimitAPI
+from libs.common.riot_rate_limit_api import RiotRateLimitAPI, lambda_deadline
+from libs.common.rate_limiter import Priority
 from services.power_level_service import PowerLevelService
 
 load_dotenv()
@@ -25,7 +30,21 @@ log = logging.getLogger(__name__)
 
 power_level_service = PowerLevelService()
 
-riot_api_service = RiotRateLimitAPI()
+riot_api_service = RiotRateLimitAPI(priority=Priority.BACKGROUND)
+# compact match views written by the crawler (see match_projection.py)
+ingest_store = ingest_store_from_env()
+
+# concurrent match store reads when resolving a manifest
+MATCH_STORE_WORKERS = 16
+# rows per Data API batch_execute_statement call (requests are capped at 4 MB)
+WRITE_BATCH_SIZE = power_level_writes.WRITE_BATCH_SIZE
+# a user reaching this many processed matches gets their tier's norms rebuilt right away
+RANKED_MATCH_THRESHOLD = 200
+# rank norms are rebuilt at most once per interval (seconds) across all invocations, for the tiers with new power levels
+RANK_NORMS_REBUILD_INTERVAL = int(os.getenv("RANK_NORMS_REBUILD_INTERVAL") or 300)
+# rows per Data API read (responses are capped at 1 MB): delta sketches of the rebuild, power levels of the reseed
+RANK_NORM_DELTAS_PAGE_SIZE = 100
+RESEED_PAGE_SIZE = 5000
 
 BOOL_KEYS_FROM_INT = {"first_blood_taken", "perfect_game"}
 BOOL_KEYS_NATIVE   = {"win", "first_blood_assist"}
@@ -57,32 +76,59 @@ def nv(name, value):
     if isinstance(value, float):return {"name": name, "value": {"doubleValue": float(value)}}
     return {"name": name, "value": {"stringValue": str(value)}}
 
-def insert_power_metrics(match_id: str, puuid: str, metrics: dict):
-    m = normalize(metrics)
-    
-    return rds_service.exec(POWER_LEVEL_METRICS_INSERT_SQL, {**m, "match_id": match_id, "puuid": puuid})
-    
-def insert_power_levels(match_id: str, puuid: str, power_levels: dict):
-    return rds_service.exec(POWER_LEVEL_INSERT_SQL, {**power_levels, "match_id": match_id, "puuid": puuid})
+def batch_write(sql: str, parameter_sets: list, transaction_id: str = None):
+    power_level_writes.batch_write(rds_service, sql, parameter_sets, transaction_id, WRITE_BATCH_SIZE)
+
+def score_matches(puuid: str, matches: list) -> list:
+    '''Returns (match_id, metrics, power level) of the player for every match of a bulk'''
+    scored = []
+    for match_json in matches:
+        player_idx = match_json['metadata']['participants'].index(puuid)
+        match_id = match_json['metadata']['matchId']
+        
+        # extract all the power level metrics from the match object
+        player_metrics = power_level_service.extract_all_metrics(match_json, player_idx)
+        
+        # get the power level calculations from the metrics
+        player_power_level = power_level_service.calculate_power_level(player_metrics)
+        
+        scored.append((match_id, player_metrics, player_power_level))
+    return scored
+
+def write_scored_matches(puuid: str, scored: list, matches: list) -> tuple[int, int]:
+    '''
+    Upserts the metrics and power levels of a bulk, moves the watermark, applies the bulk to the user's match
+    count and average power level (running sums, O(1) whatever the user's history) and queues the new power levels
+    for the rank norms (a delta sketch, see power_level_writes.py) in one transaction, one batch call per
+    WRITE_BATCH_SIZE rows instead of one call per row.
+    Returns the user's processed match count (before, after) the bulk
+    '''
+    with rds_service.transaction() as tx:
+        # the user's row lock comes first: the aggregates must see the power levels of the bulk committed before
+        row = power_level_writes.write_power_levels(rds_service, puuid, [(match_id, power_level) for match_id, _, power_level in scored], tx, WRITE_BATCH_SIZE)
+        batch_write(POWER_LEVEL_METRICS_INSERT_SQL, [{**normalize(metrics), "match_id": match_id, "puuid": puuid} for match_id, metrics, _ in scored], tx)
+        update_user_watermark(puuid, matches, tx)
+    after = int(row["processed_match_count"])
+    return after - int(row["added"]), after
 
-def insert_user_if_not_exists(puuid: str):
+def insert_user_if_not_exists(puuid: str, deadline: float = None):
     row = rds_service.query_one(CHECK_IF_USER_EXISTS_SQL, {"puuid": puuid})
     print(row)
     if not bool(row['exists']):
         # user doesn't exist, add to DB
         # first, get the game_name and tag_line from RIOT API
-        player = riot_api_service.call_endpoint_with_rate_limit(GET_NAME_BY_PUUID_URL.format(puuid=puuid))
+        player = riot_api_service.call_endpoint_with_rate_limit(GET_NAME_BY_PUUID_URL.format(puuid=puuid), deadline=deadline)
         
         game_name = player['gameName']
         tag_line = player['tagLine']
         
         # Get player's active region (NA1, KR, etc)
-        active_region_res = riot_api_service.call_endpoint_with_rate_limit(GET_PLAYER_ACTIVE_REGION_URL.format(puuid=puuid))
+        active_region_res = riot_api_service.call_endpoint_with_rate_limit(GET_PLAYER_ACTIVE_REGION_URL.format(puuid=puuid), deadline=deadline)
         
         active_region = active_region_res['region']
         
         # Get player's current rank (we are only doing SOLO ranks to find their "actual" skills)
-        player_rank_res = riot_api_service.call_endpoint_with_rate_limit(PLAYER_RANK_URL.format(region=active_region, puuid=puuid))
+        player_rank_res = riot_api_service.call_endpoint_with_rate_limit(PLAYER_RANK_URL.format(region=active_region, puuid=puuid), deadline=deadline)
         
         player_rank = next((d for d in player_rank_res if d.get("queueType") == LeagueQueue.RANKED_SOLO_5x5.value), {})
         
@@ -90,18 +136,113 @@ def insert_user_if_not_exists(puuid: str):
         
         rds_service.exec(INSERT_USER_SQL, {"puuid": puuid, "game_name": game_name, "tag_line": tag_line, "real_rank_tier": p_tier, "real_rank_division": p_rank})
 
-def get_player_match_power_level_count(puuid: str):
-    row = rds_service.query_one(GET_PLAYER_MATCH_POWER_LEVEL_COUNT, {"puuid": puuid})
-    return int(row['count'])
+def update_user_watermark(puuid: str, matches: list, transaction_id: str = None):
+    '''Moves the user's ingestion watermark to the newest match of `matches` (refresh crawls start from there)'''
+    newest = max((m for m in matches if m), key=lambda m: (m['info']['gameStartTimestamp'], m['metadata']['matchId']), default=None)
+    if newest is not None:
+        rds_service.exec(UPDATE_USER_WATERMARK_SQL, {"puuid": puuid, "match_id": newest['metadata']['matchId'], "game_start_time": newest['info']['gameStartTimestamp'] // 1000}, transaction_id)
 
-def calculate_user_avg_power_level(puuid: str):
-    return rds_service.exec(UPDATE_USER_AVERAGE_POWER_LEVEL_SQL, {"puuid": puuid})
+def get_ingest_view(match_id: str, deadline: float = None):
+    '''
+    Returns the ingest view of a match, projected again from the full payload (and stored) when it's
+    missing or was projected with older fields
+    '''
+    view = ingest_store.get(match_id)
+    if is_ingest_view(view):
+        return view
+    match_json = riot_api_service.get_match(match_id, deadline)
+    if match_json is None:
+        return None
+    view = project_match(match_json)
+    ingest_store.put(match_id, view)
+    return view
+
+def load_matches(body, deadline: float = None) -> list:
+    '''
+    Returns the match payloads of a bulk (see bulk_format.py) read from `body` (a binary stream): a manifest
+    of match IDs (ingest views or full payloads read from the shared stores, or Riot on a store miss) or a bulk
+    holding the payloads themselves (including legacy .json bulks)
+    '''
+    header, records = iter_bulk(body)
+    if header['kind'] != KIND_MANIFEST:
+        return list(records)
+    get = get_ingest_view if header.get('view') == VIEW_INGEST else riot_api_service.get_match
+    with ThreadPoolExecutor(max_workers=MATCH_STORE_WORKERS) as pool:
+        matches = pool.map(lambda match_id: get(match_id, deadline), [r['match_id'] for r in records])
+        # a match Riot no longer has (404) is skipped
+        return [m for m in matches if m is not None]
 
 def calculate_user_std_power_level(puuid: str):
     return rds_service.exec(UPDATE_USER_STD_POWER_LEVEL_SQL, {"puuid": puuid})
         
-def rebuild_rank_norms():
-    return rds_service.exec(REBUILD_RANK_NORMS_SQL)
+def write_rank_norms(sketches: dict, transaction_id: str):
+    '''Upserts the {(tier, division): KLLSketch} sketches and their tiers' p10/p95, then re-standardizes those tiers' users'''
+    sketches = {tier: sketch for tier, sketch in sketches.items() if sketch.n}
+    batch_write(UPSERT_RANK_NORM_SKETCH_SQL, [
+        {"real_rank_tier": tier, "real_rank_division": division, "sketch": sketch.to_json(), "n": sketch.n}
+        for (tier, division), sketch in sketches.items()
+    ], transaction_id)
+    batch_write(UPSERT_RANK_NORMS_SQL, [
+        {"real_rank_tier": tier, "real_rank_division": division, "p10": float(sketch.quantile(0.10)), "p95": float(sketch.quantile(0.95))}
+        for (tier, division), sketch in sketches.items()
+    ], transaction_id)
+    # users standardized while their tier's norms were pending (or missing) catch up here
+    batch_write(UPDATE_TIER_STD_POWER_LEVEL_SQL, [
+        {"real_rank_tier": tier, "real_rank_division": division} for tier, division in sketches
+    ], transaction_id)
+
+def maybe_rebuild_rank_norms(interval: int = RANK_NORMS_REBUILD_INTERVAL) -> bool:
+    '''
+    Folds the pending delta sketches into their tier's sketch, updates those tiers' p10/p95 and re-standardizes
+    their users, unless a rebuild ran in the last `interval` seconds or another invocation is running one.
+    Returns True if this call rebuilt them. The norms cost grows with the power levels ingested since the last
+    rebuild, not with app.power_levels
+    '''
+    with rds_service.transaction() as tx:
+        if rds_service.query_one(CLAIM_RANK_NORMS_REBUILD_SQL, {"interval": interval}, tx) is None:
+            return False
+        # the pending deltas merged per tier, a page at a time
+        sketches = {}
+        while True:
+            deltas = rds_service.query(TAKE_RANK_NORM_SKETCH_DELTAS_SQL, {"limit": RANK_NORM_DELTAS_PAGE_SIZE}, tx)
+            for d in deltas:
+                sketches.setdefault((d["real_rank_tier"], d["real_rank_division"]), KLLSketch()).merge(KLLSketch.from_json(d["sketch"]))
+            if len(deltas) < RANK_NORM_DELTAS_PAGE_SIZE:
+                break
+        # then into the tiers' sketches so far
+        if sketches:
+            tiers = ",".join(f"{tier}_{division}" for tier, division in sketches)
+            for s in rds_service.query(GET_RANK_NORM_SKETCHES_SQL, {"tiers": tiers}, tx):
+                sketches[(s["real_rank_tier"], s["real_rank_division"])].merge(KLLSketch.from_json(s["sketch"]))
+        write_rank_norms(sketches, tx)
+    return True
+
+def reseed_rank_norm_sketches(page_size: int = RESEED_PAGE_SIZE) -> int:
+    '''
+    Replaces every tier's sketch with one built from all of app.power_levels, read RESEED_PAGE_SIZE rows at a time
+    and compacted as it goes, and discards the pending deltas (their power levels are in the scan). Runs in one
+    repeatable read transaction holding the rebuild claim (a rebuild committing while it waits for the claim
+    fails it with a serialization error, invoke it again). Returns the number of power levels read
+    '''
+    sketches = {}
+    read = 0
+    with rds_service.transaction() as tx:
+        rds_service.exec(SET_REPEATABLE_READ_SQL, None, tx)
+        rds_service.query_one(LOCK_RANK_NORMS_REBUILD_SQL, None, tx)
+        rds_service.exec(CLEAR_RANK_NORM_SKETCH_DELTAS_SQL, None, tx)
+        after = {"after_match_id": "", "after_puuid": ""}
+        while True:
+            rows = rds_service.query(GET_RANKED_POWER_LEVELS_PAGE_SQL, {**after, "limit": page_size}, tx)
+            for row in rows:
+                sketches.setdefault((row["real_rank_tier"], row["real_rank_division"]), KLLSketch()).update(row["total"])
+            read += len(rows)
+            if len(rows) < page_size:
+                break
+            after = {"after_match_id": rows[-1]["match_id"], "after_puuid": rows[-1]["puuid"]}
+        rds_service.exec(CLEAR_RANK_NORM_SKETCHES_SQL, None, tx)
+        write_rank_norms(sketches, tx)
+    log.info(f'Rank norm sketches of {len(sketches)} tiers reseeded from {read} power levels')
+    return read
 
 def lambda_handler(event, context):
     '''
@@ -110,64 +251,65 @@ def lambda_handler(event, context):
         event: Dict containing the Lambda function event data
         context: Lambda runtime context
     '''
+    # Riot lookups fail fast (RiotAPIError) rather than sleeping past the invocation timeout
+    deadline = lambda_deadline(context)
     
-    for rec in event.get("Records", []):
-        bucket = rec['s3']['bucket']['name']
-        key = unquote_plus(rec['s3']['object']['key'])
-        
-        # get the parent folder path which will be a puuid folder
-        puuid = os.path.basename(os.path.dirname(key))
-        
-        print(bucket, key, puuid)
-        
-        obj = s3.get_object(Bucket=bucket, Key=key)
-        body = obj['Body'].read()
-        matches = json.loads(body)
-        
-        # check to see if the user already exists in DB, if it doesn't create a new user in DB
-        insert_user_if_not_exists(puuid)
-        
-        log.info(f'User PUUID#{puuid} inserted!')
-        
-        for match_json in matches:
-            player_idx = match_json['metadata']['participants'].index(puuid)
-            match_id = match_json['metadata']['matchId']
-            
-            # extract all the power level metrics from the match object
-            player_metrics = power_level_service.extract_all_metrics(match_json, player_idx)
-            
-            insert_power_metrics(match_id, puuid, player_metrics)
-            
-            log.info(f'Power level metrics for PUUID#{puuid} inserted!')
-            
-            # get the power level calculations from the metrics
-            player_power_level = power_level_service.calculate_power_level(player_metrics)
-            
-            insert_power_levels(match_id, puuid, player_power_level)
-            
-            log.info(f'Power level for PUUID#{puuid} inserted!')
-            
-            # check if there are already 200 power level matches
-            if get_player_match_power_level_count(puuid) == 200:
-                # calculate avg power level
-                calculate_user_avg_power_level(puuid)
-                # rebuild rank norms
-                rebuild_rank_norms()
-                # update the user's standardized power level
-                calculate_user_std_power_level(puuid)
-                
-                
-            
-        # if it does, calculate user's average power level   
-        calculate_user_avg_power_level(puuid)
-        
-        # at the end, rebuild rank norms after averaging user's power level
-        rebuild_rank_norms()
-        
-        # now, after rebuilding the rank normalizations, we update the standardized power level
-        calculate_user_std_power_level(puuid)
+    try:
+        for rec in event.get("Records", []):
+            bucket = rec['s3']['bucket']['name']
+            key = unquote_plus(rec['s3']['object']['key'])
+        
+            # the bucket notification only sends rank_match_info/ keys, anything there that isn't a manifest or a legacy
+            # bulk (ex: objects written before the match store moved to its own bucket) is skipped
+            if not is_bulk_key(key):
+                log.info(f'Skipping non-bulk object {key}')
+                continue
+        
+            # get the parent folder path which will be a puuid folder
+            puuid = os.path.basename(os.path.dirname(key))
+        
+            print(bucket, key, puuid)
+        
+            obj = s3.get_object(Bucket=bucket, Key=key)
+            # streamed, the bulk is decompressed and decoded line by line
+            matches = load_matches(obj['Body'], deadline)
+        
+            # check to see if the user already exists in DB, if it doesn't create a new user in DB
+            insert_user_if_not_exists(puuid, deadline)
+        
+            log.info(f'User PUUID#{puuid} inserted!')
+        
+            # score the whole bulk first, then write it in a few batch calls
+            scored = score_matches(puuid, matches)
+        
+            count_before, count_after = write_scored_matches(puuid, scored, matches)
+        
+            log.info(f'Power level metrics and power levels of {len(scored)} matches for PUUID#{puuid} inserted! ({count_before} -> {count_after} matches)')
+        
+            # rebuild the rank norms with new power levels (the user's average was updated with the bulk), debounced
+            # across bulks unless this bulk took the user to 200 power level matches
+            reached_threshold = count_before < RANKED_MATCH_THRESHOLD <= count_after
+            maybe_rebuild_rank_norms(0 if reached_threshold else RANK_NORMS_REBUILD_INTERVAL)
+        
+            # standardize against the tier's current norms (left as is if the tier has none yet), a deferred
+            # rebuild re-standardizes the whole tier
+            calculate_user_std_power_level(puuid)
+    finally:
+        # EMF metrics go out through stdout, write them before the invocation is frozen (failed invocations included)
+        riot_api_service.metrics.flush()
 
     return {
         "ok": True
     }
+
+def rank_norms_handler(event, context):
+    '''
+    Scheduled entry point (EventBridge rule every RANK_NORMS_REBUILD_INTERVAL, see
+    deploy-preprocess-power-level-lambda.yml): rebuilds the tiers still pending after the last bulk of an
+    ingestion wave. {"reseed": true} rebuilds every tier's sketch from app.power_levels instead (after
+    migrations/005, or to drop the sketches' accumulated error)
+    '''
+    if (event or {}).get("reseed"):
+        return {"ok": True, "reseeded": reseed_rank_norm_sketches()}
+    return {"ok": True, "rebuilt": maybe_rebuild_rank_norms()}
         
\ No newline at end of file
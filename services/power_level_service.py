@@ -1,8 +1,8 @@
 import pandas as pd
-import os, json
-from collections import defaultdict
+import os
 from libs.common.constants.league_constants import LeagueTier, LeagueDivision, LANE_POSITION, ROLE_TARGETS
 from typing import Optional
+from libs.common.bulk_format import iter_bulk
 from libs.common.riot_rate_limit_api import RiotRateLimitAPI
 
 class PowerLevelService(RiotRateLimitAPI):
@@ -366,9 +366,6 @@ class PowerLevelService(RiotRateLimitAPI):
         #                             'unspent_flag', 'sec_to_next_drake', 'sec_to_next_herald', 'sec_to_next_baron',  'time_bucket_early', 'time_bucket_mid', 'time_bucket_late', 'patch_minor']
         # TODO: don't know if we need patch_minor column
         # TODO: should we do timestamp_ms or minute column? we can get timestamp in ms from match_timeline but don't know if it will be useful
-        rate_limits = []
-        rate_history = defaultdict(list)
-
         # power_level_columns = ['match_id', 'total_gold', 'total_wards_placed', 'total_wards_destroyed', 
         #                     'vision_score', 'total_kills', 'total_deaths', 'total_assists', 
         #                     'total_tower_destroyed', 'heralds_killed', 'barons_killed', 'dragons_killed', 
@@ -385,15 +382,15 @@ class PowerLevelService(RiotRateLimitAPI):
             power_level_dataset = pd.DataFrame(columns=power_level_columns)
             power_level_dataset.to_csv(f'power_level_{puuid}.csv', index=True, header=True)
             for match_timelines_folder in os.listdir(os.path.join(base_folder, puuid)):
-                # read in the file as a json object
+                # read in the bulk (compressed NDJSON or legacy JSON array)
                 print(match_timelines_folder)
-                with open(os.path.join(base_folder, puuid, match_timelines_folder), 'r', encoding='utf-8') as f:
-                    match_timelines = json.load(f)
+                with open(os.path.join(base_folder, puuid, match_timelines_folder), 'rb') as f:
+                    _, match_timelines = iter_bulk(f)
                     for match_timeline in match_timelines:
                         player_idx = match_timeline['metadata']['participants'].index(puuid)
                         match_id = match_timeline['metadata']['matchId']
                         
-                        match_obj = self.call_endpoint_with_rate_limit(self.match_url.format(match_id=match_id), rate_limits, rate_history) 
+                        match_obj = self.call_endpoint_with_rate_limit(self.match_url.format(match_id=match_id))
                         metrics = self.extract_all_metrics(match_obj, player_idx)
                         print(metrics)
                         input()
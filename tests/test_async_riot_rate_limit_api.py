@@ -0,0 +1,72 @@
+import threading
+import pytest
+from libs.common.constants.league_constants import MATCH_V5_URL
+from libs.common.match_cache import MatchCache
+from libs.common.metrics import InMemoryMetricsSink
+from libs.common.rate_limiter import Priority, RateLimiterRegistry
+from libs.common.ttl_cache import TieredTTLCache
+from benchmarks.fake_riot_server import FakeRiotServer, Recordings
+
+RECORDS = [{'url': MATCH_V5_URL.format(match_id=f'NA1_{n}'), 'status': 200, 'body': {'metadata': {'matchId': f'NA1_{n}'}}} for n in range(20)]
+
+@pytest.fixture
+def make_api(monkeypatch):
+    monkeypatch.setenv('ENV', 'test')
+    monkeypatch.setenv('RIOT_API_KEY', 'test-key')
+    from libs.common.async_riot_rate_limit_api import AsyncRiotRateLimitAPI
+
+    def make(server, limiters=None, **kwargs):
+        monkeypatch.setenv('RIOT_API_BASE_URL', server.base_url)
+        return AsyncRiotRateLimitAPI(limiters=limiters or RateLimiterRegistry(), match_cache=MatchCache(), lookup_cache=TieredTTLCache(), metrics=InMemoryMetricsSink(), **kwargs)
+    return make
+
+class ThreadRecordingLimiters(RateLimiterRegistry):
+    '''Records the threads the limiter is called from (the persistent backends block on I/O)'''
+    def __init__(self):
+        super().__init__()
+        self.threads = set()
+
+    def try_acquire(self, keys, priority=Priority.INTERACTIVE):
+        self.threads.add(threading.current_thread())
+        return super().try_acquire(keys, priority)
+
+    def sync_counts(self, key, counts):
+        self.threads.add(threading.current_thread())
+        return super().sync_counts(key, counts)
+
+def test_limiter_is_called_off_the_event_loop(make_api):
+    limiters = ThreadRecordingLimiters()
+    with FakeRiotServer(Recordings(RECORDS)) as server:
+        api = make_api(server, limiters)
+        assert len(api.fetch_many([record['url'] for record in RECORDS])) == len(RECORDS)
+    # fetch_many runs the event loop in this thread
+    assert limiters.threads and threading.current_thread() not in limiters.threads
+
+def test_results_come_back_in_input_order(make_api):
+    urls = [record['url'] for record in reversed(RECORDS)]
+    with FakeRiotServer(Recordings(RECORDS), latency=0.01, jitter=0.02) as server:
+        results = make_api(server, max_in_flight=8).fetch_many(urls)
+    assert [result['metadata']['matchId'] for result in results] == [f'NA1_{n}' for n in reversed(range(20))]
+
+def test_identical_urls_share_one_request(make_api):
+    urls = [RECORDS[0]['url'], RECORDS[1]['url'], RECORDS[0]['url'], RECORDS[0]['url']]
+    with FakeRiotServer(Recordings(RECORDS)) as server:
+        results = make_api(server).fetch_many(urls)
+    assert [result['metadata']['matchId'] for result in results] == ['NA1_0', 'NA1_1', 'NA1_0', 'NA1_0']
+    assert server.stats['requests'] == 2
+
+def test_rate_limited_requests_are_retried_after_retry_after(make_api):
+    with FakeRiotServer(Recordings(RECORDS), app_limits=[(1, 1)]) as server:
+        # the window is full: the first request gets a 429 + Retry-After
+        server.admit(RECORDS[0]['url'])
+        results = make_api(server).fetch_many([RECORDS[1]['url'], RECORDS[2]['url']])
+    assert [result['metadata']['matchId'] for result in results] == ['NA1_1', 'NA1_2']
+    assert server.stats['rate_limited'] >= 1
+
+def test_matches_riot_does_not_have_are_none(make_api):
+    # an unknown method has no recording to fall back on: 404
+    missing = 'https://americas.api.riotgames.com/riot/account/v1/accounts/by-puuid/nobody'
+    with FakeRiotServer(Recordings(RECORDS)) as server:
+        results = make_api(server).fetch_many([RECORDS[0]['url'], missing, RECORDS[1]['url']])
+    assert results[1] is None
+    assert [results[0]['metadata']['matchId'], results[2]['metadata']['matchId']] == ['NA1_0', 'NA1_1']
@@ -0,0 +1,52 @@
+import gzip, io, json
+import pytest
+from libs.common.bulk_format import KIND_MANIFEST, KIND_MATCHES, bulk_name, encode_bulk, is_bulk_key, iter_bulk, iter_bulk_lines, make_header, read_bulk
+
+MATCHES = [{'metadata': {'matchId': f'NA1_{i}'}, 'info': {'gameEndTimestamp': i}} for i in range(3)]
+
+def test_gzip_round_trip_streams_records():
+    data = encode_bulk(make_header(KIND_MATCHES, len(MATCHES), puuid='p1'), MATCHES)
+    assert data[:2] == b'\x1f\x8b'
+    header, records = iter_bulk(io.BytesIO(data))
+    assert header['kind'] == KIND_MATCHES and header['puuid'] == 'p1' and header['count'] == 3
+    assert next(records) == MATCHES[0]
+    assert list(records) == MATCHES[1:]
+
+def test_reads_uncompressed_ndjson():
+    # ex: an S3 object served with Content-Encoding: gzip already decompressed by the HTTP client
+    data = gzip.decompress(encode_bulk(make_header(KIND_MANIFEST, 1), [{'match_id': 'NA1_1'}]))
+    assert read_bulk(data) == ({'format': 'rift-bulk', 'version': 1, 'kind': KIND_MANIFEST, 'count': 1}, [{'match_id': 'NA1_1'}])
+
+def test_reads_legacy_bulks():
+    header, records = read_bulk(json.dumps(MATCHES, indent=4).encode('utf-8'))
+    assert (header['version'], header['kind'], records) == (0, KIND_MATCHES, MATCHES)
+
+    header, records = read_bulk(json.dumps({'manifest_version': 1, 'puuid': 'p1', 'match_ids': ['NA1_1']}).encode('utf-8'))
+    assert (header['kind'], header['puuid'], records) == (KIND_MANIFEST, 'p1', [{'match_id': 'NA1_1'}])
+
+def test_lines_are_the_undecoded_records():
+    header, lines = iter_bulk_lines(io.BytesIO(encode_bulk(make_header(KIND_MATCHES, len(MATCHES)), MATCHES)))
+    assert header['kind'] == KIND_MATCHES
+    assert [json.loads(line) for line in lines] == MATCHES
+
+    # legacy bulks have no lines, one per record
+    header, lines = iter_bulk_lines(io.BytesIO(json.dumps(MATCHES, indent=4).encode('utf-8')))
+    assert header['version'] == 0 and [json.loads(line) for line in lines] == MATCHES
+
+def test_rejects_newer_versions():
+    data = encode_bulk({'format': 'rift-bulk', 'version': 99, 'kind': KIND_MATCHES, 'count': 0}, [])
+    with pytest.raises(ValueError):
+        read_bulk(data)
+
+def test_is_bulk_key():
+    assert is_bulk_key('rank_match_info/gold_I_match_infos/p1/match_manifest_1.ndjson.gz')
+    assert is_bulk_key('rank_match_info/gold_I_match_infos/p1/match_info_bulk_1.json')
+    assert not is_bulk_key('matches/NA1_1.json.gz')
+
+def test_bulk_names_are_deterministic():
+    name = bulk_name(KIND_MANIFEST, ['NA1_3', 'NA1_2', 'NA1_1'])
+    assert name == bulk_name(KIND_MANIFEST, ['NA1_3', 'NA1_2', 'NA1_1'])
+    assert name.startswith('match_manifest_NA1_3_NA1_1_') and is_bulk_key(name)
+    # same range, different matches in between
+    assert name != bulk_name(KIND_MANIFEST, ['NA1_3', 'NA1_1'])
+    assert bulk_name(KIND_MANIFEST, ['NA1_1'], 'zstd').endswith('.ndjson.zst')
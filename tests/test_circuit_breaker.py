@@ -0,0 +1,165 @@
+import json, threading, time
+import pytest
+from libs.common.circuit_breaker import Admission, CircuitBreaker
+from libs.common.match_cache import MatchCache
+from libs.common.metrics import InMemoryMetricsSink
+from libs.common.rate_limiter import RateLimiterRegistry
+from libs.common.riot_errors import RiotCircuitOpen, RiotDeadlineExceeded, RiotRetriesExhausted
+from libs.common.ttl_cache import TieredTTLCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_breaker_opens_after_threshold_and_half_opens():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+
+    clock.now = 30
+    # a single trial call once the reset timeout is over
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    clock.now = 60
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.allow() and breaker.allow()
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None, headers=None):
+        self.status_code = status_code
+        self.payload = payload
+        self.headers = headers or {}
+        self.content = json.dumps(payload).encode('utf-8')
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, timeout=None):
+        self.calls += 1
+        return self.responses.pop(0)
+
+@pytest.fixture
+def riot_api(monkeypatch):
+    monkeypatch.setenv('ENV', 'test')
+    monkeypatch.setenv('RIOT_API_KEY', 'test-key')
+    monkeypatch.setattr(time, 'sleep', lambda s: None)
+    from libs.common.riot_rate_limit_api import RiotRateLimitAPI
+    return RiotRateLimitAPI(limiters=RateLimiterRegistry(), match_cache=MatchCache(), lookup_cache=TieredTTLCache(), metrics=InMemoryMetricsSink())
+
+URL = 'https://americas.api.riotgames.com/lol/match/v5/matches/by-puuid/p/ids'
+
+def test_server_errors_raise_after_max_retries(riot_api):
+    riot_api.session = FakeSession([FakeResponse(503)] * 3)
+    with pytest.raises(RiotRetriesExhausted) as e:
+        riot_api.call_endpoint_with_rate_limit(URL, max_retries=3)
+    assert e.value.status_code == 503
+
+def test_open_circuit_fails_fast(riot_api):
+    riot_api.session = FakeSession([FakeResponse(500)] * riot_api.BREAKER_FAILURE_THRESHOLD)
+    with pytest.raises(RiotRetriesExhausted):
+        riot_api.call_endpoint_with_rate_limit(URL, max_retries=riot_api.BREAKER_FAILURE_THRESHOLD)
+    with pytest.raises(RiotCircuitOpen):
+        riot_api.call_endpoint_with_rate_limit(URL)
+    assert riot_api.session.calls == riot_api.BREAKER_FAILURE_THRESHOLD
+
+def test_retry_after_past_deadline_raises(riot_api):
+    riot_api.session = FakeSession([FakeResponse(429, headers={'Retry-After': '60'})])
+    with pytest.raises(RiotDeadlineExceeded):
+        riot_api.call_endpoint_with_rate_limit(URL, deadline=time.monotonic() + 5)
+    assert riot_api.session.calls == 1
+
+def test_not_found_returns_none(riot_api):
+    riot_api.session = FakeSession([FakeResponse(404)])
+    assert riot_api.call_endpoint_with_rate_limit(URL) is None
+
+def test_call_timings_are_recorded_per_family(riot_api):
+    riot_api.session = FakeSession([FakeResponse(429, headers={'Retry-After': '2'}), FakeResponse(200, ['NA1_1'])])
+    assert riot_api.call_endpoint_with_rate_limit(URL) == ['NA1_1']
+    family = (('Family', 'match-v5'),)
+    assert riot_api.metrics.counters[('RateLimited', family)] == 1
+    assert riot_api.metrics.histograms[('RetrySleep', family)] == [2000.0]
+    assert riot_api.metrics.histograms[('Attempts', family)] == [2]
+
+def open_breaker_until_trial(riot_api):
+    riot_api.session = FakeSession([FakeResponse(500)] * riot_api.BREAKER_FAILURE_THRESHOLD)
+    with pytest.raises(RiotRetriesExhausted):
+        riot_api.call_endpoint_with_rate_limit(URL, max_retries=riot_api.BREAKER_FAILURE_THRESHOLD)
+    breaker = riot_api.circuit_breaker(riot_api.rate_limit_keys(URL)[0])
+    # the reset timeout is over, the next call is the half-open trial
+    breaker.opened_at -= breaker.reset_timeout
+    return breaker
+
+def test_trial_that_dies_to_a_deadline_does_not_wedge_the_breaker(riot_api):
+    breaker = open_breaker_until_trial(riot_api)
+    with pytest.raises(RiotDeadlineExceeded):
+        riot_api.call_endpoint_with_rate_limit(URL, deadline=time.monotonic() - 1)
+    assert not breaker.trial_in_flight
+
+    riot_api.session = FakeSession([FakeResponse(200, ['NA1_1'])])
+    assert riot_api.call_endpoint_with_rate_limit(URL) == ['NA1_1']
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_trial_without_an_outcome_is_given_back(riot_api):
+    breaker = open_breaker_until_trial(riot_api)
+
+    class ExplodingSession:
+        def get(self, url, timeout=None):
+            raise KeyError('not a network error')
+
+    riot_api.session = ExplodingSession()
+    with pytest.raises(KeyError):
+        riot_api.call_endpoint_with_rate_limit(URL)
+    assert breaker.state == CircuitBreaker.HALF_OPEN and not breaker.trial_in_flight
+    assert breaker.allow()
+
+def test_call_admitted_while_closed_keeps_another_callers_trial(riot_api):
+    breaker = riot_api.circuit_breaker(riot_api.rate_limit_keys(URL)[0])
+
+    class TrippingSession:
+        '''While this call is on the wire the breaker opens and another caller takes the half-open trial'''
+        def get(self, url, timeout=None):
+            for _ in range(breaker.failure_threshold):
+                breaker.record_failure()
+            breaker.opened_at -= breaker.reset_timeout
+            assert breaker.allow() == Admission.TRIAL
+            raise KeyError('not a network error')
+
+    riot_api.session = TrippingSession()
+    with pytest.raises(KeyError):
+        riot_api.call_endpoint_with_rate_limit(URL)
+    # still a single probe
+    assert breaker.trial_in_flight and not breaker.allow()
+
+def test_coalesced_caller_is_bounded_by_its_own_deadline(riot_api):
+    started, release = threading.Event(), threading.Event()
+
+    class SlowSession:
+        '''Riot hanging on the leader's call (no deadline)'''
+        def get(self, url, timeout=None):
+            started.set()
+            release.wait()
+            return FakeResponse(200, ['NA1_1'])
+
+    riot_api.session = SlowSession()
+    results = []
+    leader = threading.Thread(target=lambda: results.append(riot_api.call_endpoint_with_rate_limit(URL)))
+    leader.start()
+    started.wait()
+    with pytest.raises(RiotDeadlineExceeded):
+        riot_api.call_endpoint_with_rate_limit(URL, deadline=time.monotonic() + 0.05)
+    release.set()
+    leader.join()
+    assert results == [['NA1_1']]
@@ -0,0 +1,32 @@
+from libs.common.bulk_format import is_bulk_key
+from libs.common.crawl_checkpoint import LocalCheckpointStore, S3CheckpointStore, checkpoint_store_from_env
+
+STATE = {'puuid': 'p1', 'type': 'created', 'start': 100, 'start_time': 1, 'end_time': 2, 'last_match_id': None, 's3_keys': ['k1', 'k2'], 'done': False}
+
+def test_local_store_round_trip(tmp_path):
+    store = LocalCheckpointStore(str(tmp_path))
+    assert store.get('p1') is None
+    store.put('p1', STATE)
+    store.put('p1', {**STATE, 'start': 150})
+
+    # a new invocation reads the latest checkpoint back
+    assert LocalCheckpointStore(str(tmp_path)).get('p1') == {**STATE, 'start': 150}
+    store.delete('p1')
+    store.delete('p1')
+    assert store.get('p1') is None
+    assert not any(tmp_path.iterdir())
+
+def test_checkpoints_are_not_ingested_as_bulks():
+    assert not is_bulk_key(S3CheckpointStore('bucket')._key('p1'))
+
+def test_s3_checkpoints_go_to_the_match_store_bucket(monkeypatch):
+    for name in ('CHECKPOINT_DIR', 'CHECKPOINT_S3_BUCKET', 'MATCH_CACHE_S3_BUCKET'):
+        monkeypatch.delenv(name, raising=False)
+    # the bulk bucket triggers the preprocess Lambda on every write
+    monkeypatch.setenv('S3_BUCKET_NAME', 'bulks')
+    assert checkpoint_store_from_env() is None
+
+    monkeypatch.setenv('MATCH_CACHE_S3_BUCKET', 'match-store')
+    assert checkpoint_store_from_env().bucket == 'match-store'
+    monkeypatch.setenv('CHECKPOINT_S3_BUCKET', 'checkpoints')
+    assert checkpoint_store_from_env().bucket == 'checkpoints'
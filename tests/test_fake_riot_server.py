@@ -0,0 +1,58 @@
+import pytest
+from libs.common.constants.league_constants import MATCH_V5_URL, GET_NAME_BY_PUUID_URL, GET_PLAYER_ACTIVE_REGION_URL
+from libs.common.match_cache import MatchCache
+from libs.common.metrics import InMemoryMetricsSink
+from libs.common.rate_limiter import RateLimiterRegistry
+from libs.common.ttl_cache import TieredTTLCache
+from benchmarks.fake_riot_server import FakeRiotServer, Recordings, RiotRecorder
+
+MATCH = {'metadata': {'matchId': 'NA1_1'}, 'info': {'gameEndTimestamp': 1}}
+RECORDS = [
+    {'url': MATCH_V5_URL.format(match_id='NA1_1'), 'status': 200, 'body': MATCH},
+    {'url': GET_NAME_BY_PUUID_URL.format(puuid='p1'), 'status': 200, 'body': {'gameName': 'a', 'tagLine': 'b'}},
+]
+
+@pytest.fixture
+def make_api(monkeypatch):
+    monkeypatch.setenv('ENV', 'test')
+    monkeypatch.setenv('RIOT_API_KEY', 'test-key')
+    from libs.common.riot_rate_limit_api import RiotRateLimitAPI
+
+    def make(server):
+        monkeypatch.setenv('RIOT_API_BASE_URL', server.base_url)
+        return RiotRateLimitAPI(limiters=RateLimiterRegistry(), match_cache=MatchCache(), lookup_cache=TieredTTLCache(), metrics=InMemoryMetricsSink())
+    return make
+
+def test_replays_recordings_and_falls_back_per_method(make_api):
+    with FakeRiotServer(Recordings(RECORDS)) as server:
+        api = make_api(server)
+        assert api.call_endpoint_with_rate_limit(GET_NAME_BY_PUUID_URL.format(puuid='p1')) == {'gameName': 'a', 'tagLine': 'b'}
+        # an unrecorded match ID is served the recorded match
+        assert api.get_match('NA1_999') == MATCH
+        # limits were learned from the emulated headers
+        assert api.limiters.limits('americas.api.riotgames.com') == [(20, 1), (100, 120)]
+    assert server.stats['served'] == 2
+
+def test_emulates_429_with_retry_after(make_api):
+    with FakeRiotServer(Recordings(RECORDS), app_limits=[(1, 1)]) as server:
+        server.admit(MATCH_V5_URL.format(match_id='NA1_1'))
+        headers, wait, limit_type = server.admit(MATCH_V5_URL.format(match_id='NA1_2'))
+        assert limit_type == 'application' and 0 < wait <= 1
+        assert headers['X-App-Rate-Limit-Count'] == '1:1'
+
+        # the client backs off on the 429 and gets the payload on retry
+        api = make_api(server)
+        assert api.get_match('NA1_1') == MATCH
+    assert server.stats['rate_limited'] >= 1
+
+def test_recorder_writes_replayable_lines(make_api, tmp_path):
+    path = str(tmp_path / 'riot.jsonl')
+    with FakeRiotServer(Recordings(RECORDS)) as server:
+        api = make_api(server)
+        with RiotRecorder(api, path) as recorder:
+            api.get_match('NA1_1')
+            api.call_endpoint_with_rate_limit(GET_PLAYER_ACTIVE_REGION_URL.format(puuid='p1'))
+    assert recorder.recorded == 2
+    recordings = Recordings.load(path)
+    assert recordings.lookup(MATCH_V5_URL.format(match_id='NA1_1'))['body'] == MATCH
+    assert recordings.exact[GET_PLAYER_ACTIVE_REGION_URL.format(puuid='p1')]['status'] == 404
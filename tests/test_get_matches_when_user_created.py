@@ -0,0 +1,198 @@
+import importlib, json
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
+import pytest
+from botocore.exceptions import ClientError
+from libs.common.bulk_format import KIND_MANIFEST, bulk_name, read_bulk
+from libs.common.crawl_checkpoint import LocalCheckpointStore
+from libs.common.match_cache import MatchCache
+from libs.common.work_queue import InProcessWorkQueue
+from benchmarks.fake_riot_server import FakeRiotServer, Recordings
+
+PUUID = 'p1'
+# in the crawled window (this year), newest first like Riot's match IDs by puuid
+SEASON_START = int(datetime.now(timezone.utc).replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0).timestamp())
+MATCHES = [(f'NA1_{n}', SEASON_START + n * 60) for n in range(120, 0, -1)]
+
+def make_match(match_id: str, start: int) -> dict:
+    return {
+        'metadata': {'matchId': match_id, 'participants': [PUUID] + [f'p{i}' for i in range(2, 11)]},
+        'info': {'gameDuration': 1800, 'gameStartTimestamp': start * 1000, 'gameEndTimestamp': (start + 1800) * 1000,
+                 'participants': [{'puuid': PUUID, 'championName': 'Ahri', 'win': True}] * 10},
+    }
+
+class PlayerRecordings(Recordings):
+    '''Riot as seen by one player: paged match IDs filtered by startTime/endTime, their matches, region and rank'''
+    def __init__(self, matches: list[tuple[str, int]]):
+        super().__init__()
+        self.matches = matches
+        self.pages = []
+        self.fetched = []
+
+    def lookup(self, url: str) -> dict | None:
+        parts = urlsplit(url)
+        if parts.path.endswith(f'/by-puuid/{PUUID}/ids'):
+            query = {name: int(values[0]) for name, values in parse_qs(parts.query).items() if name != 'type'}
+            self.pages.append(query['start'])
+            ids = [match_id for match_id, start in self.matches if query['startTime'] <= start <= query['endTime']]
+            return {'status': 200, 'body': ids[query['start']:query['start'] + query['count']]}
+        if '/riot/account/v1/region/' in parts.path:
+            return {'status': 200, 'body': {'puuid': PUUID, 'game': 'lol', 'region': 'na1'}}
+        if '/lol/league/v4/entries/' in parts.path:
+            return {'status': 200, 'body': [{'queueType': 'RANKED_SOLO_5x5', 'tier': 'GOLD', 'rank': 'I'}]}
+        match_id = parts.path.rsplit('/', 1)[-1]
+        self.fetched.append(match_id)
+        if (start := dict(self.matches).get(match_id)) is not None:
+            return {'status': 200, 'body': make_match(match_id, start)}
+        return None
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.puts = 0
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+        return {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.puts += 1
+        self.objects[Key] = Body
+
+    def manifests(self) -> dict[str, list[str]]:
+        '''match IDs of every manifest by key'''
+        return {key: [r['match_id'] for r in read_bulk(body)[1]] for key, body in self.objects.items()}
+
+    def headers(self) -> list[dict]:
+        return [read_bulk(body)[0] for body in self.objects.values()]
+
+class FakeLambda:
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.invocations.append(json.loads(Payload))
+
+class FakeContext:
+    invoked_function_arn = 'arn:aws:lambda:us-east-1:0:function:crawler'
+
+    def __init__(self, remaining: float = 900):
+        self.remaining = remaining
+
+    def get_remaining_time_in_millis(self):
+        return int(self.remaining * 1000)
+
+@pytest.fixture
+def crawler(monkeypatch, tmp_path):
+    for name, value in {'ENV': 'test', 'RIOT_API_KEY': 'key', 'DB_ARN': 'arn', 'SECRET_ARN': 'arn', 'DB_NAME': 'db',
+                        'AWS_DEFAULT_REGION': 'us-east-1', 'RIOT_METRICS_SINK': 'none', 'S3_BUCKET_NAME': 'bucket'}.items():
+        monkeypatch.setenv(name, value)
+    module = importlib.import_module('get_matches_when_user_created.get_matches_when_user_created')
+    recordings = PlayerRecordings(MATCHES)
+    with FakeRiotServer(recordings, app_limits=[(10_000, 1)], method_limits=[(10_000, 1)]) as server:
+        monkeypatch.setattr(module.riot_api_service, 'base_url', server.base_url)
+        monkeypatch.setattr(module.riot_api_service, 'match_cache', MatchCache())
+        monkeypatch.setattr(module, 'ingest_store', MatchCache())
+        monkeypatch.setattr(module, 's3_client', FakeS3())
+        monkeypatch.setattr(module, 'lambda_client', FakeLambda())
+        monkeypatch.setattr(module, 'checkpoints', LocalCheckpointStore(str(tmp_path)))
+        monkeypatch.setattr(module, 'get_user_watermark', lambda puuid: None)
+        module.recordings = recordings
+        module.server = server
+        yield module
+
+def crawl(crawler, event_type: str = 'created', remaining: float = 900, **event) -> dict:
+    result = crawler.lambda_handler({'puuid': PUUID, 'type': event_type, **event}, FakeContext(remaining))
+    assert 'error' not in result, result
+    return result
+
+def test_crawl_hands_off_and_resumes_from_its_checkpoint(crawler):
+    # too close to the deadline to request a page: the crawl is checkpointed and continued
+    result = crawl(crawler, remaining=crawler.HANDOFF_SECONDS + 10)
+    assert result['continued']
+    assert crawler.lambda_client.invocations == [{'puuid': PUUID, 'type': 'created', 'continuation': 1}]
+    state = crawler.checkpoints.get(crawler.checkpoint_key(PUUID, 'created'))
+    assert (state['start'], state['continuations'], state['done']) == (0, 1, False)
+
+    # the continuation resumes it and finishes it: every match is in a manifest, the checkpoint is gone
+    result = crawl(crawler, **crawler.lambda_client.invocations[0])
+    assert result['ok'] and len(result['result']) == 3
+    assert sorted(sum(crawler.s3_client.manifests().values(), [])) == sorted(match_id for match_id, _ in MATCHES)
+    assert crawler.checkpoints.get(crawler.checkpoint_key(PUUID, 'created')) is None
+
+def test_resumed_crawl_starts_after_the_last_written_page(crawler):
+    state = crawler.new_crawl_state(PUUID)
+    state.update({'start': 100, 'start_time': SEASON_START, 'end_time': MATCHES[0][1], 'continuations': 1})
+    crawler.save_crawl_state(state)
+
+    crawl(crawler, continuation=1)
+    assert crawler.recordings.pages == [100]
+    assert list(crawler.s3_client.manifests().values()) == [[match_id for match_id, _ in MATCHES[100:]]]
+
+def test_refresh_leaves_the_pending_created_crawl_alone(crawler, monkeypatch):
+    created = crawler.new_crawl_state(PUUID)
+    created.update({'start': 50, 'start_time': SEASON_START, 'end_time': MATCHES[0][1], 'continuations': 1})
+    crawler.save_crawl_state(created)
+    # the created crawl's first manifest already moved the watermark to the newest match
+    monkeypatch.setattr(crawler, 'get_user_watermark', lambda puuid: (MATCHES[0][1], MATCHES[0][0]))
+
+    crawl(crawler, 'refresh')
+    assert crawler.s3_client.manifests() == {}
+    assert crawler.checkpoints.get(crawler.checkpoint_key(PUUID, 'created'))['start'] == 50
+
+    # the created crawl's continuation still covers the older history
+    crawl(crawler, continuation=1)
+    assert sorted(sum(crawler.s3_client.manifests().values(), [])) == sorted(match_id for match_id, _ in MATCHES[50:])
+
+PREFIX = f'rank_match_info/gold_I_match_infos/{PUUID}'
+
+def manifest_keys(match_ids: list[str], size: int = 50) -> set[str]:
+    return {f'{PREFIX}/{bulk_name(KIND_MANIFEST, match_ids[i:i + size])}' for i in range(0, len(match_ids), size)}
+
+def test_pipeline_writes_a_manifest_per_page_with_deterministic_names(crawler):
+    result = crawl(crawler)
+    match_ids = [match_id for match_id, _ in MATCHES]
+    assert set(crawler.s3_client.manifests()) == manifest_keys(match_ids)
+    assert sorted(result['result']) == sorted(f's3://bucket/{key}' for key in manifest_keys(match_ids))
+    # the manifests point to the ingest views, every match was projected and stored once
+    assert {header['view'] for header in crawler.s3_client.headers()} == {'ingest'}
+    assert all(crawler.ingest_store.contains(match_id) for match_id in match_ids)
+    assert sorted(crawler.recordings.fetched) == sorted(match_ids)
+
+def test_rerun_skips_stored_matches_and_existing_manifests(crawler):
+    crawl(crawler)
+    puts, fetched = crawler.s3_client.puts, len(crawler.recordings.fetched)
+
+    crawl(crawler)
+    assert crawler.s3_client.puts == puts
+    assert len(crawler.recordings.fetched) == fetched
+
+def test_refresh_stops_at_the_watermark(crawler, monkeypatch):
+    # the user has everything up to the 11th newest match
+    newest, watermark = [match_id for match_id, _ in MATCHES[:10]], MATCHES[10]
+    monkeypatch.setattr(crawler, 'get_user_watermark', lambda puuid: (watermark[1], watermark[0]))
+
+    crawl(crawler, 'refresh')
+    # Riot's startTime is inclusive, the watermark match itself is dropped
+    assert list(crawler.s3_client.manifests().values()) == [newest]
+    assert sorted(crawler.recordings.fetched) == sorted(newest)
+
+def test_fan_out_writes_the_pipeline_manifests(crawler, monkeypatch):
+    crawl(crawler)
+    pipeline = crawler.s3_client.manifests()
+
+    monkeypatch.setattr(crawler, 's3_client', FakeS3())
+    monkeypatch.setattr(crawler, 'ingest_store', MatchCache())
+    monkeypatch.setattr(crawler, 'CRAWL_MODE', 'fanout')
+    monkeypatch.setattr(crawler, 'work_queue', InProcessWorkQueue())
+    result = crawl(crawler)
+    assert result['result']['chunks'] == 3
+    assert crawler.s3_client.manifests() == pipeline
+    assert len(crawler.work_queue) == 0
+
+def test_worker_reports_only_the_failed_chunks(crawler):
+    chunk = {'puuid': PUUID, 'key_prefix': PREFIX, 'match_ids': [match_id for match_id, _ in MATCHES[:5]]}
+    event = {'Records': [{'messageId': 'm1', 'body': json.dumps(chunk)}, {'messageId': 'm2', 'body': json.dumps({'puuid': PUUID})}]}
+    assert crawler.worker_handler(event, FakeContext()) == {'batchItemFailures': [{'itemIdentifier': 'm2'}]}
+    assert set(crawler.s3_client.manifests()) == manifest_keys(chunk['match_ids'])
@@ -0,0 +1,12 @@
+import json
+from libs.common import json_codec
+
+def test_round_trip_matches_stdlib():
+    obj = {'metadata': {'matchId': 'NA1_1', 'participants': ['a', 'b']}, 'info': {'gameName': 'Ahri ✨', 'x': 1.5, 'win': True, 'none': None}}
+    data = json_codec.dumps(obj)
+    assert isinstance(data, bytes)
+    assert json_codec.loads(data) == obj
+    assert json_codec.loads(data.decode('utf-8')) == obj
+    # compact, non-ASCII kept as UTF-8, readable by every backend
+    assert json.loads(data) == obj
+    assert b' ' not in data.replace('Ahri ✨'.encode('utf-8'), b'')
@@ -0,0 +1,30 @@
+from libs.common.match_cache import MatchCache, LocalMatchCacheBackend
+
+FINISHED = {'metadata': {'matchId': 'NA1_1'}, 'info': {'gameEndTimestamp': 1700000000000, 'participants': []}}
+IN_PROGRESS = {'metadata': {'matchId': 'NA1_2'}, 'info': {'participants': []}}
+
+def test_local_backend_round_trip(tmp_path):
+    cache = MatchCache(LocalMatchCacheBackend(str(tmp_path)))
+    assert cache.get('NA1_1') is None
+    assert cache.put('NA1_1', FINISHED)
+
+    # a fresh cache (new Lambda instance) reads it back from disk
+    cold = MatchCache(LocalMatchCacheBackend(str(tmp_path)))
+    assert cold.contains('NA1_1')
+    assert cold.get('NA1_1') == FINISHED
+
+def test_unfinished_matches_are_not_cached(tmp_path):
+    cache = MatchCache(LocalMatchCacheBackend(str(tmp_path)))
+    assert not cache.put('NA1_2', IN_PROGRESS)
+    assert cache.get('NA1_2') is None
+    assert not any(tmp_path.iterdir())
+
+def test_lru_evicts_least_recently_used():
+    cache = MatchCache(lru_size=2)
+    for match_id in ('NA1_1', 'NA1_2', 'NA1_3'):
+        cache.put(match_id, FINISHED)
+        if match_id == 'NA1_2':
+            cache.get('NA1_1')
+    assert cache.get('NA1_1') is not None
+    assert cache.get('NA1_2') is None
+    assert cache.get('NA1_3') is not None
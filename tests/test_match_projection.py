@@ -0,0 +1,66 @@
+import random
+from libs.common import json_codec
+from libs.common.match_cache import MatchCache, LocalMatchCacheBackend
+from libs.common.match_projection import CHALLENGE_FIELDS, PARTICIPANT_FIELDS, is_ingest_view, project_match
+from services.power_level_service import PowerLevelService
+
+class RecordingDict(dict):
+    '''dict that records the keys read through it (and through the dicts/lists it holds) into `seen`'''
+    def __init__(self, data: dict, seen: set, path: str):
+        super().__init__(data)
+        self.seen = seen
+        self.path = path
+
+    def _wrap(self, key, value):
+        path = f'{self.path}.{key}'
+        if isinstance(value, dict):
+            return RecordingDict(value, self.seen, path)
+        if isinstance(value, list):
+            return [RecordingDict(v, self.seen, f'{path}[]') if isinstance(v, dict) else v for v in value]
+        return value
+
+    def __getitem__(self, key):
+        self.seen.add(f'{self.path}.{key}')
+        return self._wrap(key, super().__getitem__(key))
+
+    def get(self, key, default=None):
+        self.seen.add(f'{self.path}.{key}')
+        return self._wrap(key, super().get(key, default))
+
+def full_match() -> dict:
+    '''A Match-V5 shaped payload with every consumed field plus the noise the view drops'''
+    rng = random.Random(0)
+    def participant(i):
+        fields = {field: rng.randint(0, 5000) for field in PARTICIPANT_FIELDS}
+        fields.update(championName='Ahri', win=i < 5, firstBloodKill=i == 0, firstBloodAssist=i == 1)
+        challenges = {field: rng.random() * 10 for field in CHALLENGE_FIELDS}
+        challenges.update(legendaryItemUsed=[3089, 3157], perfectGame=0)
+        challenges.update({f'unusedChallenge{k}': k for k in range(80)})
+        return {**fields, 'puuid': f'p{i}', 'perks': {'styles': [1, 2, 3]}, **{f'unused{k}': k for k in range(80)}, 'challenges': challenges}
+    return {
+        'metadata': {'matchId': 'NA1_1', 'participants': [f'p{i}' for i in range(10)], 'dataVersion': '2'},
+        'info': {'gameDuration': 1800, 'gameStartTimestamp': 1_700_000_000_000, 'gameEndTimestamp': 1_700_001_800_000,
+                 'queueId': 420, 'teams': [{'bans': []}], 'participants': [participant(i) for i in range(10)]},
+    }
+
+def test_view_has_every_field_power_level_service_reads():
+    match_obj = full_match()
+    view = project_match(match_obj)
+    assert is_ingest_view(view) and not is_ingest_view(match_obj)
+    for idx in range(10):
+        seen = set()
+        metrics = PowerLevelService.extract_all_metrics(None, RecordingDict(match_obj, seen, ''), idx)
+        assert PowerLevelService.extract_all_metrics(None, view, idx) == metrics
+        # every key read from the full payload is part of the view's schema
+        read = {path.rsplit('.', 1)[1] for path in seen}
+        assert read <= {'info', 'participants', 'challenges', 'gameDuration', 'gameStartTimestamp', *PARTICIPANT_FIELDS, *CHALLENGE_FIELDS}
+    assert 'perks' not in view['info']['participants'][0]
+    assert 'unusedChallenge0' not in view['info']['participants'][0]['challenges']
+
+def test_view_is_stored_like_a_finished_match(tmp_path):
+    store = MatchCache(LocalMatchCacheBackend(str(tmp_path)))
+    view = project_match(full_match())
+    assert store.put('NA1_1', view)
+    assert MatchCache(LocalMatchCacheBackend(str(tmp_path))).get('NA1_1') == view
+    # what the Lambdas decode
+    assert len(json_codec.dumps(view)) < len(json_codec.dumps(full_match())) / 2
@@ -0,0 +1,38 @@
+import io, json
+from libs.common.metrics import EMF_MAX_VALUES, EmfMetricsSink
+
+def test_emf_flush_writes_one_document_per_dimension_set():
+    stream = io.StringIO()
+    sink = EmfMetricsSink(namespace='Test', stream=stream)
+    sink.histogram('QueueWait', 12.5, {'Family': 'match-v5'})
+    sink.histogram('QueueWait', 7.5, {'Family': 'match-v5'})
+    sink.count('RateLimited', 1, {'Family': 'match-v5'})
+    sink.count('RateLimited', 2, {'Family': 'match-v5'})
+    sink.count('Calls', 1, {'Family': 'account-v1'})
+    sink.flush()
+
+    documents = {doc['Family']: doc for doc in map(json.loads, stream.getvalue().splitlines())}
+    match = documents['match-v5']
+    assert match['QueueWait'] == [12.5, 7.5]
+    assert match['RateLimited'] == 3
+    directive = match['_aws']['CloudWatchMetrics'][0]
+    assert directive['Namespace'] == 'Test'
+    assert directive['Dimensions'] == [['Family']]
+    assert {'Name': 'RateLimited', 'Unit': 'Count'} in directive['Metrics']
+    assert documents['account-v1']['Calls'] == 1
+
+    # the buffer is emptied by flush
+    stream.truncate(0)
+    sink.flush()
+    assert stream.getvalue() == ''
+
+def test_emf_splits_histograms_past_max_values():
+    stream = io.StringIO()
+    sink = EmfMetricsSink(stream=stream)
+    for i in range(EMF_MAX_VALUES + 1):
+        sink.histogram('Network', i, {'Family': 'match-v5'})
+    sink.flush()
+    documents = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert len(documents) == 2
+    assert len(documents[0]['Network']) == EMF_MAX_VALUES
+    assert documents[1]['Network'] == EMF_MAX_VALUES
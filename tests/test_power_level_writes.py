@@ -0,0 +1,47 @@
+from libs.common.power_level_writes import write_power_levels
+from libs.common.quantile_sketch import KLLSketch
+from libs.common.rds_service import RdsDataService
+
+class FakeRdsData:
+    '''rds-data client where the user's stored power levels are `stored` (match_id -> total), None: no such user'''
+    def __init__(self, stored: dict = None):
+        self.stored = stored
+        self.calls = []
+        self.deltas = []
+
+    def execute_statement(self, **kwargs):
+        sql, params = kwargs['sql'], {p['name']: next(iter(p['value'].values())) for p in kwargs['parameters']}
+        self.calls.append(sql.split()[0] if 'FOR UPDATE' not in sql else 'LOCK')
+        if 'processed_match_count' in sql:
+            if self.stored is None:
+                return {'columnMetadata': [], 'records': []}
+            added = [match_id for match_id in params['match_ids'].split(',') if match_id not in self.stored]
+            return {'columnMetadata': [{'name': 'processed_match_count'}, {'name': 'added'}, {'name': 'added_match_ids'}],
+                    'records': [[{'longValue': len(self.stored) + len(added)}, {'longValue': len(added)}, {'stringValue': ','.join(added)}]]}
+        if 'rank_norm_sketch_deltas' in sql:
+            self.deltas.append(KLLSketch.from_json(params['sketch']))
+        return {}
+
+    def batch_execute_statement(self, **kwargs):
+        self.calls.append('INSERT power_levels')
+        return {}
+
+POWER_LEVEL = {'combat': 1, 'objectives': 1, 'vision': 1, 'economy': 1, 'clutch': 1}
+
+def test_locks_the_user_then_applies_the_aggregates_before_writing():
+    rds = FakeRdsData({})
+    row = write_power_levels(RdsDataService('arn', 'arn', 'db', client=rds), 'p1', [('NA1_1', {**POWER_LEVEL, 'total': 5000})], 'tx1')
+    assert row['added'] == 1
+    assert rds.calls == ['LOCK', 'WITH', 'INSERT power_levels', 'INSERT']
+    assert [delta.quantile(0.5) for delta in rds.deltas] == [5000]
+
+def test_rewritten_match_is_not_queued_for_the_rank_norms_again():
+    rds = FakeRdsData({'NA1_1': 4000})
+    row = write_power_levels(RdsDataService('arn', 'arn', 'db', client=rds), 'p1', [('NA1_1', {**POWER_LEVEL, 'total': 5000}), ('NA1_2', {**POWER_LEVEL, 'total': 7000})], 'tx1')
+    assert (row['processed_match_count'], row['added']) == (2, 1)
+    assert [delta.n for delta in rds.deltas] == [1] and rds.deltas[0].quantile(0.5) == 7000
+
+def test_unknown_user_writes_nothing():
+    rds = FakeRdsData(None)
+    assert write_power_levels(RdsDataService('arn', 'arn', 'db', client=rds), 'nobody', [('NA1_1', {**POWER_LEVEL, 'total': 5000})], 'tx1') is None
+    assert rds.calls == ['LOCK', 'WITH'] and not rds.deltas
@@ -0,0 +1,217 @@
+import importlib, io
+import pytest
+from libs.common.bulk_format import KIND_MATCHES, encode_bulk, make_header
+from libs.common.match_projection import CHALLENGE_FIELDS, PARTICIPANT_FIELDS
+from libs.common.quantile_sketch import KLLSketch
+from libs.common.rds_service import RdsDataService
+
+PUUIDS = [f'p{i}' for i in range(10)]
+
+def make_match(n: int) -> dict:
+    participant = {**{field: 1 for field in PARTICIPANT_FIELDS}, 'championName': 'Ahri', 'win': True,
+                   'challenges': {**{field: 1 for field in CHALLENGE_FIELDS}, 'legendaryItemUsed': [3089]}}
+    return {
+        'metadata': {'matchId': f'NA1_{n}', 'participants': PUUIDS},
+        'info': {'gameDuration': 1800, 'gameStartTimestamp': 1_700_000_000_000 + n, 'gameEndTimestamp': 1_700_001_800_000 + n,
+                 'participants': [participant] * 10},
+    }
+
+class FakeRdsData:
+    '''
+    rds-data client recording every Data API call, the user has `processed` matches before the bulk and
+    a rank norm rebuild can be claimed if the last one is older than `last_rebuild_age` seconds and the tier's
+    sketch so far is `sketch`
+    '''
+    def __init__(self, processed: int = 0, last_rebuild_age: int = 3600, sketch: KLLSketch = None, deltas: list = (), power_levels: list = ()):
+        self.calls = []
+        self.batches = {}
+        # pending delta sketches and app.power_levels as (match_id, puuid, total) of GOLD I users
+        self.deltas = [[{'name': 'sketch', 'value': {'stringValue': delta.to_json()}}] for delta in deltas]
+        self.power_levels = sorted(power_levels)
+        self.processed = processed
+        self.last_rebuild_age = last_rebuild_age
+        self.sketch = sketch
+
+    def execute_statement(self, **kwargs):
+        sql = kwargs['sql']
+        self.calls.append(('execute_statement', kwargs.get('transactionId'), sql))
+        if 'processed_match_count' in sql:
+            params = {p['name']: p['value'] for p in kwargs['parameters']}
+            self.aggregates = {name: value['stringValue'].split(',') for name, value in params.items() if name != 'puuid'}
+            match_ids = params['match_ids']['stringValue']
+            added = len(match_ids.split(','))
+            self.processed += added
+            return {'columnMetadata': [{'name': 'processed_match_count'}, {'name': 'added'}, {'name': 'added_match_ids'}],
+                    'records': [[{'longValue': self.processed}, {'longValue': added}, {'stringValue': match_ids}]]}
+        if 'SET last_rebuild_at' in sql:
+            interval = kwargs['parameters'][0]['value']['longValue']
+            return {'columnMetadata': [{'name': 'last_rebuild_at'}], 'records': [[{'stringValue': 'now'}]] if self.last_rebuild_age >= interval else []}
+        tier = [{'stringValue': 'GOLD'}, {'stringValue': 'I'}]
+        if 'INSERT INTO app.rank_norm_sketch_deltas' in sql:
+            self.deltas.append(kwargs['parameters'])
+            return {}
+        if 'DELETE FROM app.rank_norm_sketch_deltas' in sql:
+            limit = kwargs['parameters'][0]['value']['longValue'] if kwargs['parameters'] else len(self.deltas)
+            deltas = [[*tier, next(p['value'] for p in params if p['name'] == 'sketch')] for params in self.deltas[:limit]]
+            self.deltas = self.deltas[limit:]
+            return {'columnMetadata': [{'name': 'real_rank_tier'}, {'name': 'real_rank_division'}, {'name': 'sketch'}], 'records': deltas}
+        if 'FROM app.power_levels pl' in sql:
+            params = {p['name']: next(iter(p['value'].values())) for p in kwargs['parameters']}
+            rows = [row for row in self.power_levels if row[:2] > (params['after_match_id'], params['after_puuid'])][:params['limit']]
+            return {'columnMetadata': [{'name': name} for name in ('match_id', 'puuid', 'total', 'real_rank_tier', 'real_rank_division')],
+                    'records': [[{'stringValue': match_id}, {'stringValue': puuid}, {'doubleValue': total}, *tier] for match_id, puuid, total in rows]}
+        if 'SELECT real_rank_tier, real_rank_division, sketch' in sql:
+            records = [[*tier, {'stringValue': self.sketch.to_json()}]] if self.sketch else []
+            return {'columnMetadata': [{'name': 'real_rank_tier'}, {'name': 'real_rank_division'}, {'name': 'sketch'}], 'records': records}
+        if 'EXISTS' in sql:
+            return {'columnMetadata': [{'name': 'exists'}], 'records': [[{'booleanValue': True}]]}
+        return {}
+
+    def batch_execute_statement(self, **kwargs):
+        self.calls.append(('batch_execute_statement', kwargs.get('transactionId'), len(kwargs['parameterSets'])))
+        self.batches.setdefault(kwargs['sql'], []).extend({p['name']: next(iter(p['value'].values())) for p in params} for params in kwargs['parameterSets'])
+        return {}
+
+    def begin_transaction(self, **kwargs):
+        self.calls.append(('begin_transaction',))
+        return {'transactionId': 'tx1'}
+
+    def commit_transaction(self, **kwargs):
+        self.calls.append(('commit_transaction',))
+
+    def rollback_transaction(self, **kwargs):
+        self.calls.append(('rollback_transaction',))
+
+class FakeS3:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(self.body)}
+
+@pytest.fixture
+def preprocess(monkeypatch):
+    for name, value in {'ENV': 'test', 'RIOT_API_KEY': 'key', 'DB_ARN': 'arn', 'SECRET_ARN': 'arn', 'DB_NAME': 'db',
+                        'AWS_DEFAULT_REGION': 'us-east-1', 'RIOT_METRICS_SINK': 'none'}.items():
+        monkeypatch.setenv(name, value)
+    return importlib.import_module('preprocess_power_level.preprocess_power_level')
+
+def ingest(preprocess, monkeypatch, matches: int, processed: int = 0, last_rebuild_age: int = 3600, rds: FakeRdsData = None) -> list:
+    rds = rds or FakeRdsData(processed, last_rebuild_age)
+    monkeypatch.setattr(preprocess, 'rds_service', RdsDataService('arn', 'arn', 'db', client=rds))
+    monkeypatch.setattr(preprocess, 's3', FakeS3(encode_bulk(make_header(KIND_MATCHES, matches), [make_match(n) for n in range(matches)])))
+    event = {'Records': [{'s3': {'bucket': {'name': 'bucket'}, 'object': {'key': 'rank_match_info/gold_I_match_infos/p3/match_manifest_x.ndjson.gz'}}}]}
+    assert preprocess.lambda_handler(event, None) == {'ok': True}
+    return rds.calls
+
+def test_bulk_is_written_in_batches_inside_one_transaction(preprocess, monkeypatch):
+    calls = ingest(preprocess, monkeypatch, 50, last_rebuild_age=0)
+    batches = [call for call in calls if call[0] == 'batch_execute_statement']
+    assert batches == [('batch_execute_statement', 'tx1', 50), ('batch_execute_statement', 'tx1', 50)]
+    assert calls.index(('begin_transaction',)) < calls.index(batches[0]) < calls.index(('commit_transaction',))
+
+def test_round_trips_do_not_grow_with_the_bulk(preprocess, monkeypatch):
+    # it used to be 3 calls per match (2 inserts and a COUNT), no aggregate query is left
+    assert not any('COUNT(match_id)' in call[2] for call in ingest(preprocess, monkeypatch, 50) if call[0] == 'execute_statement')
+    # (a user past the 200 matches threshold)
+    assert len(ingest(preprocess, monkeypatch, 250, 1000)) == len(ingest(preprocess, monkeypatch, 5, 1000)) + 4
+    monkeypatch.setattr(preprocess, 'WRITE_BATCH_SIZE', 1000)
+    assert len(ingest(preprocess, monkeypatch, 250, 1000)) == len(ingest(preprocess, monkeypatch, 5, 1000))
+
+def rebuilds(calls: list) -> int:
+    return sum('DELETE FROM app.rank_norm_sketch_deltas' in call[2] for call in calls if call[0] == 'execute_statement')
+
+def test_rank_norm_rebuilds_are_debounced(preprocess, monkeypatch):
+    calls = ingest(preprocess, monkeypatch, 50, processed=500, last_rebuild_age=3600)
+    assert rebuilds(calls) == 1
+    # the bulk's delta sketch goes in with its writes
+    assert any('INSERT INTO app.rank_norm_sketch_deltas' in call[2] and call[1] == 'tx1' for call in calls if call[0] == 'execute_statement')
+    assert rebuilds(ingest(preprocess, monkeypatch, 50, processed=500, last_rebuild_age=10)) == 0
+
+def test_threshold_is_driven_by_the_processed_match_counter(preprocess, monkeypatch):
+    # the bulk that takes the user to 200 matches doesn't wait for the debounce interval
+    assert rebuilds(ingest(preprocess, monkeypatch, 50, processed=100, last_rebuild_age=10)) == 0
+    assert rebuilds(ingest(preprocess, monkeypatch, 50, processed=160, last_rebuild_age=10)) == 1
+    assert rebuilds(ingest(preprocess, monkeypatch, 50, processed=200, last_rebuild_age=10)) == 0
+
+def test_rank_norms_come_from_the_merged_sketches(preprocess, monkeypatch):
+    # the tier already has 900 power levels of 0, the bulk's 50 are over 5% of the tier: p95 is the bulk's
+    stored = KLLSketch()
+    stored.extend([0.0] * 900)
+    rds = FakeRdsData(processed=500, sketch=stored)
+    ingest(preprocess, monkeypatch, 50, rds=rds)
+    total = preprocess.score_matches('p3', [make_match(0)])[0][2]['total']
+
+    sketches = next(rows for sql, rows in rds.batches.items() if 'app.rank_norm_sketches' in sql)
+    assert [(row['real_rank_tier'], row['n']) for row in sketches] == [('GOLD', 950)]
+    assert KLLSketch.from_json(sketches[0]['sketch']).n == 950
+    norms = next(rows for sql, rows in rds.batches.items() if 'app.rank_norms ' in sql)
+    assert norms == [{'real_rank_tier': 'GOLD', 'real_rank_division': 'I', 'p10': 0.0, 'p95': float(total)}]
+
+def test_user_average_is_updated_from_running_sums(preprocess, monkeypatch):
+    rds = FakeRdsData(processed=500)
+    ingest(preprocess, monkeypatch, 5, rds=rds)
+    total = preprocess.score_matches('p3', [make_match(0)])[0][2]['total']
+
+    # no AVG over the user's power levels, the bulk's totals go with its match IDs in the write transaction
+    assert not any('AVG(' in call[2] for call in rds.calls if call[0] == 'execute_statement')
+    update = next(call for call in rds.calls if call[0] == 'execute_statement' and 'power_level_sum' in call[2])
+    assert update[1] == 'tx1'
+    assert rds.aggregates == {'match_ids': [f'NA1_{n}' for n in range(5)], 'totals': [str(float(total))] * 5}
+
+def test_rebuild_restandardizes_the_rebuilt_tiers(preprocess, monkeypatch):
+    rds = FakeRdsData(processed=500)
+    ingest(preprocess, monkeypatch, 5, rds=rds)
+    restandardized = next(rows for sql, rows in rds.batches.items() if 'SET power_level_std' in sql)
+    assert restandardized == [{'real_rank_tier': 'GOLD', 'real_rank_division': 'I'}]
+
+    # no rebuild, no tier-wide update
+    rds = FakeRdsData(processed=500, last_rebuild_age=10)
+    ingest(preprocess, monkeypatch, 5, rds=rds)
+    assert not any('SET power_level_std' in sql for sql in rds.batches)
+
+def test_metrics_are_flushed_when_the_invocation_fails(preprocess, monkeypatch):
+    flushes = []
+    monkeypatch.setattr(preprocess.riot_api_service.metrics, 'flush', lambda: flushes.append(1))
+
+    class BrokenS3:
+        def get_object(self, Bucket, Key):
+            raise RuntimeError('S3 is down')
+
+    monkeypatch.setattr(preprocess, 's3', BrokenS3())
+    event = {'Records': [{'s3': {'bucket': {'name': 'bucket'}, 'object': {'key': 'rank_match_info/gold_I_match_infos/p3/match_manifest_x.ndjson.gz'}}}]}
+    with pytest.raises(RuntimeError):
+        preprocess.lambda_handler(event, None)
+    assert flushes == [1]
+
+def test_user_row_is_locked_before_the_aggregates_are_read(preprocess, monkeypatch):
+    statements = [call[2] for call in ingest(preprocess, monkeypatch, 5) if call[0] == 'execute_statement' and call[1] == 'tx1']
+    lock = next(i for i, sql in enumerate(statements) if 'FOR UPDATE' in sql and 'app.users' in sql)
+    assert lock < next(i for i, sql in enumerate(statements) if 'power_level_sum' in sql)
+
+def test_rebuild_pages_through_the_pending_deltas(preprocess, monkeypatch):
+    deltas = []
+    for n in range(250):
+        delta = KLLSketch()
+        delta.extend([float(n)] * 4)
+        deltas.append(delta)
+    rds = FakeRdsData(processed=500, deltas=deltas)
+    ingest(preprocess, monkeypatch, 5, rds=rds)
+    # 250 waiting deltas and the bulk's, RANK_NORM_DELTAS_PAGE_SIZE at a time
+    assert rebuilds(rds.calls) == 3
+    sketches = next(rows for sql, rows in rds.batches.items() if 'app.rank_norm_sketches' in sql)
+    assert [row['n'] for row in sketches] == [1005]
+
+def test_reseed_builds_compacted_sketches_in_pages(preprocess, monkeypatch):
+    totals = [float(n % 1000) for n in range(12_000)]
+    rds = FakeRdsData(power_levels=[(f'NA1_{n:05d}', 'p3', total) for n, total in enumerate(totals)])
+    monkeypatch.setattr(preprocess, 'rds_service', RdsDataService('arn', 'arn', 'db', client=rds))
+    assert preprocess.rank_norms_handler({'reseed': True}, None) == {'ok': True, 'reseeded': 12_000}
+
+    statements = [call[2] for call in rds.calls if call[0] == 'execute_statement']
+    assert 'REPEATABLE READ' in statements[0]
+    assert sum('FROM app.power_levels pl' in sql for sql in statements) == 3
+    sketch = KLLSketch.from_json(next(rows for sql, rows in rds.batches.items() if 'app.rank_norm_sketches' in sql)[0]['sketch'])
+    assert sketch.n == 12_000 and sum(map(len, sketch.compactors)) < 2000
+    norms = next(rows for sql, rows in rds.batches.items() if 'app.rank_norms ' in sql)[0]
+    assert abs(norms['p10'] - 100) <= 20 and abs(norms['p95'] - 950) <= 20
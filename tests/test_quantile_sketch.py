@@ -0,0 +1,46 @@
+import math, random
+from bisect import bisect_left, bisect_right
+from libs.common.quantile_sketch import KLLSketch
+
+def percentile_disc(values: list, q: float):
+    '''Postgres' percentile_disc(q) WITHIN GROUP (ORDER BY value)'''
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(q * len(ordered))) - 1]
+
+def power_levels(n: int, seed: int = 0) -> list[int]:
+    rng = random.Random(seed)
+    return [max(0, min(10000, int(rng.gauss(4500, 1500)))) for _ in range(n)]
+
+def test_matches_percentile_disc_before_compacting():
+    values = power_levels(150)
+    sketch = KLLSketch(seed=1)
+    sketch.extend(values)
+    for q in (0.0, 0.10, 0.5, 0.95, 1.0):
+        assert sketch.quantile(q) == percentile_disc(values, q)
+
+def test_merged_sketches_stay_within_the_rank_error():
+    values = power_levels(100_000)
+    # one sketch per bulk of 50 power levels, merged like the rank norm rebuild does
+    sketch = KLLSketch(seed=1)
+    for i in range(0, len(values), 50):
+        bulk = KLLSketch(seed=i)
+        bulk.extend(values[i:i + 50])
+        sketch.merge(KLLSketch.from_json(bulk.to_json()))
+    assert sketch.n == len(values)
+    assert sketch.size < 2000
+
+    ordered = sorted(values)
+    for q in (0.10, 0.5, 0.95):
+        estimate = sketch.quantile(q)
+        # the estimate's rank range in the exact data covers q within 1.5% of n
+        low, high = bisect_left(ordered, estimate) / len(ordered), bisect_right(ordered, estimate) / len(ordered)
+        assert low - 0.015 <= q <= high + 0.015, (q, estimate, percentile_disc(values, q))
+
+def test_raw_values_are_a_sketch():
+    # a hand-built single level, ex: raw values exported from app.power_levels (the stored sketches come from
+    # rank_norms_handler({"reseed": true}) instead)
+    values = power_levels(1000)
+    sketch = KLLSketch.from_json('{"k": 200, "n": 1000, "levels": [%s]}' % values)
+    assert sketch.n == 1000 and sketch.size < 1000
+    assert abs(sketch.quantile(0.5) - percentile_disc(values, 0.5)) < 200
+    assert KLLSketch().quantile(0.5) is None
@@ -0,0 +1,49 @@
+import pytest
+from libs.common.rate_limiter import RateLimiterRegistry
+from libs.common.rate_limit_backends import SqliteRateLimitBackend, rate_limit_backend_from_env
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_sqlite_backend_shares_budget_between_instances(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / 'limits.db')
+    api_instance = SqliteRateLimitBackend(path, clock=clock)
+    lambda_instance = SqliteRateLimitBackend(path, clock=clock)
+
+    api_instance.update_limits('americas', [(3, 1), (5, 10)])
+    # limits learned by one instance apply to every instance
+    assert lambda_instance.limits('americas') == [(3, 1), (5, 10)]
+
+    assert api_instance.try_acquire(('americas',)) == 0
+    assert lambda_instance.try_acquire(('americas',)) == 0
+    assert api_instance.try_acquire(('americas',)) == 0
+    assert lambda_instance.try_acquire(('americas',)) == pytest.approx(1.0)
+
+    clock.now += 1
+    assert lambda_instance.try_acquire(('americas',)) == 0
+    assert api_instance.try_acquire(('americas',)) == 0
+    # 10s window is full now
+    assert api_instance.try_acquire(('americas',)) == pytest.approx(9.0)
+
+def test_sqlite_backend_sync_counts(tmp_path):
+    clock = FakeClock()
+    backend = SqliteRateLimitBackend(str(tmp_path / 'limits.db'), clock=clock)
+    backend.update_limits('na1', [(2, 1)])
+    backend.sync_counts('na1', [(2, 1)])
+    assert backend.try_acquire(('na1',)) == pytest.approx(1.0)
+
+def test_rate_limit_backend_from_env(monkeypatch, tmp_path):
+    monkeypatch.delenv('RATE_LIMIT_BACKEND', raising=False)
+    assert isinstance(rate_limit_backend_from_env(), RateLimiterRegistry)
+
+    monkeypatch.setenv('RATE_LIMIT_BACKEND', f'sqlite:{tmp_path / "limits.db"}')
+    assert isinstance(rate_limit_backend_from_env(), SqliteRateLimitBackend)
+
+    monkeypatch.setenv('RATE_LIMIT_BACKEND', 'redis')
+    with pytest.raises(ValueError):
+        rate_limit_backend_from_env()
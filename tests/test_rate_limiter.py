@@ -0,0 +1,102 @@
+from libs.common.rate_limiter import Priority, RateLimiter, RateLimiterRegistry
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, secs):
+        self.now += secs
+
+def test_no_limits_never_waits():
+    limiter = RateLimiter()
+    assert all(limiter.try_acquire() == 0 for _ in range(1000))
+
+def test_try_acquire_reserves_all_windows_or_nothing():
+    clock = FakeClock()
+    limiter = RateLimiter([(2, 1), (3, 10)], clock=clock, sleep=clock.sleep)
+
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == 0
+    # short window full
+    assert limiter.try_acquire() == 1.0
+    assert [len(w.timestamps) for w in limiter.windows] == [2, 2]
+
+    clock.now = 1.0
+    assert limiter.try_acquire() == 0
+    # long window full now, wait until the first request leaves the 10s window
+    clock.now = 2.0
+    assert limiter.try_acquire() == 8.0
+    assert [len(w.timestamps) for w in limiter.windows] == [0, 3]
+
+def test_acquire_rechecks_every_window_after_sleeping():
+    clock = FakeClock()
+    limiter = RateLimiter([(1, 1), (2, 5)], clock=clock, sleep=clock.sleep)
+
+    limiter.acquire()
+    limiter.acquire()  # waits 1s for the short window
+    assert clock.now == 1.0
+    limiter.acquire()  # waits for the long window
+    assert clock.now == 5.0
+
+def test_update_limits_keeps_history():
+    clock = FakeClock()
+    limiter = RateLimiter([(2, 1)], clock=clock, sleep=clock.sleep)
+    limiter.try_acquire()
+    limiter.try_acquire()
+
+    limiter.update_limits([(1, 1), (100, 120)])
+    assert limiter.limits == [(1, 1), (100, 120)]
+    assert limiter.try_acquire() == 1.0
+
+def test_sync_counts_only_adds_usage():
+    clock = FakeClock()
+    limiter = RateLimiter([(5, 1), (10, 120)], clock=clock, sleep=clock.sleep)
+    limiter.try_acquire()
+
+    # another instance already used 4 of the 5 per second
+    limiter.sync_counts([(4, 1), (1, 120)])
+    assert [len(w.timestamps) for w in limiter.windows] == [4, 1]
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == 1.0
+
+def test_registry_reserves_app_and_method_together():
+    clock = FakeClock()
+    registry = RateLimiterRegistry(clock=clock, sleep=clock.sleep)
+    registry.update_limits('americas', [(3, 1)])
+    registry.update_limits('americas/matches', [(1, 1)])
+    registry.update_limits('americas/accounts', [(5, 1)])
+
+    assert registry.try_acquire(('americas', 'americas/matches')) == 0
+    # method limit reached, app slot must not be consumed by the failed attempt
+    assert registry.try_acquire(('americas', 'americas/matches')) == 1.0
+    assert len(registry.get('americas').windows[0].timestamps) == 1
+
+    # a different method on the same host still runs at its own allowance
+    assert registry.try_acquire(('americas', 'americas/accounts')) == 0
+    assert registry.try_acquire(('americas', 'americas/accounts')) == 0
+    # until the shared app limit is hit
+    assert registry.try_acquire(('americas', 'americas/accounts')) == 1.0
+    # other hosts are independent
+    assert registry.try_acquire(('na1', 'na1/entries')) == 0
+
+def test_background_traffic_leaves_headroom_for_interactive():
+    clock = FakeClock()
+    registry = RateLimiterRegistry(clock=clock, sleep=clock.sleep, interactive_reserve=0.2)
+    registry.update_limits('americas', [(10, 1)])
+
+    # a backfill saturates its share of the window
+    granted = sum(registry.try_acquire(('americas',), Priority.BACKGROUND) == 0 for _ in range(20))
+    assert granted == 8
+    assert registry.try_acquire(('americas',), Priority.BACKGROUND) == 1.0
+
+    # interactive calls still go through immediately, up to the real limit
+    assert registry.try_acquire(('americas',), Priority.INTERACTIVE) == 0
+    assert registry.try_acquire(('americas',), Priority.INTERACTIVE) == 0
+    assert registry.try_acquire(('americas',), Priority.INTERACTIVE) == 1.0
+
+def test_background_always_gets_one_request():
+    limiter = RateLimiter([(1, 1)], interactive_reserve=0.5)
+    assert limiter.try_acquire(Priority.BACKGROUND) == 0
@@ -0,0 +1,61 @@
+import threading, time
+import pytest
+from libs.common.single_flight import SingleFlight, SingleFlightTimeout
+
+def test_concurrent_identical_calls_share_one_result():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return {'matchId': 'NA1_1'}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('url', fetch)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flight.do('url', fetch))) for _ in range(4)]
+    for t in followers:
+        t.start()
+    while flight.stats()['coalesced'] < 4:
+        time.sleep(0.001)
+    release.set()
+    for t in [leader, *followers]:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == [{'matchId': 'NA1_1'}] * 5
+    assert flight.stats() == {'calls': 1, 'coalesced': 4, 'in_flight': 0}
+
+def test_errors_are_shared_and_key_is_released():
+    flight = SingleFlight()
+    with pytest.raises(RuntimeError):
+        flight.do('url', lambda: (_ for _ in ()).throw(RuntimeError('riot down')))
+    assert flight.do('url', lambda: 42) == 42
+    assert flight.stats()['calls'] == 2
+
+def test_follower_gives_up_at_its_deadline():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fetch():
+        started.set()
+        release.wait()
+        return 42
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('url', fetch)))
+    leader.start()
+    started.wait()
+    with pytest.raises(SingleFlightTimeout):
+        flight.do('url', fetch, deadline=time.monotonic() + 0.05)
+    # the leader isn't affected
+    release.set()
+    leader.join()
+    assert results == [42]
+    assert flight.stats() == {'calls': 1, 'coalesced': 1, 'in_flight': 0}
@@ -0,0 +1,35 @@
+from libs.common.ttl_cache import MISS, TTLCache, TieredTTLCache, SqliteTTLStore
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_entries_expire_per_ttl():
+    clock = FakeClock()
+    cache = TTLCache(clock=clock)
+    cache.set('region', {'region': 'na1'}, ttl=60)
+    cache.set('rank', [], ttl=10)
+
+    clock.now += 30
+    assert cache.get('region') == {'region': 'na1'}
+    assert cache.get('rank') is MISS
+
+def test_negative_entries_are_hits():
+    cache = TTLCache()
+    cache.set('missing-player', None, ttl=60)
+    assert cache.get('missing-player') is None
+
+def test_persistent_tier_is_shared_and_promoted(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / 'riot_cache.db')
+    api = TieredTTLCache(TTLCache(clock=clock), SqliteTTLStore(path, clock=clock))
+    backfill = TieredTTLCache(TTLCache(clock=clock), SqliteTTLStore(path, clock=clock))
+
+    api.set('https://americas.api.riotgames.com/riot/account/v1/region/by-game/lol/by-puuid/abc', {'region': 'na1'}, ttl=3600)
+    assert backfill.get('https://americas.api.riotgames.com/riot/account/v1/region/by-game/lol/by-puuid/abc') == {'region': 'na1'}
+
+    clock.now += 3601
+    assert backfill.get('https://americas.api.riotgames.com/riot/account/v1/region/by-game/lol/by-puuid/abc') is MISS
@@ -0,0 +1,41 @@
+import json
+import pytest
+from libs.common.work_queue import InProcessWorkQueue, SqsWorkQueue
+
+def test_in_process_queue_is_fifo():
+    queue = InProcessWorkQueue()
+    queue.send([{'match_ids': [f'NA1_{i}']} for i in range(3)])
+    assert [item.body for item in queue.receive(2)] == [{'match_ids': ['NA1_0']}, {'match_ids': ['NA1_1']}]
+    assert len(queue) == 1
+    assert [item.body for item in queue.receive(10)] == [{'match_ids': ['NA1_2']}]
+    assert queue.receive() == []
+
+def test_in_process_queue_rejects_what_sqs_could_not_carry():
+    with pytest.raises(TypeError):
+        InProcessWorkQueue().send([{'match_ids': {'NA1_1'}}])
+
+class FakeSqs:
+    def __init__(self):
+        self.batches = []
+        self.deleted = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.batches.append([json.loads(entry['MessageBody']) for entry in Entries])
+        return {'Successful': Entries}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages, WaitTimeSeconds):
+        return {'Messages': [{'Body': json.dumps(body), 'ReceiptHandle': f'r{i}'} for i, body in enumerate(self.batches.pop(0)[:MaxNumberOfMessages])]}
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        self.deleted.append(ReceiptHandle)
+
+def test_sqs_queue_sends_in_batches_of_ten():
+    sqs = FakeSqs()
+    queue = SqsWorkQueue('https://sqs/queue', client=sqs)
+    queue.send([{'n': n} for n in range(23)])
+    assert [len(batch) for batch in sqs.batches] == [10, 10, 3]
+
+    items = queue.receive()
+    assert [item.body for item in items] == [{'n': n} for n in range(10)]
+    queue.ack(items[0])
+    assert sqs.deleted == ['r0']